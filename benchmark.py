@@ -0,0 +1,165 @@
+import argparse
+import contextlib
+import io
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import cleaner
+import detecter_remplacements_anticipes as detecteur
+import generer_donnees
+import qualite
+import stockage
+
+# Historique des mesures (une ligne JSON par étape et par taille), pour comparer les optimisations
+HISTORIQUE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks", "historique.jsonl")
+PIPELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pipeline.py")
+
+# Temps de démarrage visé pour les commandes légères de pipeline.py (--help, validate)
+OBJECTIF_DEMARRAGE_S = 0.1
+
+def _commit_courant():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        return None
+
+def _chronometrer(fonction, repetitions):
+    """Exécute fonction `repetitions` fois (sortie console masquée) ; retourne (meilleur temps, résultat)."""
+    meilleur, resultat = None, None
+    for _ in range(repetitions):
+        with contextlib.redirect_stdout(io.StringIO()):
+            start = time.perf_counter()
+            resultat = fonction()
+            duree = time.perf_counter() - start
+        meilleur = duree if meilleur is None else min(meilleur, duree)
+    return meilleur, resultat
+
+def benchmark_taille(nb_lignes, repetitions=1, seed=42):
+    """
+    Génère un jeu synthétique de nb_lignes téléphones dans un dossier temporaire, puis
+    chronomètre le contrôle qualité des exports, clean_dataset, le filtrage (fichier et en mémoire)
+    et detecter_remplacements_anticipes.
+    Retourne une liste de mesures {etape, lignes, duree_s, lignes_par_s}, plus l'empreinte
+    mémoire de telephones.csv avant / après schéma compact {etape, lignes, avant_mo, apres_mo}.
+    """
+    resultats = []
+    dossier_initial = os.getcwd()
+    with tempfile.TemporaryDirectory() as dossier:
+        os.chdir(dossier)  # clean_dataset lit exports/modeles_telephones.csv en relatif
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                generer_donnees.generer("exports", nb_lignes, seed=seed)
+
+            def mesure(etape, duree, lignes):
+                resultats.append({'etape': etape, 'lignes': lignes, 'duree_s': round(duree, 4),
+                                  'lignes_par_s': round(lignes / duree) if duree else None})
+
+            # Empreinte mémoire : inférence pandas vs schéma compact (toutes colonnes, puis détection)
+            with contextlib.redirect_stdout(io.StringIO()):
+                memoire = {
+                    'memoire_telephones': stockage.rapport_memoire("exports/telephones.csv", 'telephones'),
+                    'memoire_detection': stockage.rapport_memoire("exports/telephones.csv", 'telephones',
+                                                                  stockage.COLONNES_ETAPES['detection']),
+                }
+            for etape, rapport in memoire.items():
+                resultats.append({'etape': etape, 'lignes': nb_lignes, **rapport})
+
+            duree, (rapport, _) = _chronometrer(lambda: qualite.controler_exports("exports"), repetitions)
+            mesure('controle_qualite', duree, int(rapport.loc[rapport['table'] == 'telephones',
+                                                              'lignes_controlees'].max()))
+
+            duree, (cleaned_df, _) = _chronometrer(
+                lambda: cleaner.clean_dataset("exports/telephones.csv", "cleaned_telephones.csv",
+                                              "isolated_telephones.csv"), repetitions)
+            mesure('clean_dataset', duree, len(cleaned_df))
+
+            user_ids = cleaner.load_users("exports/utilisateurs.csv")
+            duree, _ = _chronometrer(
+                lambda: cleaner.filter_telephones("cleaned_telephones.csv", "cleaned_telephones_filtered.csv",
+                                                  user_ids), repetitions)
+            mesure('filter_telephones', duree, len(cleaned_df))
+            duree, _ = _chronometrer(lambda: cleaner.separer_dataframe(cleaned_df, user_ids), repetitions)
+            mesure('separer_dataframe', duree, len(cleaned_df))
+
+            df = detecteur.load_data("cleaned_telephones_filtered.csv")
+            user_map = detecteur.load_users("exports/utilisateurs.csv")
+            duree, _ = _chronometrer(lambda: detecteur.detecter_remplacements_anticipes(df, user_map),
+                                     repetitions)
+            mesure('detecter_remplacements_anticipes', duree, len(df))
+        finally:
+            os.chdir(dossier_initial)
+    return resultats
+
+def benchmark_demarrage(repetitions=5):
+    """
+    Chronomètre le lancement d'un nouvel interpréteur pour les commandes légères de pipeline.py
+    (--help, validate dans un dossier vide) et, pour comparaison, l'import des scripts d'étape.
+    Retourne une liste de mesures {etape, duree_s, objectif_s}.
+    """
+    commandes = {
+        'demarrage_help': [PIPELINE, '--help'],
+        'demarrage_validate': [PIPELINE, 'validate'],
+        'import_etapes': ['-c', 'import cleaner, transformer, detecter_remplacements_anticipes'],
+    }
+    resultats = []
+    with tempfile.TemporaryDirectory() as dossier:
+        env = {**os.environ, 'PYTHONPATH': os.path.dirname(PIPELINE)}
+        for etape, arguments in commandes.items():
+            meilleur = None
+            for _ in range(repetitions):
+                start = time.perf_counter()
+                subprocess.run([sys.executable, *arguments], cwd=dossier, env=env, capture_output=True)
+                duree = time.perf_counter() - start
+                meilleur = duree if meilleur is None else min(meilleur, duree)
+            resultats.append({'etape': etape, 'duree_s': round(meilleur, 4),
+                              'objectif_s': OBJECTIF_DEMARRAGE_S if etape.startswith('demarrage') else None})
+    return resultats
+
+def enregistrer_historique(resultats, path=HISTORIQUE):
+    """Ajoute les mesures à l'historique (JSON Lines) avec la date et le commit courant."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    contexte = {'date': datetime.now().isoformat(timespec='seconds'), 'commit': _commit_courant()}
+    with open(path, 'a', encoding='utf-8') as f:
+        for resultat in resultats:
+            f.write(json.dumps({**contexte, **resultat}, ensure_ascii=False) + '\n')
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark des étapes du pipeline sur données synthétiques.")
+    parser.add_argument('--lignes', type=int, nargs='+', default=[10000, 100000],
+                        help="Tailles à tester (nombre de téléphones)")
+    parser.add_argument('--repetitions', type=int, default=1, help="Répétitions par étape (meilleur temps retenu)")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sans-historique', action='store_true', help="Ne pas enregistrer dans l'historique")
+    args = parser.parse_args()
+
+    tous = []
+    for nb_lignes in args.lignes:
+        print(f"[BENCH] {nb_lignes} téléphones...")
+        resultats = benchmark_taille(nb_lignes, args.repetitions, args.seed)
+        for r in resultats:
+            if 'avant_mo' in r:
+                print(f"   - {r['etape']} : {r['avant_mo']} Mo → {r['apres_mo']} Mo")
+            else:
+                print(f"   - {r['etape']} : {r['duree_s']:.3f} s ({r['lignes_par_s']} lignes/s)")
+        tous.extend(resultats)
+
+    print("[BENCH] Démarrage des commandes...")
+    demarrage = benchmark_demarrage(max(args.repetitions, 5))
+    for r in demarrage:
+        depasse = r['objectif_s'] is not None and r['duree_s'] > r['objectif_s']
+        print(f"   - {r['etape']} : {r['duree_s']:.3f} s"
+              + (f" [ALERTE] objectif {r['objectif_s']} s dépassé" if depasse else ""))
+    tous.extend(demarrage)
+
+    if not args.sans_historique:
+        enregistrer_historique(tous)
+        print(f"[OK] Historique mis à jour : {HISTORIQUE}")
+
+if __name__ == "__main__":
+    main()
@@ -1,232 +1,414 @@
-import csv
-import os
-import pandas as pd
-import re
-from datetime import datetime
-
-# Fonctions de nettoyage
-
-def extract_date_from_string(text):
-    """
-    Extrait la première date d'une chaîne en utilisant des motifs courants.
-    Motifs : JJ/MM/AAAA, AAAA-MM-JJ, ou avec heure.
-    Retourne la date au format AAAA-MM-JJ ou None si non trouvée.
-    """
-    if not isinstance(text, str):
-        return None
-
-    # Regex pour JJ/MM/AAAA (optionnellement avec heure)
-    pattern1 = r'(\d{2}/\d{2}/\d{4})(?:\s+\d{2}:\d{2}:\d{2})?'
-    # Regex pour AAAA-MM-JJ (optionnellement avec heure)
-    pattern2 = r'(\d{4}-\d{2}-\d{2})(?:\s+\d{2}:\d{2}:\d{2})?'
-
-    match1 = re.search(pattern1, text)
-    match2 = re.search(pattern2, text)
-
-    if match1:
-        try:
-            dt = datetime.strptime(match1.group(1), '%d/%m/%Y')
-            return dt.strftime('%Y-%m-%d')
-        except ValueError:
-            return None
-    elif match2:
-        try:
-            dt = datetime.strptime(match2.group(1), '%Y-%m-%d')
-            return dt.strftime('%Y-%m-%d')
-        except ValueError:
-            return None
-    return None
-
-def clean_dataset(file_path, output_cleaned_path='cleaned_telephones.csv', output_isolated_path='isolated_telephones.csv'):
-    """
-    Nettoie le jeu de données :
-    - Supprime les doublons
-    - Remplit date_mod dans l'ordre :
-        1. date_creation
-        2. comment
-        3. contact
-        4. (dernier recours) modeles_telephones.csv via phonemodels_id → modele_id → date_modification
-    - Isole les lignes users_id == 0 et states_id == 2
-    - Sauvegarde les résultats
-    """
-    # Charger le jeu de données principal
-    try:
-        df = pd.read_csv(file_path, encoding='utf-8')
-    except FileNotFoundError:
-        print(f"[ERREUR] Fichier {file_path} introuvable.")
-        return None, None
-    except Exception as e:
-        print(f"[ERREUR] Erreur de chargement : {e}")
-        return None, None
-
-    # Supprimer les doublons
-    initial_rows = len(df)
-    df = df.drop_duplicates()
-    print(f"[SUPPRESSION] Supprimé {initial_rows - len(df)} doublons.")
-
-    # Identifier les lignes avec date_mod manquant ou vide
-    mask = df['date_mod'].isna() | (df['date_mod'] == '')
-    print(f"[DATE] {mask.sum()} valeurs de 'date_mod' à remplir...")
-
-    # Étape 1 : Remplir à partir de date_creation
-    filled_count = 0
-    for idx in df[mask].index:
-        extracted = extract_date_from_string(df.at[idx, 'date_creation'])
-        if extracted:
-            df.at[idx, 'date_mod'] = extracted + ' 00:00:00'
-            filled_count += 1
-    print(f"  {filled_count} lignes remplies via 'date_creation'.")
-    mask = df['date_mod'].isna() | (df['date_mod'] == '')
-
-    # Étape 2 : Remplir à partir de comment
-    filled_count = 0
-    for idx in df[mask].index:
-        extracted = extract_date_from_string(df.at[idx, 'comment'])
-        if extracted:
-            df.at[idx, 'date_mod'] = extracted + ' 00:00:00'
-            filled_count += 1
-    print(f"  {filled_count} lignes remplies via 'comment'.")
-    mask = df['date_mod'].isna() | (df['date_mod'] == '')
-
-    # Étape 3 : Remplir à partir de contact
-    filled_count = 0
-    for idx in df[mask].index:
-        extracted = extract_date_from_string(df.at[idx, 'contact'])
-        if extracted:
-            df.at[idx, 'date_mod'] = extracted + ' 00:00:00'
-            filled_count += 1
-    print(f"  {filled_count} lignes remplies via 'contact'.")
-    mask = df['date_mod'].isna() | (df['date_mod'] == '')
-
-    # Étape 4 (dernier recours) : Remplir à partir de modeles_telephones.csv
-    try:
-        modeles_df = pd.read_csv('exports/modeles_telephones.csv', encoding='utf-8')
-        if 'modele_id' in modeles_df.columns and 'date_modification' in modeles_df.columns:
-            # Préparer le mapping
-            modeles_df['modele_id'] = pd.to_numeric(modeles_df['modele_id'], errors='coerce').astype('Int64')
-            modeles_dict = modeles_df.set_index('modele_id')['date_modification'].to_dict()
-
-            # S'assurer que phonemodels_id est du bon type
-            if 'phonemodels_id' in df.columns:
-                df['phonemodels_id'] = pd.to_numeric(df['phonemodels_id'], errors='coerce').astype('Int64')
-
-                # Remplir les restants via mapping
-                before_fill = mask.sum()
-                df.loc[mask, 'date_mod'] = df.loc[mask, 'phonemodels_id'].map(modeles_dict)
-                after_fill = (df['date_mod'].isna() | (df['date_mod'] == '')).sum()
-                filled_count = before_fill - after_fill
-                print(f"  {filled_count} lignes remplies via 'modeles_telephones.csv' (dernier recours).")
-        else:
-            print("[ERREUR] Colonnes 'modele_id' ou 'date_modification' manquantes dans modeles_telephones.csv")
-    except FileNotFoundError:
-        print("[ALERTE] Fichier exports/modeles_telephones.csv non trouvé — étape ignorée.")
-    except Exception as e:
-        print(f"[ERREUR] Erreur lors du chargement de modeles_telephones.csv : {e}")
-
-    # Isoler les lignes avec users_id == 0 et states_id == 2
-    isolated_df = df[(df['users_id'] == 0) & (df['states_id'] == 2)]
-    print(f"[ISOLE] Isolé {len(isolated_df)} lignes avec users_id == 0 et states_id == 2.")
-
-    # Sauvegarder
-    try:
-        df.to_csv(output_cleaned_path, index=False, encoding='utf-8')
-        print(f"[OK] Jeu de données nettoyé sauvegardé : {output_cleaned_path}")
-    except Exception as e:
-        print(f"[ERREUR] Erreur lors de la sauvegarde cleaned : {e}")
-
-    try:
-        isolated_df.to_csv(output_isolated_path, index=False, encoding='utf-8')
-        print(f"[OK] Jeu de données isolé sauvegardé : {output_isolated_path}")
-    except Exception as e:
-        print(f"[ERREUR] Erreur lors de la sauvegarde isolated : {e}")
-
-    return df, isolated_df
-
-# Fonctions de filtrage
-
-def load_users(file_path):
-    """Charge les utilisateur_id depuis le fichier utilisateurs.csv."""
-    user_ids = set()
-    try:
-        with open(file_path, mode='r', encoding='utf-8') as file:
-            reader = csv.DictReader(file)
-            for row in reader:
-                user_ids.add(row['utilisateur_id'])
-    except FileNotFoundError:
-        print(f"[ERREUR] Le fichier {file_path} n'a pas été trouvé.")
-        return None
-    except Exception as e:
-        print(f"[ERREUR] Erreur lors de la lecture de {file_path} : {e}")
-        return None
-    return user_ids
-
-def filter_telephones(input_telephones_path, output_telephones_path, user_ids):
-    """Supprime les lignes de cleaned_telephones.csv où users_id n'est pas dans user_ids."""
-    try:
-        with open(input_telephones_path, mode='r', encoding='utf-8') as infile:
-            reader = csv.DictReader(infile)
-            fieldnames = reader.fieldnames
-            filtered_rows = []
-
-            for row in reader:
-                # Vérifie si users_id est dans user_ids (et non vide)
-                user_id = row.get('users_id', '').strip()
-                if user_id and user_id in user_ids:
-                    filtered_rows.append(row)
-
-        # Écrit les lignes filtrées dans un nouveau fichier
-        with open(output_telephones_path, mode='w', encoding='utf-8', newline='') as outfile:
-            writer = csv.DictWriter(outfile, fieldnames=fieldnames)
-            writer.writeheader()
-            writer.writerows(filtered_rows)
-
-        print(f"[OK] Fichier filtré créé avec succès : {output_telephones_path}")
-        print(f"[INFO] Nombre de lignes conservées : {len(filtered_rows)}")
-
-    except FileNotFoundError:
-        print(f"[ERREUR] Le fichier {input_telephones_path} n'a pas été trouvé.")
-    except Exception as e:
-        print(f"[ERREUR] Erreur lors du traitement de {input_telephones_path} : {e}")
-
-# Fonction principale
-
-def main():
-    # Chemins des fichiers
-    input_telephones_path = "exports/telephones.csv"
-    cleaned_telephones_path = "cleaned_telephones.csv"
-    filtered_telephones_path = "cleaned_telephones_filtered.csv"
-    utilisateurs_path = "exports/utilisateurs.csv"
-
-    # Étape 1 : Nettoyage du jeu de données
-    print("ETAPE 1 : NETTOYAGE DU JEU DE DONNEES")
-    cleaned_df, isolated_df = clean_dataset(input_telephones_path, cleaned_telephones_path, 'isolated_telephones.csv')
-    if cleaned_df is None:
-        print("[ERREUR] Échec du nettoyage. Arrêt du script.")
-        return
-
-    # Étape 2 : Vérification des fichiers nécessaires
-    print("ETAPE 2 : FILTRAGE PAR UTILISATEURS VALIDES")
-    if not os.path.exists(utilisateurs_path):
-        print(f"[ERREUR] Le fichier {utilisateurs_path} n'existe pas.")
-        return
-
-    if not os.path.exists(cleaned_telephones_path):
-        print(f"[ERREUR] Le fichier {cleaned_telephones_path} n'existe pas (nettoyage échoué ?).")
-        return
-
-    # Étape 3 : Charger les utilisateur_id valides
-    user_ids = load_users(utilisateurs_path)
-    if user_ids is None:
-        print("[ERREUR] Impossible de charger les utilisateur_id.")
-        return
-
-    # Étape 4 : Filtrer cleaned_telephones.csv
-    filter_telephones(cleaned_telephones_path, filtered_telephones_path, user_ids)
-
-    print("TRAITEMENT TERMINE :")
-    print(f"   - Fichier nettoyé : {cleaned_telephones_path}")
-    print(f"   - Fichier filtré : {filtered_telephones_path}")
-    print(f"   - Fichier isolé : isolated_telephones.csv")
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+import os
+import numpy as np
+import pandas as pd
+import sys
+import time
+import metriques
+from extraction_dates import extract_date_from_string, extract_dates_from_series  # noqa: F401
+import stockage
+import index_references
+import dedoublonnage
+import sorties
+
+# Sources de date_mod, par ordre de priorité
+DATE_SOURCES = ['date_creation', 'comment', 'contact']
+
+# Motifs de rejet du filtrage (colonne motif_rejet de rejected_telephones.csv)
+MOTIF_USERS_ID_VIDE = "users_id manquant"
+MOTIF_USERS_ID_INVALIDE = "users_id non entier"
+MOTIF_NON_ATTRIBUE = "téléphone non attribué (users_id = 0)"
+MOTIF_UTILISATEUR_INCONNU = "utilisateur absent de utilisateurs.csv"
+
+# Fonctions de nettoyage
+
+def load_modeles_dates(file_path='exports/modeles_telephones.csv'):
+    """
+    Charge le mapping modele_id → date_modification depuis l'index de référence
+    (construit à partir de modeles_telephones.csv, voir index_references).
+    Retourne None si le fichier est absent ou inexploitable.
+    """
+    try:
+        modeles = index_references.charger_index(os.path.dirname(file_path) or '.')['modeles']
+        if modeles is not None:
+            # Clés entières ; une date vide reste '' et est traitée comme manquante
+            return modeles.to_dict()
+        if sorties.existe(file_path):
+            print("[ERREUR] Colonnes 'modele_id' ou 'date_modification' manquantes dans modeles_telephones.csv")
+        else:
+            print("[ALERTE] Fichier exports/modeles_telephones.csv non trouvé — étape ignorée.")
+    except Exception as e:
+        print(f"[ERREUR] Erreur lors du chargement de modeles_telephones.csv : {e}")
+    return None
+
+def fill_date_mod(df, modeles_dict, verbose=True):
+    """
+    Remplit date_mod (en place) dans l'ordre date_creation → comment → contact →
+    modeles_telephones (dernier recours, si modeles_dict est fourni).
+    Avec verbose, chaque étape est affichée et mesurée (voir metriques).
+    Retourne un dictionnaire {source: nombre de lignes remplies}.
+    """
+    counts = {}
+
+    # Identifier les lignes avec date_mod manquant ou vide
+    mask = df['date_mod'].isna() | (df['date_mod'] == '')
+    if verbose:
+        print(f"[DATE] {mask.sum()} valeurs de 'date_mod' à remplir...")
+
+    # Étapes 1 à 3 : Remplir à partir de date_creation, puis comment, puis contact
+    for source in DATE_SOURCES:
+        with metriques.mesurer_si(verbose, f"date_mod_{source}", lignes_entree=mask.sum()) as mesure:
+            extracted = extract_dates_from_series(df.loc[mask, source])
+            extracted = extracted.dropna()
+            df.loc[extracted.index, 'date_mod'] = extracted + ' 00:00:00'
+            mesure['lignes_sortie'] = len(extracted)
+        counts[source] = len(extracted)
+        if verbose:
+            print(f"  {len(extracted)} lignes remplies via '{source}'.")
+        mask = df['date_mod'].isna() | (df['date_mod'] == '')
+
+    # Étape 4 (dernier recours) : Remplir à partir de modeles_telephones.csv
+    if modeles_dict is not None and 'phonemodels_id' in df.columns:
+        with metriques.mesurer_si(verbose, "date_mod_modeles", lignes_entree=mask.sum()) as mesure:
+            # S'assurer que phonemodels_id est du bon type
+            df['phonemodels_id'] = pd.to_numeric(df['phonemodels_id'], errors='coerce').astype('Int64')
+
+            # Remplir les restants via mapping
+            before_fill = mask.sum()
+            df.loc[mask, 'date_mod'] = df.loc[mask, 'phonemodels_id'].map(modeles_dict)
+            after_fill = (df['date_mod'].isna() | (df['date_mod'] == '')).sum()
+            mesure['lignes_sortie'] = before_fill - after_fill
+        counts['modeles_telephones.csv'] = before_fill - after_fill
+        if verbose:
+            print(f"  {before_fill - after_fill} lignes remplies via 'modeles_telephones.csv' (dernier recours).")
+
+    return counts
+
+def clean_dataset(file_path, output_cleaned_path='cleaned_telephones.csv', output_isolated_path='isolated_telephones.csv'):
+    """
+    Nettoie le jeu de données :
+    - Supprime les doublons selon les règles de dedoublonnage.REGLES_DOUBLONS
+    - Remplit date_mod dans l'ordre :
+        1. date_creation
+        2. comment
+        3. contact
+        4. (dernier recours) modeles_telephones.csv via phonemodels_id → modele_id → date_modification
+    - Isole les lignes users_id == 0 et states_id == 2
+    - Sauvegarde les résultats
+    """
+    # Charger le jeu de données principal (copie typée si un format intermédiaire est configuré)
+    fmt = stockage.format_intermediaire()
+    if fmt != 'csv' and not sorties.existe(stockage.chemin_intermediaire(file_path, fmt)):
+        fmt = 'csv'
+    try:
+        with metriques.mesurer("chargement") as mesure:
+            # Schéma compact : identifiants réduits, états en category, chaînes pyarrow
+            df = stockage.lire_table(file_path, fmt, table='telephones')
+            mesure['lignes_sortie'] = len(df)
+            mesure['memoire_mo'] = stockage.empreinte_mo(df)
+    except FileNotFoundError:
+        print(f"[ERREUR] Fichier {file_path} introuvable.")
+        return None, None
+    except Exception as e:
+        print(f"[ERREUR] Erreur de chargement : {e}")
+        return None, None
+    print(f"[MEMOIRE] {len(df)} lignes chargées : {mesure['memoire_mo']} Mo en mémoire")
+
+    # Supprimer les doublons (une sous-mesure doublons/<règle> par règle appliquée)
+    with metriques.mesurer("doublons", lignes_entree=len(df)) as mesure:
+        df, comptes = dedoublonnage.dedoublonner(df)
+        mesure['lignes_sortie'] = len(df)
+    dedoublonnage.afficher_comptes(comptes)
+
+    fill_date_mod(df, load_modeles_dates())
+
+    # Isoler les lignes avec users_id == 0 et states_id == 2
+    with metriques.mesurer("isolement", lignes_entree=len(df)) as mesure:
+        isolated_df = df[((df['users_id'] == 0) & (df['states_id'] == 2)).fillna(False)]
+        mesure['lignes_sortie'] = len(isolated_df)
+    print(f"[ISOLE] Isolé {len(isolated_df)} lignes avec users_id == 0 et states_id == 2.")
+
+    # Sauvegarder
+    try:
+        sorties.ecrire_csv(df, output_cleaned_path)
+        print(f"[OK] Jeu de données nettoyé sauvegardé : {output_cleaned_path}")
+    except Exception as e:
+        print(f"[ERREUR] Erreur lors de la sauvegarde cleaned : {e}")
+
+    try:
+        sorties.ecrire_csv(isolated_df, output_isolated_path)
+        print(f"[OK] Jeu de données isolé sauvegardé : {output_isolated_path}")
+    except Exception as e:
+        print(f"[ERREUR] Erreur lors de la sauvegarde isolated : {e}")
+
+    return df, isolated_df
+
+# Fonctions de filtrage
+
+def load_users(file_path):
+    """
+    Charge les utilisateur_id depuis l'index de référence (construit à partir de utilisateurs.csv).
+    Retourne une index_references.Table : `id in table` et table.contient(colonne) comparent des entiers.
+    """
+    if not sorties.existe(file_path):
+        print(f"[ERREUR] Le fichier {file_path} n'a pas été trouvé.")
+        return None
+    try:
+        user_ids = index_references.charger_index(os.path.dirname(file_path) or '.')['utilisateurs']
+    except Exception as e:
+        print(f"[ERREUR] Erreur lors de la lecture de {file_path} : {e}")
+        return None
+    if user_ids is None:
+        print(f"[ERREUR] Colonne 'utilisateur_id' manquante dans {file_path}")
+    return user_ids
+
+def motifs_rejet(users_id, user_ids):
+    """
+    Semi-jointure vectorisée sur les users_id entiers : motif de rejet de chaque ligne
+    (MOTIF_*), None pour les lignes dont l'utilisateur existe dans user_ids.
+    """
+    users_id = pd.Series(users_id).reset_index(drop=True)
+    valeurs = index_references.numeriser(users_id)
+    vides = users_id.isna().to_numpy()
+    if not pd.api.types.is_numeric_dtype(users_id):
+        vides = vides | (users_id.astype(str).str.strip() == '').to_numpy()
+    entiers = (valeurs % 1 == 0).fillna(False).to_numpy(dtype=bool)
+    zeros = (valeurs == 0).fillna(False).to_numpy(dtype=bool)
+
+    # Du motif le moins prioritaire au plus prioritaire
+    motifs = np.full(len(users_id), MOTIF_UTILISATEUR_INCONNU, dtype=object)
+    motifs[zeros] = MOTIF_NON_ATTRIBUE
+    motifs[~entiers] = MOTIF_USERS_ID_INVALIDE
+    motifs[vides] = MOTIF_USERS_ID_VIDE
+    motifs[user_ids.contient(valeurs)] = None
+    return motifs
+
+def _rejets(df, motifs):
+    rejete = ~pd.isna(motifs)
+    rejected_df = df[rejete].copy()
+    rejected_df['motif_rejet'] = motifs[rejete]
+    return rejected_df
+
+def filter_telephones(input_telephones_path, output_telephones_path, user_ids,
+                      output_rejected_path='rejected_telephones.csv', chunksize=None):
+    """
+    Supprime les lignes de cleaned_telephones.csv où users_id n'est pas dans user_ids
+    (version fichier de separer_dataframe, pour un nettoyage fait dans un autre run).
+    Le fichier est lu par blocs, en texte brut (valeurs recopiées telles quelles), et chaque
+    bloc est filtré par semi-jointure vectorisée ; les lignes écartées sont écrites dans
+    output_rejected_path avec leur motif.
+    """
+    chunksize = chunksize or CHUNKSIZE
+    try:
+        with metriques.mesurer("filtrage_csv") as mesure, \
+                sorties.FichierSortie(output_telephones_path) as sortie, \
+                sorties.FichierSortie(output_rejected_path) as rejets:
+            path = sorties.resoudre(input_telephones_path)
+            entete = pd.read_csv(path, dtype=str, nrows=0, encoding='utf-8')
+            reader = pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunksize, encoding='utf-8')
+            lignes = 0
+            for i, chunk in enumerate(reader):
+                users_id = chunk['users_id'] if 'users_id' in chunk.columns else pd.Series('', index=chunk.index)
+                motifs = motifs_rejet(users_id, user_ids)
+                garde = pd.isna(motifs)
+                # Fins de ligne \r\n, comme le csv.DictWriter utilisé jusqu'ici
+                chunk[garde].to_csv(sortie.fichier, index=False, header=(i == 0), lineterminator='\r\n')
+                _rejets(chunk, motifs).to_csv(rejets.fichier, index=False, header=(i == 0))
+                lignes += len(chunk)
+                sortie.lignes += int(garde.sum())
+                rejets.lignes += int((~garde).sum())
+            if lignes == 0:
+                entete.to_csv(sortie.fichier, index=False, lineterminator='\r\n')
+                entete.assign(motif_rejet=[]).to_csv(rejets.fichier, index=False)
+            sortie.colonnes = {col: 'str' for col in entete.columns}
+            rejets.colonnes = dict(sortie.colonnes, motif_rejet='str')
+            mesure['lignes_entree'] = lignes
+            mesure['lignes_sortie'] = sortie.lignes
+
+        print(f"[OK] Fichier filtré créé avec succès : {output_telephones_path}")
+        print(f"[INFO] Nombre de lignes conservées : {sortie.lignes}")
+        print(f"[INFO] {rejets.lignes} lignes rejetées (motifs dans {output_rejected_path})")
+
+    except FileNotFoundError:
+        print(f"[ERREUR] Le fichier {input_telephones_path} n'a pas été trouvé.")
+    except Exception as e:
+        print(f"[ERREUR] Erreur lors du traitement de {input_telephones_path} : {e}")
+
+def separer_dataframe(cleaned_df, user_ids):
+    """
+    Version en mémoire de filter_telephones, sur le DataFrame typé produit par clean_dataset.
+    Retourne (lignes conservées, lignes rejetées avec leur motif_rejet).
+    """
+    with metriques.mesurer("filtrage", lignes_entree=len(cleaned_df)) as mesure:
+        motifs = motifs_rejet(cleaned_df['users_id'], user_ids)
+        filtered_df = cleaned_df[pd.isna(motifs)]
+        mesure['lignes_sortie'] = len(filtered_df)
+    return filtered_df, _rejets(cleaned_df, motifs)
+
+def filter_dataframe(cleaned_df, user_ids):
+    """Lignes de cleaned_df dont l'utilisateur existe (voir separer_dataframe)."""
+    return separer_dataframe(cleaned_df, user_ids)[0]
+
+def ecrire_filtrage(filtered_df, rejected_df, output_filtered_path='cleaned_telephones_filtered.csv',
+                    output_rejected_path='rejected_telephones.csv'):
+    """Écrit le fichier filtré (fins de ligne de filter_telephones) et les lignes rejetées."""
+    sorties.ecrire_csv(filtered_df, output_filtered_path, lineterminator='\r\n')
+    sorties.ecrire_csv(rejected_df, output_rejected_path)
+    print(f"[OK] Fichier filtré créé avec succès : {output_filtered_path}")
+    print(f"[INFO] Nombre de lignes conservées : {len(filtered_df)}")
+    print(f"[INFO] {len(rejected_df)} lignes rejetées (motifs dans {output_rejected_path})")
+
+# Mode streaming (mémoire bornée)
+
+CHUNKSIZE = 100_000
+
+def clean_and_filter_streaming(file_path, user_ids, output_cleaned_path='cleaned_telephones.csv',
+                               output_isolated_path='isolated_telephones.csv',
+                               output_filtered_path='cleaned_telephones_filtered.csv',
+                               chunksize=CHUNKSIZE, externe=False, output_rejected_path='rejected_telephones.csv'):
+    """
+    Nettoie et filtre telephones.csv en une seule passe, par blocs de `chunksize` lignes :
+    - Supprime les doublons, y compris entre blocs (via un hash 64 bits de la clé de chaque
+      règle : seuls les hashs déjà vus sont conservés en mémoire, jamais les lignes ; avec
+      externe=True, les hashs sont triés sur disque en une passe préalable, mémoire bornée)
+    - Remplit date_mod (mêmes étapes que clean_dataset)
+    - Isole les lignes users_id == 0 et states_id == 2
+    - Ne garde dans le fichier filtré que les users_id présents dans user_ids
+      (les autres lignes vont dans output_rejected_path avec leur motif)
+    Les quatre fichiers de sortie sont écrits au fil de l'eau.
+    Les colonnes sont lues comme texte, ce qui rend les hashs indépendants du bloc
+    et conserve les valeurs telles qu'exportées.
+    Retourne un dictionnaire de statistiques, ou None en cas d'erreur.
+    """
+    with metriques.mesurer("nettoyage_streaming") as mesure:
+        stats = _clean_and_filter_chunks(file_path, user_ids, output_cleaned_path, output_isolated_path,
+                                         output_filtered_path, chunksize, externe, output_rejected_path)
+        if stats is not None:
+            mesure['lignes_entree'] = stats['lignes_lues']
+            mesure['lignes_sortie'] = stats['filtrees']
+    return stats
+
+def _clean_and_filter_chunks(file_path, user_ids, output_cleaned_path, output_isolated_path,
+                             output_filtered_path, chunksize, externe, output_rejected_path):
+    modeles_dict = load_modeles_dates()
+    stats = {'lignes_lues': 0, 'doublons': 0, 'nettoyees': 0, 'isolees': 0, 'filtrees': 0, 'rejetees': 0}
+    dedoublonneur = dedoublonnage.DedoublonneurFlux()
+    try:
+        if externe:
+            with metriques.mesurer("doublons_externes"):
+                doublons, comptes = dedoublonnage.doublons_externes(sorties.resoudre(file_path),
+                                                                    dedoublonneur.regles, chunksize)
+        reader = pd.read_csv(sorties.resoudre(file_path), encoding='utf-8', dtype=str, chunksize=chunksize)
+        with sorties.FichierSortie(output_cleaned_path) as cleaned, \
+                sorties.FichierSortie(output_isolated_path) as isolated_sortie, \
+                sorties.FichierSortie(output_filtered_path) as filtered_sortie, \
+                sorties.FichierSortie(output_rejected_path) as rejected_sortie:
+            for i, chunk in enumerate(reader):
+                stats['lignes_lues'] += len(chunk)
+
+                # Supprimer les doublons (dans le bloc et avec les blocs précédents)
+                if externe:
+                    debut = stats['lignes_lues'] - len(chunk)
+                    chunk = chunk[~doublons[debut:debut + len(chunk)]].copy()
+                else:
+                    chunk = dedoublonneur.filtrer(chunk).copy()
+
+                fill_date_mod(chunk, modeles_dict, verbose=False)
+
+                users_id = pd.to_numeric(chunk['users_id'], errors='coerce')
+                states_id = pd.to_numeric(chunk['states_id'], errors='coerce')
+                isolated = chunk[(users_id == 0) & (states_id == 2)]
+                motifs = motifs_rejet(chunk['users_id'], user_ids)
+                filtered = chunk[pd.isna(motifs)]
+                rejected = _rejets(chunk, motifs)
+
+                # Fichier filtré en fins de ligne CRLF, comme en mode fichier et en mode DataFrame
+                for sortie, bloc, fin in ((cleaned, chunk, '\n'), (isolated_sortie, isolated, '\n'),
+                                          (filtered_sortie, filtered, '\r\n'), (rejected_sortie, rejected, '\n')):
+                    bloc.to_csv(sortie.fichier, index=False, header=(i == 0), lineterminator=fin)
+                    sortie.lignes += len(bloc)
+                    sortie.decrire(bloc)
+                stats['nettoyees'] += len(chunk)
+                stats['isolees'] += len(isolated)
+                stats['filtrees'] += len(filtered)
+                stats['rejetees'] += len(rejected)
+    except FileNotFoundError:
+        print(f"[ERREUR] Fichier {file_path} introuvable.")
+        return None
+    except Exception as e:
+        print(f"[ERREUR] Erreur lors du traitement en streaming de {file_path} : {e}")
+        return None
+
+    if not externe:
+        comptes = dedoublonneur.comptes
+    stats['doublons'] = sum(comptes.values())
+    stats['doublons_par_regle'] = comptes
+    dedoublonnage.afficher_comptes(comptes)
+    print(f"[ISOLE] Isolé {stats['isolees']} lignes avec users_id == 0 et states_id == 2.")
+    print(f"[OK] Fichiers écrits : {output_cleaned_path}, {output_isolated_path}, {output_filtered_path}, "
+          f"{output_rejected_path}")
+    print(f"[INFO] Nombre de lignes conservées : {stats['filtrees']}")
+    print(f"[INFO] {stats['rejetees']} lignes rejetées (motifs dans {output_rejected_path})")
+    return stats
+
+# Fonction principale
+
+def main(streaming=False, externe=False):
+    # Chemins des fichiers
+    input_telephones_path = "exports/telephones.csv"
+    cleaned_telephones_path = "cleaned_telephones.csv"
+    filtered_telephones_path = "cleaned_telephones_filtered.csv"
+    utilisateurs_path = "exports/utilisateurs.csv"
+
+    if streaming:
+        print("NETTOYAGE ET FILTRAGE EN STREAMING")
+        user_ids = load_users(utilisateurs_path)
+        if user_ids is None:
+            print("[ERREUR] Impossible de charger les utilisateur_id.")
+            return
+        clean_and_filter_streaming(input_telephones_path, user_ids, cleaned_telephones_path,
+                                   'isolated_telephones.csv', filtered_telephones_path, externe=externe)
+        return
+
+    # Étape 1 : Nettoyage du jeu de données
+    print("ETAPE 1 : NETTOYAGE DU JEU DE DONNEES")
+    cleaned_df, isolated_df = clean_dataset(input_telephones_path, cleaned_telephones_path, 'isolated_telephones.csv')
+    if cleaned_df is None:
+        print("[ERREUR] Échec du nettoyage. Arrêt du script.")
+        return
+
+    # Étape 2 : Vérification des fichiers nécessaires
+    print("ETAPE 2 : FILTRAGE PAR UTILISATEURS VALIDES")
+    if not sorties.existe(utilisateurs_path):
+        print(f"[ERREUR] Le fichier {utilisateurs_path} n'existe pas.")
+        return
+
+    if not sorties.existe(cleaned_telephones_path):
+        print(f"[ERREUR] Le fichier {cleaned_telephones_path} n'existe pas (nettoyage échoué ?).")
+        return
+
+    # Étape 3 : Charger les utilisateur_id valides
+    user_ids = load_users(utilisateurs_path)
+    if user_ids is None:
+        print("[ERREUR] Impossible de charger les utilisateur_id.")
+        return
+
+    # Étape 4 : Filtrer le DataFrame nettoyé (semi-jointure sur les users_id entiers, sans relire le CSV)
+    filtered_df, rejected_df = separer_dataframe(cleaned_df, user_ids)
+    start = time.perf_counter()
+    ecrire_filtrage(filtered_df, rejected_df, filtered_telephones_path)
+    csv_duree = time.perf_counter() - start
+
+    # Copie typée du fichier filtré pour la détection
+    fmt = stockage.format_intermediaire()
+    if fmt != 'csv':
+        rapport = stockage.ecrire_table(filtered_df, filtered_telephones_path, fmt, date_columns=['date_mod'])
+        stockage.rapport_format(rapport, filtered_telephones_path, csv_duree)
+
+    print("TRAITEMENT TERMINE :")
+    print(f"   - Fichier nettoyé : {cleaned_telephones_path}")
+    print(f"   - Fichier filtré : {filtered_telephones_path}")
+    print(f"   - Fichier isolé : isolated_telephones.csv")
+    print(f"   - Fichier des lignes rejetées : rejected_telephones.csv")
+
+if __name__ == "__main__":
+    main(streaming='--streaming' in sys.argv or '--externe' in sys.argv, externe='--externe' in sys.argv)
\ No newline at end of file
@@ -0,0 +1,261 @@
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+import metriques
+
+# Règles de dédoublonnage, appliquées dans l'ordre (chacune sur les lignes conservées par les
+# précédentes). La première occurrence d'une clé est gardée.
+#   colonnes       : colonnes de la clé (None : toutes les colonnes de la table)
+#   exclure        : colonnes retirées de la clé quand colonnes vaut None
+#   normaliser     : clé comparée après normalisation (espaces, casse, 5.0 → 5)
+#   ignorer_vides  : une ligne dont une colonne de la clé est vide n'est jamais un doublon
+#   actif          : règle appliquée par défaut
+# La variable d'environnement PIPELINE_DOUBLONS (noms séparés par des virgules) remplace
+# la sélection par défaut, ex. PIPELINE_DOUBLONS=ligne_identique,serial_utilisateur
+REGLES_DOUBLONS = [
+    {'nom': 'ligne_identique', 'colonnes': None, 'exclure': [], 'normaliser': False,
+     'ignorer_vides': False, 'actif': True},
+    # Même ligne à des espaces, une casse ou une date_mod près (double saisie, ré-import)
+    {'nom': 'ligne_normalisee', 'colonnes': None, 'exclure': ['date_mod'], 'normaliser': True,
+     'ignorer_vides': False, 'actif': False},
+    # Clé métier : un même appareil (numéro de série / IMEI) attribué au même utilisateur
+    {'nom': 'serial_utilisateur', 'colonnes': ['serial', 'users_id'], 'exclure': [], 'normaliser': True,
+     'ignorer_vides': True, 'actif': False},
+]
+
+# Mode externe : nombre de fichiers de hachage sur disque (mémoire bornée ≈ taille d'un seau)
+NB_SEAUX = 64
+
+def regles_actives(regles=None):
+    """Règles à appliquer : sélection de PIPELINE_DOUBLONS si définie, sinon les règles actives."""
+    regles = REGLES_DOUBLONS if regles is None else regles
+    selection = os.environ.get('PIPELINE_DOUBLONS')
+    if not selection:
+        return [regle for regle in regles if regle['actif']]
+    noms = [nom.strip() for nom in selection.split(',') if nom.strip()]
+    connues = {regle['nom']: regle for regle in regles}
+    for nom in noms:
+        if nom not in connues:
+            print(f"[ALERTE] Règle de doublons inconnue '{nom}' — ignorée.")
+    return [connues[nom] for nom in noms if nom in connues]
+
+def colonnes_cle(regle, colonnes, ignorees=()):
+    """Colonnes de la clé de regle parmi colonnes (None si une colonne de la clé manque)."""
+    if regle['colonnes'] is None:
+        return [c for c in colonnes if c not in regle['exclure'] and c not in ignorees]
+    if not set(regle['colonnes']) <= set(colonnes):
+        return None
+    return list(regle['colonnes'])
+
+def partitionnable(regles, colonne):
+    """Vrai si chaque règle inclut colonne dans sa clé : les doublons restent alors dans la même partition."""
+    return all(regle['colonnes'] is None and colonne not in regle['exclure']
+               or regle['colonnes'] is not None and colonne in regle['colonnes'] for regle in regles)
+
+def normaliser(serie):
+    """Forme canonique d'une colonne de clé : texte sans espaces superflus, en minuscules ; 5.0 → 5."""
+    if pd.api.types.is_float_dtype(serie) and (serie.dropna() % 1 == 0).all():
+        serie = serie.astype('Int64')
+    texte = serie.astype('string')
+    if not pd.api.types.is_numeric_dtype(serie):
+        texte = texte.str.strip().str.lower().str.replace(r'\s+', ' ', regex=True)
+    return texte.mask(texte == '')
+
+def _cles(df, regle, colonnes):
+    """DataFrame des clés de regle et masque des lignes éligibles (clé complète si ignorer_vides)."""
+    cles = df[colonnes]
+    if regle['normaliser']:
+        cles = pd.DataFrame({col: normaliser(cles[col]) for col in colonnes}, index=df.index)
+    eligibles = cles.notna().all(axis=1).to_numpy() if regle['ignorer_vides'] else np.ones(len(df), dtype=bool)
+    return cles, eligibles
+
+def hacher(cles):
+    """Hash 64 bits par ligne de la clé."""
+    return pd.util.hash_pandas_object(cles, index=False).to_numpy()
+
+def doublons(df, regle, ignorees=()):
+    """
+    Masque des doublons de df selon regle (première occurrence conservée). Le hash 64 bits
+    des clés sert de filtre ; les seules lignes dont le hash se répète sont comparées
+    exactement, d'où un résultat identique à DataFrame.duplicated sur la clé.
+    Retourne None si une colonne de la clé est absente.
+    """
+    colonnes = colonnes_cle(regle, df.columns, ignorees)
+    if colonnes is None:
+        return None
+    cles, eligibles = _cles(df, regle, colonnes)
+    masque = np.zeros(len(df), dtype=bool)
+    hashes = pd.Series(hacher(cles))[eligibles]
+    candidats = hashes.index[hashes.duplicated(keep=False)].to_numpy()
+    if len(candidats):
+        masque[candidats] = cles.iloc[candidats].duplicated().to_numpy()
+    return masque
+
+def dedoublonner(df, regles=None, ignorees=(), verbose=True):
+    """
+    Applique les règles dans l'ordre ; chaque règle est mesurée (doublons/<nom> si imbriquée).
+    Retourne (df dédoublonné, {nom de règle: lignes supprimées}).
+    """
+    comptes = {}
+    for regle in regles_actives() if regles is None else regles:
+        with metriques.mesurer_si(verbose, regle['nom'], lignes_entree=len(df)) as mesure:
+            masque = doublons(df, regle, ignorees)
+            if masque is None:
+                if verbose:
+                    print(f"[ALERTE] Règle '{regle['nom']}' ignorée : colonnes {regle['colonnes']} absentes.")
+                continue
+            df = df[~masque]
+            comptes[regle['nom']] = int(masque.sum())
+            mesure['lignes_sortie'] = len(df)
+    return df, comptes
+
+def afficher_comptes(comptes):
+    print(f"[SUPPRESSION] Supprimé {sum(comptes.values())} doublons.")
+    if len(comptes) > 1:
+        for nom, nombre in comptes.items():
+            print(f"  {nombre} doublons supprimés par la règle '{nom}'.")
+
+class DedoublonneurFlux:
+    """
+    Dédoublonnage bloc par bloc (mode streaming) : par règle, les hash déjà vus sont gardés dans
+    quelques tableaux NumPy triés (8 octets par clé distincte, contre ~70 pour un set Python).
+    Les hash de chaque bloc forment un nouveau tableau, fusionné avec le précédent dès qu'il
+    atteint la moitié de sa taille : O(log n) tableaux, chaque hash recopié O(log n) fois au
+    lieu d'une insertion dans tout le tableau à chaque bloc. La mémoire croît encore avec le
+    nombre de clés distinctes (voir doublons_externes pour la borner).
+    """
+
+    def __init__(self, regles=None):
+        self.regles = regles_actives() if regles is None else regles
+        self.vus = {regle['nom']: [] for regle in self.regles}
+        self.comptes = {regle['nom']: 0 for regle in self.regles}
+
+    @staticmethod
+    def _deja_vus(niveaux, hashes):
+        """Masque des hash présents dans l'un des tableaux triés de niveaux."""
+        deja_vus = np.zeros(len(hashes), dtype=bool)
+        if not niveaux or not len(hashes):
+            return deja_vus
+        # Recherche des hash triés : accès mémoire séquentiels dans les grands tableaux
+        ordre = np.argsort(hashes)
+        tries = hashes[ordre]
+        trouves = np.zeros(len(hashes), dtype=bool)
+        for vus in niveaux:
+            positions = np.searchsorted(vus, tries).clip(max=len(vus) - 1)
+            trouves |= vus[positions] == tries
+        deja_vus[ordre] = trouves
+        return deja_vus
+
+    @staticmethod
+    def _ajouter(niveaux, nouveaux):
+        """Ajoute un tableau trié de hash ; fusionne tant que le dernier dépasse la moitié du précédent."""
+        if not len(nouveaux):
+            return
+        niveaux.append(nouveaux)
+        while len(niveaux) > 1 and 2 * len(niveaux[-1]) >= len(niveaux[-2]):
+            dernier = niveaux.pop()
+            # Deux suites déjà triées : le tri stable (timsort) se réduit à une fusion linéaire
+            niveaux[-1] = np.sort(np.concatenate([niveaux[-1], dernier]), kind='stable')
+
+    def filtrer(self, bloc):
+        """Retourne le bloc sans ses doublons (dans le bloc et avec les blocs précédents)."""
+        for regle in self.regles:
+            colonnes = colonnes_cle(regle, bloc.columns)
+            if colonnes is None:
+                continue
+            cles, eligibles = _cles(bloc, regle, colonnes)
+            hashes = hacher(cles)
+            niveaux = self.vus[regle['nom']]
+            deja_vus = self._deja_vus(niveaux, hashes)
+            masque = (pd.Series(hashes).duplicated().to_numpy() | deja_vus) & eligibles
+            self._ajouter(niveaux, np.unique(hashes[~masque & eligibles]))
+            self.comptes[regle['nom']] += int(masque.sum())
+            bloc = bloc[~masque]
+        return bloc
+
+def _doublons_exacts(file_path, regle, candidats, chunksize):
+    """
+    Relit file_path et compare exactement les clés des lignes candidates (numéros triés) :
+    retourne les numéros des lignes dont la clé est celle d'une candidate antérieure.
+    """
+    blocs, debut = [], 0
+    for bloc in pd.read_csv(file_path, encoding='utf-8', dtype=str, chunksize=chunksize):
+        gauche, droite = np.searchsorted(candidats, [debut, debut + len(bloc)])
+        if droite > gauche:
+            lignes = bloc.iloc[candidats[gauche:droite] - debut]
+            cles, _ = _cles(lignes, regle, colonnes_cle(regle, bloc.columns))
+            blocs.append(cles.set_axis(candidats[gauche:droite]))
+        debut += len(bloc)
+    cles = pd.concat(blocs)
+    return cles.index[cles.duplicated()].to_numpy()
+
+def doublons_externes(file_path, regles=None, chunksize=100_000, dossier=None):
+    """
+    Mode externe (tables plus grandes que la RAM) : une première lecture écrit, pour chaque règle,
+    les couples (hash de clé, numéro de ligne) dans NB_SEAUX fichiers selon le hash ; chaque seau
+    est ensuite trié séparément. Les lignes dont le hash se répète dans un seau sont candidates :
+    une relecture compare exactement leurs clés (voir _doublons_exacts), une collision de hash ne
+    supprime donc jamais une ligne distincte. En mémoire : un seau, le masque d'un octet par ligne
+    (memory-mappé) et les seules lignes candidates.
+    Retourne (masque des lignes en double indexé par numéro de ligne, {règle: lignes supprimées}).
+    """
+    regles = regles_actives() if regles is None else regles
+    dossier = tempfile.mkdtemp(dir=dossier)
+    comptes = {}
+    try:
+        nb_lignes, colonnes = 0, None
+        seaux = {regle['nom']: [open(os.path.join(dossier, f"{regle['nom']}_{i}.bin"), 'wb')
+                                for i in range(NB_SEAUX)] for regle in regles}
+        try:
+            for bloc in pd.read_csv(file_path, encoding='utf-8', dtype=str, chunksize=chunksize):
+                colonnes = bloc.columns
+                numeros = np.arange(nb_lignes, nb_lignes + len(bloc), dtype=np.int64)
+                for regle in regles:
+                    cle = colonnes_cle(regle, bloc.columns)
+                    if cle is None:
+                        continue
+                    cles, eligibles = _cles(bloc, regle, cle)
+                    hashes = hacher(cles)[eligibles]
+                    couples = np.column_stack([hashes.view(np.int64), numeros[eligibles]])
+                    numeros_seaux = hashes % NB_SEAUX
+                    for i in np.unique(numeros_seaux):
+                        couples[numeros_seaux == i].tofile(seaux[regle['nom']][i])
+                nb_lignes += len(bloc)
+        finally:
+            for fichiers in seaux.values():
+                for fichier in fichiers:
+                    fichier.close()
+
+        masque = np.memmap(os.path.join(dossier, "masque.bin"), dtype=bool, mode='w+', shape=(max(nb_lignes, 1),))
+        masque[:] = False
+        for regle in regles:
+            if colonnes is not None and colonnes_cle(regle, colonnes) is None:
+                print(f"[ALERTE] Règle '{regle['nom']}' ignorée : colonnes {regle['colonnes']} absentes.")
+                continue
+            candidats = []
+            for i in range(NB_SEAUX):
+                couples = np.fromfile(os.path.join(dossier, f"{regle['nom']}_{i}.bin"), dtype=np.int64).reshape(-1, 2)
+                # Lignes déjà supprimées par une règle précédente : hors jeu
+                couples = couples[~masque[couples[:, 1]]]
+                if not len(couples):
+                    continue
+                couples = couples[np.argsort(couples[:, 0], kind='stable')]
+                meme_hash = couples[1:, 0] == couples[:-1, 0]
+                repetes = np.zeros(len(couples), dtype=bool)
+                repetes[1:] |= meme_hash
+                repetes[:-1] |= meme_hash
+                candidats.append(couples[repetes, 1])
+            candidats = np.sort(np.concatenate(candidats)) if candidats else np.empty(0, dtype=np.int64)
+            supprimees = _doublons_exacts(file_path, regle, candidats, chunksize) if len(candidats) else candidats
+            masque[supprimees] = True
+            comptes[regle['nom']] = len(supprimees)
+        resultat = np.array(masque[:nb_lignes])
+        del masque
+        return resultat, comptes
+    finally:
+        for nom in os.listdir(dossier):
+            os.remove(os.path.join(dossier, nom))
+        os.rmdir(dossier)
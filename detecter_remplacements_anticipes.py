@@ -1,156 +1,483 @@
-import pandas as pd
-from datetime import datetime
-import os
-
-def load_data(file_path):
-    """Charge le fichier CSV nettoyé et filtré."""
-    try:
-        df = pd.read_csv(file_path, encoding='utf-8')
-        # S'assurer que date_mod est au format datetime
-        df['date_mod'] = pd.to_datetime(df['date_mod'], errors='coerce')
-        return df
-    except Exception as e:
-        print(f"Erreur lors du chargement de {file_path} : {e}")
-        return None
-
-def load_users(file_path):
-    """Charge les utilisateurs depuis utilisateurs.csv et retourne un dictionnaire {utilisateur_id: nom}."""
-    try:
-        users_df = pd.read_csv(file_path, encoding='utf-8')
-        # S'assurer que utilisateur_id est en string pour matcher avec users_id
-        users_df['utilisateur_id'] = users_df['utilisateur_id'].astype(str)
-        # Créer un mapping
-        user_map = dict(zip(users_df['utilisateur_id'], users_df['nom_utilisateur']))  # ou 'nom' selon ton CSV
-        return user_map
-    except Exception as e:
-        print(f"Erreur lors du chargement de {file_path} : {e}")
-        return None
-
-def detecter_remplacements_anticipes(df, user_map):
-    """
-    Détecte les remplacements anticipés (< 2 ans entre deux attributions pour un même utilisateur).
-    Retourne deux DataFrames :
-    1. remplacements_df : tous les cas de remplacement anticipé (avec détails, incluant noms des téléphones)
-    2. utilisateurs_df : résumé par utilisateur (nombre de remplacements anticipés)
-    """
-    # Filtrer uniquement les smartphones attribués (states_id == 2 et users_id > 0)
-    df = df[(df['states_id'] == 2) & (df['users_id'] > 0)].copy()
-    
-    # Convertir users_id en string pour matcher avec les mappings
-    df['users_id'] = df['users_id'].astype(str)
-    
-    # Trier par utilisateur puis par date
-    df = df.sort_values(['users_id', 'date_mod']).reset_index(drop=True)
-    
-    remplacements = []
-    utilisateurs = {}
-
-    # Parcourir chaque utilisateur
-    for user_id, group in df.groupby('users_id'):
-        if len(group) < 2:
-            continue  # Pas de remplacement possible avec un seul téléphone
-        
-        dates = group['date_mod'].tolist()
-        rows = group.to_dict('records')
-        
-        for i in range(1, len(dates)):
-            date_actuelle = dates[i]
-            date_precedente = dates[i-1]
-            
-            if pd.isna(date_actuelle) or pd.isna(date_precedente):
-                continue
-            
-            # Calculer la différence en jours, puis convertir en années
-            diff_jours = (date_actuelle - date_precedente).days
-            diff_annees = diff_jours / 365.25  # Compte les années bissextiles
-            
-            if diff_annees < 2.0:
-                # Récupérer le nom de l'utilisateur depuis le mapping
-                nom_utilisateur = user_map.get(user_id, 'Inconnu')
-                # Récupérer les noms des téléphones depuis la colonne 'name'
-                nom_tele_precedent = rows[i-1].get('name', 'Inconnu')
-                nom_tele_actuel = rows[i].get('name', 'Inconnu')
-
-                # C'est un remplacement anticipé
-                remplacement = {
-                    'users_id': user_id,
-                    'nom_utilisateur': nom_utilisateur,
-                    'nom_tele_precedent': nom_tele_precedent,
-                    'date_precedente': date_precedente.strftime('%Y-%m-%d'),
-                    'nom_tele_actuel': nom_tele_actuel,
-                    'date_actuelle': date_actuelle.strftime('%Y-%m-%d'),
-                    'intervalle_jours': int(diff_jours),
-                    'intervalle_annees': round(diff_annees, 2)
-                }
-                remplacements.append(remplacement)
-                
-                # Compter par utilisateur
-                if user_id not in utilisateurs:
-                    utilisateurs[user_id] = {
-                        'users_id': user_id,
-                        'nom_utilisateur': nom_utilisateur,
-                        'nb_remplacements_anticipes': 0
-                    }
-                utilisateurs[user_id]['nb_remplacements_anticipes'] += 1
-
-    # Convertir en DataFrames
-    remplacements_df = pd.DataFrame(remplacements)
-    utilisateurs_df = pd.DataFrame(list(utilisateurs.values())).sort_values('nb_remplacements_anticipes', ascending=False)
-
-    return remplacements_df, utilisateurs_df
-
-def sauvegarder_resultats(remplacements_df, utilisateurs_df):
-    """Sauvegarde les résultats dans des fichiers CSV."""
-    try:
-        remplacements_df.to_csv('remplacements_anticipes.csv', index=False, encoding='utf-8')
-        print(f"{len(remplacements_df)} remplacements anticipés sauvegardés dans 'remplacements_anticipes.csv'")
-    except Exception as e:
-        print(f"Erreur lors de la sauvegarde des remplacements : {e}")
-
-    try:
-        utilisateurs_df.to_csv('utilisateurs_multi_remplacements.csv', index=False, encoding='utf-8')
-        print(f"{len(utilisateurs_df)} utilisateurs concernés sauvegardés dans 'utilisateurs_multi_remplacements.csv'")
-    except Exception as e:
-        print(f"Erreur lors de la sauvegarde des utilisateurs : {e}")
-
-def main():
-    input_file = "cleaned_telephones_filtered.csv"
-    utilisateurs_file = "exports/utilisateurs.csv"
-    
-    # Vérifier l'existence des fichiers
-    if not os.path.exists(input_file):
-        print(f"Le fichier {input_file} est introuvable. Assurez-vous que le nettoyage et le filtrage sont terminés.")
-        return
-
-    if not os.path.exists(utilisateurs_file):
-        print(f"Le fichier {utilisateurs_file} est introuvable. Impossible de récupérer les noms des utilisateurs.")
-        return
-
-    print("Chargement des données...")
-    df = load_data(input_file)
-    if df is None:
-        return
-
-    print("Chargement des noms d'utilisateurs...")
-    user_map = load_users(utilisateurs_file)
-    if user_map is None:
-        return
-
-    print("Détection des remplacements anticipés...")
-    remplacements_df, utilisateurs_df = detecter_remplacements_anticipes(df, user_map)
-
-    if len(remplacements_df) == 0:
-        print("Aucun remplacement anticipé détecté !")
-    else:
-        print(f"{len(remplacements_df)} remplacements anticipés trouvés.")
-        print(f"{len(utilisateurs_df)} utilisateurs concernés.")
-
-    sauvegarder_resultats(remplacements_df, utilisateurs_df)
-
-    # Afficher un résumé
-    if not utilisateurs_df.empty:
-        print("Top 5 des utilisateurs avec le plus de remplacements anticipés :")
-        print(utilisateurs_df.head().to_string(index=False))
-
-if __name__ == "__main__":
-    main()
\ No newline at end of file
+import numpy as np
+import pandas as pd
+from datetime import datetime
+import os
+import sys
+import time
+import metriques
+import stockage
+import sorties
+import index_references
+
+# Seuil (en années) en dessous duquel une nouvelle attribution est un remplacement anticipé
+SEUIL_ANNEES = 2.0
+
+# Analyse multi-seuils (analyse_remplacements.csv, format long pour Power BI)
+SEUILS_ANALYSE = [1.0, 2.0, 3.0]
+# Fenêtres glissantes : (durée en mois, nombre minimal d'attributions dans la fenêtre)
+FENETRES_ANALYSE = [(24, 3)]
+COLONNES_ANALYSE = ['indicateur', 'parametre', 'dimension', 'cle', 'periode', 'valeur']
+INDICATEURS_ANALYSE = ['remplacements_anticipes', 'attributions_fenetre']
+DIMENSIONS_ANALYSE = ['total', 'periode', 'modele', 'utilisateur']
+
+# État persistant par utilisateur (dernière attribution datée, compteurs) pour la détection incrémentale
+ETAT_FILE = ".etat_detection.npz"
+COLONNES_ETAT = ['users_id', 'derniere_date', 'dernier_nom', 'nb_attributions', 'nb_anticipes']
+
+def load_data(file_path, fmt='csv'):
+    """Charge le fichier nettoyé et filtré (CSV, ou copie typée Parquet/Arrow)."""
+    try:
+        start = time.perf_counter()
+        # Seules les colonnes utiles à la détection sont chargées, avec le schéma compact
+        df = stockage.lire_table(file_path, fmt, table='telephones', colonnes=stockage.COLONNES_ETAPES['detection'])
+        # S'assurer que date_mod est au format datetime (déjà typé hors CSV)
+        if not pd.api.types.is_datetime64_any_dtype(df['date_mod']):
+            df['date_mod'] = pd.to_datetime(df['date_mod'], errors='coerce')
+        if fmt != 'csv':
+            print(f"[FORMAT] {stockage.chemin_intermediaire(file_path, fmt)} chargé en {time.perf_counter() - start:.2f} s")
+        return df
+    except Exception as e:
+        print(f"Erreur lors du chargement de {file_path} : {e}")
+        return None
+
+def load_users(file_path):
+    """
+    Charge les utilisateurs depuis l'index de référence (construit à partir de utilisateurs.csv).
+    Retourne une index_references.Table {utilisateur_id (entier): nom}.
+    """
+    try:
+        user_map = index_references.charger_index(os.path.dirname(file_path) or '.')['utilisateurs']
+        if user_map is None:
+            print(f"Erreur lors du chargement de {file_path} : colonnes 'utilisateur_id' ou 'nom_utilisateur' manquantes")
+        return user_map
+    except Exception as e:
+        print(f"Erreur lors du chargement de {file_path} : {e}")
+        return None
+
+def trier_attributions(df):
+    """
+    Attributions (states_id == 2, users_id > 0) triées par utilisateur puis par date.
+    Les utilisateurs sont dans l'ordre numérique (9 avant 10), et non plus dans l'ordre du
+    texte comme dans la version initiale : c'est l'ordre des lignes de remplacements_anticipes.csv,
+    le même en mode complet, incrémental et parallèle.
+    """
+    with metriques.mesurer("tri", lignes_entree=len(df)) as mesure:
+        # Filtrer uniquement les smartphones attribués (states_id == 2 et users_id > 0)
+        df = df[((df['states_id'] == 2) & (df['users_id'] > 0)).fillna(False)].copy()
+
+        # users_id en entier natif : tri et jointures sur des int64, comme l'index de référence
+        df['users_id'] = df['users_id'].astype('int64')
+
+        # Trier par utilisateur puis par date
+        df = df.sort_values(['users_id', 'date_mod']).reset_index(drop=True)
+        mesure['lignes_sortie'] = len(df)
+    return df
+
+def detecter_remplacements_anticipes(df, user_map, seuil_annees=SEUIL_ANNEES, deja_trie=False):
+    """
+    Détecte les remplacements anticipés (< seuil_annees entre deux attributions pour un même utilisateur).
+    Avec deja_trie, df est le résultat de trier_attributions (partagé avec analyser_remplacements).
+    Retourne deux DataFrames :
+    1. remplacements_df : tous les cas de remplacement anticipé (avec détails, incluant noms des téléphones)
+    2. utilisateurs_df : résumé par utilisateur (nombre de remplacements anticipés)
+    """
+    if not deja_trie:
+        df = trier_attributions(df)
+
+    with metriques.mesurer("groupby_shift", lignes_entree=len(df)) as mesure:
+        # Comparer chaque attribution à la précédente du même utilisateur, en une seule passe
+        groupes = df.groupby('users_id', sort=False)
+        date_precedente = groupes['date_mod'].shift()
+        if 'name' in df.columns:
+            nom_tele_precedent = groupes['name'].shift()
+            nom_tele_actuel = df['name']
+        else:
+            nom_tele_precedent = nom_tele_actuel = pd.Series('Inconnu', index=df.index)
+
+        # Différence en jours, puis en années (les paires avec une date manquante sont ignorées)
+        diff_jours = (df['date_mod'] - date_precedente).dt.days
+        diff_annees = diff_jours / 365.25  # Compte les années bissextiles
+        anticipe = diff_annees < seuil_annees
+        mesure['lignes_sortie'] = anticipe.sum()
+
+    remplacements_df = pd.DataFrame({
+        'users_id': df.loc[anticipe, 'users_id'],
+        'nom_tele_precedent': nom_tele_precedent[anticipe],
+        'date_precedente': date_precedente[anticipe].dt.strftime('%Y-%m-%d'),
+        'nom_tele_actuel': nom_tele_actuel[anticipe],
+        'date_actuelle': df.loc[anticipe, 'date_mod'].dt.strftime('%Y-%m-%d'),
+        'intervalle_jours': diff_jours[anticipe].astype(int),
+    }).reset_index(drop=True)
+
+    # Récupérer le nom de l'utilisateur depuis l'index (une recherche vectorisée par utilisateur)
+    uniques = remplacements_df['users_id'].unique()
+    if isinstance(user_map, index_references.Table):
+        noms = dict(zip(uniques, user_map.valeurs_pour(uniques, 'Inconnu')))
+    else:
+        noms = {user_id: user_map.get(user_id, 'Inconnu') for user_id in uniques}
+    remplacements_df.insert(1, 'nom_utilisateur', remplacements_df['users_id'].map(noms))
+    # round() Python sur chaque nombre de jours distinct, pour un arrondi identique au calcul ligne à ligne
+    arrondis = {jours: round(jours / 365.25, 2) for jours in remplacements_df['intervalle_jours'].unique()}
+    remplacements_df['intervalle_annees'] = remplacements_df['intervalle_jours'].map(arrondis).astype(float)
+
+    return remplacements_df, resumer_par_utilisateur(remplacements_df)
+
+def resumer_par_utilisateur(remplacements_df):
+    """Compte les remplacements anticipés par utilisateur (dans l'ordre de première apparition)."""
+    return (remplacements_df.groupby('users_id', sort=False)
+            .agg(nom_utilisateur=('nom_utilisateur', 'first'),
+                 nb_remplacements_anticipes=('users_id', 'size'))
+            .reset_index()
+            .sort_values('nb_remplacements_anticipes', ascending=False))
+
+def _libelle_seuil(seuil):
+    return f"< {seuil:g} an" + ("s" if seuil >= 2 else "")
+
+def _libelle_fenetre(mois, minimum):
+    return f">= {minimum} en {mois} mois"
+
+def _agreger(indicateur, parametre, dimension, cles=None, periodes=None):
+    """Nombre d'occurrences par (cle, periode) : une ligne par combinaison présente."""
+    groupes = {nom: valeurs for nom, valeurs in (('cle', cles), ('periode', periodes)) if valeurs is not None}
+    resultat = pd.DataFrame(groupes).groupby(list(groupes), dropna=False).size().reset_index(name='valeur')
+    return resultat.assign(indicateur=indicateur, parametre=parametre, dimension=dimension)
+
+def _ordonner(analyse_df, seuils_annees, fenetres):
+    """Ordre stable du fichier long : indicateur, paramètre (ordre de la configuration), dimension, clé, période."""
+    parametres = [_libelle_seuil(s) for s in seuils_annees] + [_libelle_fenetre(m, n) for m, n in fenetres]
+    cles_tri = analyse_df.assign(
+        indicateur=pd.Categorical(analyse_df['indicateur'], categories=INDICATEURS_ANALYSE, ordered=True),
+        parametre=pd.Categorical(analyse_df['parametre'], categories=list(dict.fromkeys(parametres)), ordered=True),
+        dimension=pd.Categorical(analyse_df['dimension'], categories=DIMENSIONS_ANALYSE, ordered=True))
+    ordre = cles_tri.sort_values(['indicateur', 'parametre', 'dimension', 'cle', 'periode'],
+                                 na_position='first', kind='stable').index
+    return analyse_df.loc[ordre, COLONNES_ANALYSE].reset_index(drop=True)
+
+def analyser_remplacements(df, seuils_annees=None, fenetres=None, deja_trie=False):
+    """
+    Analyse en une passe sur les attributions triées, au format long (une ligne par mesure) :
+    - remplacements_anticipes : pour chaque seuil de seuils_annees, nombre d'attributions
+      arrivées moins de seuil années après la précédente du même utilisateur, au total,
+      par mois (periode AAAA-MM), par modèle (phonemodels_id) et mois, et par utilisateur ;
+    - attributions_fenetre : pour chaque (mois, minimum) de fenetres, les utilisateurs ayant eu
+      au moins minimum attributions dans une fenêtre glissante de mois mois (valeur : maximum
+      atteint), et leur nombre total.
+    Avec deja_trie, df est le résultat de trier_attributions.
+    """
+    seuils_annees = SEUILS_ANALYSE if seuils_annees is None else seuils_annees
+    fenetres = FENETRES_ANALYSE if fenetres is None else fenetres
+    if not deja_trie:
+        df = trier_attributions(df)
+
+    with metriques.mesurer("analyse", lignes_entree=len(df)) as mesure:
+        users = df['users_id'].to_numpy()
+        dates = df['date_mod']
+        # Écart avec l'attribution précédente du même utilisateur (les données sont déjà triées)
+        meme_utilisateur = np.zeros(len(users), dtype=bool)
+        meme_utilisateur[1:] = users[1:] == users[:-1]
+        diff_annees = ((dates - dates.shift()).dt.days / 365.25).where(meme_utilisateur)
+        periodes = dates.dt.strftime('%Y-%m')
+        modeles = df['phonemodels_id'] if 'phonemodels_id' in df.columns else None
+
+        morceaux = []
+        for seuil in seuils_annees:
+            libelle = _libelle_seuil(seuil)
+            anticipe = (diff_annees < seuil).to_numpy()
+            morceaux.append(pd.DataFrame({'indicateur': 'remplacements_anticipes', 'parametre': libelle,
+                                          'dimension': 'total', 'valeur': [anticipe.sum()]}))
+            morceaux.append(_agreger('remplacements_anticipes', libelle, 'periode', periodes=periodes[anticipe]))
+            if modeles is not None:
+                morceaux.append(_agreger('remplacements_anticipes', libelle, 'modele',
+                                         cles=modeles[anticipe].to_numpy(), periodes=periodes[anticipe]))
+            morceaux.append(_agreger('remplacements_anticipes', libelle, 'utilisateur', cles=users[anticipe]))
+
+        # Fenêtres glissantes : clé (utilisateur, jour) croissante, comptage par recherche dichotomique
+        valides = dates.notna().to_numpy()
+        jours = (dates[valides] - pd.Timestamp('1970-01-01')).dt.days.to_numpy(dtype='float64')
+        users_valides = users[valides]
+        if len(jours):
+            codes = np.r_[0, np.cumsum(users_valides[1:] != users_valides[:-1])]
+            jours = jours - jours.min()
+        for mois, minimum in fenetres:
+            libelle = _libelle_fenetre(mois, minimum)
+            duree = mois * 365.25 / 12
+            if len(jours):
+                cles = codes * (jours.max() + duree + 1) + jours
+                # Attributions du même utilisateur dans ]date - duree, date]
+                dans_fenetre = np.arange(len(cles)) - np.searchsorted(cles, cles - duree, side='right') + 1
+                maximum = pd.Series(dans_fenetre).groupby(users_valides, sort=True).max()
+                maximum = maximum[maximum >= minimum]
+            else:
+                maximum = pd.Series(dtype='int64')
+            morceaux.append(pd.DataFrame({'indicateur': 'attributions_fenetre', 'parametre': libelle,
+                                          'dimension': 'total', 'valeur': [len(maximum)]}))
+            morceaux.append(pd.DataFrame({'indicateur': 'attributions_fenetre', 'parametre': libelle,
+                                          'dimension': 'utilisateur', 'cle': maximum.index.to_numpy(),
+                                          'valeur': maximum.to_numpy()}))
+
+        analyse_df = pd.concat(morceaux, ignore_index=True).reindex(columns=COLONNES_ANALYSE)
+        analyse_df['cle'] = analyse_df['cle'].astype('Int64')
+        analyse_df['valeur'] = analyse_df['valeur'].astype('int64')
+        analyse_df = _ordonner(analyse_df, seuils_annees, fenetres)
+        mesure['lignes_sortie'] = len(analyse_df)
+    return analyse_df
+
+def fusionner_analyses(analyses, seuils_annees=None, fenetres=None):
+    """
+    Fusionne des analyses calculées sur des partitions disjointes d'utilisateurs :
+    les comptes s'additionnent, les lignes par utilisateur ne se recouvrent pas.
+    """
+    seuils_annees = SEUILS_ANALYSE if seuils_annees is None else seuils_annees
+    fenetres = FENETRES_ANALYSE if fenetres is None else fenetres
+    analyse_df = (pd.concat(analyses, ignore_index=True)
+                  .groupby(['indicateur', 'parametre', 'dimension', 'cle', 'periode'], dropna=False, sort=False)
+                  ['valeur'].sum().reset_index())
+    return _ordonner(analyse_df, seuils_annees, fenetres)
+
+def construire_etat(triees, remplacements_df):
+    """
+    État par utilisateur à partir des attributions triées et des remplacements détectés :
+    dernière attribution datée (date, nom du téléphone), nombre d'attributions datées et
+    nombre de remplacements anticipés. Les attributions sans date ne forment jamais de paire.
+    """
+    datees = triees[triees['date_mod'].notna()]
+    dernieres = datees.drop_duplicates('users_id', keep='last')
+    noms = dernieres['name'] if 'name' in dernieres.columns else pd.Series('Inconnu', index=dernieres.index)
+    etat = pd.DataFrame({
+        'users_id': dernieres['users_id'].to_numpy(dtype='int64'),
+        'derniere_date': dernieres['date_mod'].to_numpy(dtype='datetime64[ns]'),
+        'dernier_nom': noms.fillna('').astype(str).to_numpy(),
+    })
+    etat['nb_attributions'] = etat['users_id'].map(datees['users_id'].value_counts()).to_numpy(dtype='int64')
+    etat['nb_anticipes'] = (etat['users_id'].map(remplacements_df['users_id'].value_counts())
+                            .fillna(0).to_numpy(dtype='int64'))
+    return etat
+
+def charger_etat(path=ETAT_FILE, seuil_annees=SEUIL_ANNEES):
+    """État sauvegardé par sauvegarder_etat, ou None s'il est absent ou calculé pour un autre seuil."""
+    try:
+        with np.load(path) as donnees:
+            if float(donnees['seuil_annees']) != seuil_annees:
+                return None
+            return pd.DataFrame({col: donnees[col] for col in COLONNES_ETAT})
+    except (FileNotFoundError, KeyError, ValueError):
+        return None
+
+def sauvegarder_etat(etat, path=ETAT_FILE, seuil_annees=SEUIL_ANNEES):
+    """Écrit l'état (trié par users_id) de façon atomique."""
+    etat = etat.sort_values('users_id').reset_index(drop=True)
+    tmp_path = path + '.tmp.npz'
+    np.savez(tmp_path, seuil_annees=seuil_annees,
+             **{col: etat[col].to_numpy(dtype=str if col == 'dernier_nom' else None) for col in COLONNES_ETAT})
+    os.replace(tmp_path, path)
+
+def _entiers(valeurs):
+    """users_id (texte ou nombres) → tableau trié d'entiers distincts."""
+    valeurs = pd.to_numeric(pd.Series(list(valeurs), dtype=object), errors='coerce').dropna()
+    return np.unique(valeurs.astype('int64').to_numpy())
+
+def _etat_pour(etat, users):
+    """Lignes de l'état pour users (recherche dichotomique), indexées par users_id ; NaN si inconnu."""
+    etat_users = etat['users_id'].to_numpy()
+    positions = np.searchsorted(etat_users, users)
+    connus = positions < len(etat_users)
+    connus[connus] = etat_users[positions[connus]] == users[connus]
+    return etat.iloc[positions[connus]].set_index('users_id').reindex(users)
+
+def detecter_remplacements_incremental(df, user_map, users_modifies, etat, seuil_annees=SEUIL_ANNEES,
+                                       users_lignes_modifiees=None):
+    """
+    Met à jour les remplacements et l'état pour les seuls utilisateurs de users_modifies,
+    sans retrier l'ensemble des attributions :
+    - ajout : les nouvelles attributions sont toutes postérieures à la dernière attribution
+      connue de l'utilisateur ; seules les nouvelles paires, à partir de celle-ci, sont calculées ;
+    - correctif : ligne existante modifiée (users_lignes_modifiees, tous les utilisateurs si None),
+      supprimée ou datée avant la dernière attribution connue ; l'historique est recalculé.
+    Retourne (ajouts_df, correctifs_df, users_corriges, etat) : remplacements à ajouter, remplacements
+    qui remplacent toutes les lignes des users_corriges, et état mis à jour.
+    """
+    users_modifies = _entiers(users_modifies)
+    if len(users_modifies) == 0:
+        # Aucun téléphone modifié depuis le dernier export : rien à recalculer, l'état est inchangé
+        vides, _ = detecter_remplacements_anticipes(df.iloc[:0], user_map, seuil_annees)
+        return vides, vides.copy(), set(), etat
+    forces =_entiers(users_modifies if users_lignes_modifiees is None else users_lignes_modifiees)
+    triees = trier_attributions(df[df['users_id'].isin(users_modifies)])
+    datees = triees[triees['date_mod'].notna()]
+    precedent = _etat_pour(etat, users_modifies)
+
+    # Ajout possible si l'historique connu (attributions datées jusqu'à la dernière date) est intact
+    deja_vues = datees['date_mod'] <= datees['users_id'].map(precedent['derniere_date'])
+    nb_deja_vues = deja_vues.groupby(datees['users_id']).sum().reindex(precedent.index, fill_value=0)
+    ajout = (nb_deja_vues == precedent['nb_attributions'].fillna(0)) & ~precedent.index.isin(forces)
+    users_ajout, users_corriges = precedent.index[ajout], precedent.index[~ajout]
+
+    # Ajouts : la dernière attribution connue sert d'ancre à la première nouvelle paire
+    nouvelles = datees[datees['users_id'].isin(users_ajout) & ~deja_vues]
+    ancres = precedent[precedent.index.isin(nouvelles['users_id']) & precedent['derniere_date'].notna()]
+    suite = pd.concat([
+        pd.DataFrame({'users_id': ancres.index, 'date_mod': ancres['derniere_date'], 'name': ancres['dernier_nom']}),
+        nouvelles.reindex(columns=['users_id', 'date_mod', 'name'], fill_value='Inconnu'),
+    ], ignore_index=True).sort_values(['users_id', 'date_mod'], kind='stable').reset_index(drop=True)
+    ajouts_df, _ = detecter_remplacements_anticipes(suite, user_map, seuil_annees, deja_trie=True)
+
+    # Correctifs : historique complet des utilisateurs concernés
+    corriges = triees[triees['users_id'].isin(users_corriges)].reset_index(drop=True)
+    correctifs_df, _ = detecter_remplacements_anticipes(corriges, user_map, seuil_annees, deja_trie=True)
+
+    # Nouvel état : prolongé pour les ajouts (l'ancre était déjà comptée), recalculé pour les correctifs
+    prolonge = construire_etat(suite, ajouts_df).set_index('users_id')
+    anciens = precedent.loc[prolonge.index]
+    prolonge['nb_attributions'] += (anciens['nb_attributions'].fillna(1) - 1).astype('int64')
+    prolonge['nb_anticipes'] += anciens['nb_anticipes'].fillna(0).astype('int64')
+    inchanges = etat[~etat['users_id'].isin(users_corriges) & ~etat['users_id'].isin(prolonge.index)]
+    etat = (pd.concat([inchanges, prolonge.reset_index(), construire_etat(corriges, correctifs_df)],
+                      ignore_index=True)
+            .sort_values('users_id').reset_index(drop=True))
+    return ajouts_df, correctifs_df, set(users_corriges), etat
+
+def resumer_depuis_etat(etat, user_map):
+    """Même résumé que resumer_par_utilisateur, calculé depuis l'état (sans relire les remplacements)."""
+    concernes = etat[etat['nb_anticipes'] > 0].sort_values('users_id')
+    users = concernes['users_id'].to_numpy()
+    if isinstance(user_map, index_references.Table):
+        noms = user_map.valeurs_pour(users, 'Inconnu')
+    else:
+        noms = [user_map.get(user_id, 'Inconnu') for user_id in users]
+    return (pd.DataFrame({'users_id': users, 'nom_utilisateur': noms,
+                          'nb_remplacements_anticipes': concernes['nb_anticipes'].to_numpy()})
+            .sort_values('nb_remplacements_anticipes', ascending=False))
+
+def sauvegarder_resultats(remplacements_df, utilisateurs_df):
+    """Sauvegarde les résultats dans des fichiers CSV."""
+    try:
+        sorties.ecrire_csv(remplacements_df, 'remplacements_anticipes.csv')
+        print(f"{len(remplacements_df)} remplacements anticipés sauvegardés dans 'remplacements_anticipes.csv'")
+    except Exception as e:
+        print(f"Erreur lors de la sauvegarde des remplacements : {e}")
+
+    try:
+        sorties.ecrire_csv(utilisateurs_df, 'utilisateurs_multi_remplacements.csv')
+        print(f"{len(utilisateurs_df)} utilisateurs concernés sauvegardés dans 'utilisateurs_multi_remplacements.csv'")
+    except Exception as e:
+        print(f"Erreur lors de la sauvegarde des utilisateurs : {e}")
+
+def mettre_a_jour_resultats(ajouts_df, correctifs_df, users_corriges, utilisateurs_df,
+                            path='remplacements_anticipes.csv'):
+    """
+    Met à jour remplacements_anticipes.csv : sans correctif, les ajouts sont écrits sur place en fin
+    de fichier (seuls les nouveaux octets sont écrits, voir sorties.ajouter_csv) ; le fichier n'est
+    relu et réécrit que s'il y a des correctifs (lignes des users_corriges remplacées). Le résumé
+    par utilisateur est réécrit (il vient de l'état).
+    """
+    try:
+        if users_corriges:
+            existants = pd.read_csv(sorties.resoudre(path), dtype=str, keep_default_na=False, encoding='utf-8')
+            corriges = pd.to_numeric(existants['users_id'], errors='coerce').isin(list(users_corriges))
+            sorties.ecrire_csv(pd.concat([existants[~corriges], correctifs_df, ajouts_df], ignore_index=True), path)
+        elif len(ajouts_df):
+            sorties.ajouter_csv(ajouts_df, path)
+        print(f"{len(ajouts_df)} remplacements ajoutés et {len(users_corriges)} utilisateurs corrigés dans '{path}'")
+    except Exception as e:
+        print(f"Erreur lors de la mise à jour des remplacements : {e}")
+
+    try:
+        sorties.ecrire_csv(utilisateurs_df, 'utilisateurs_multi_remplacements.csv')
+        print(f"{len(utilisateurs_df)} utilisateurs concernés sauvegardés dans 'utilisateurs_multi_remplacements.csv'")
+    except Exception as e:
+        print(f"Erreur lors de la sauvegarde des utilisateurs : {e}")
+
+def sauvegarder_analyse(analyse_df, path='analyse_remplacements.csv'):
+    """Sauvegarde l'analyse multi-seuils au format long."""
+    try:
+        sorties.ecrire_csv(analyse_df, path)
+        print(f"{len(analyse_df)} lignes d'analyse sauvegardées dans '{path}'")
+    except Exception as e:
+        print(f"Erreur lors de la sauvegarde de l'analyse : {e}")
+
+def lire_options_analyse(argv):
+    """
+    Seuils et fenêtres de l'analyse depuis la ligne de commande :
+    --seuils 1,2,3 (années) et --fenetres 24:3,12:2 (mois:minimum d'attributions).
+    """
+    seuils, fenetres = SEUILS_ANALYSE, FENETRES_ANALYSE
+    if '--seuils' in argv:
+        seuils = [float(v) for v in argv[argv.index('--seuils') + 1].split(',')]
+    if '--fenetres' in argv:
+        fenetres = [tuple(int(x) for x in v.split(':')) for v in argv[argv.index('--fenetres') + 1].split(',')]
+    return seuils, fenetres
+
+def main(incremental=False, seuils_annees=None, fenetres=None):
+    input_file = "cleaned_telephones_filtered.csv"
+    utilisateurs_file = "exports/utilisateurs.csv"
+    users_modifies_file = "exports/utilisateurs_modifies.csv"
+    remplacements_file = "remplacements_anticipes.csv"
+    
+    fmt = stockage.format_intermediaire()
+    if fmt != 'csv' and not sorties.existe(stockage.chemin_intermediaire(input_file, fmt)):
+        fmt = 'csv'
+
+    # Vérifier l'existence des fichiers
+    if not sorties.existe(input_file):
+        print(f"Le fichier {input_file} est introuvable. Assurez-vous que le nettoyage et le filtrage sont terminés.")
+        return
+
+    if not sorties.existe(utilisateurs_file):
+        print(f"Le fichier {utilisateurs_file} est introuvable. Impossible de récupérer les noms des utilisateurs.")
+        return
+
+    print("Chargement des données...")
+    df = load_data(input_file, fmt)
+    if df is None:
+        return
+
+    print("Chargement des noms d'utilisateurs...")
+    user_map = load_users(utilisateurs_file)
+    if user_map is None:
+        return
+
+    etat = charger_etat() if incremental else None
+    if etat is not None and sorties.existe(users_modifies_file) and sorties.existe(remplacements_file):
+        modifies = pd.read_csv(sorties.resoudre(users_modifies_file), encoding='utf-8')
+        lignes_modifiees = (modifies.loc[modifies['lignes_modifiees'] == 1, 'users_id']
+                            if 'lignes_modifiees' in modifies.columns else None)
+        print(f"Détection incrémentale des remplacements anticipés ({len(modifies)} utilisateurs modifiés)...")
+        ajouts_df, correctifs_df, users_corriges, etat = detecter_remplacements_incremental(
+            df, user_map, modifies['users_id'], etat, SEUIL_ANNEES, lignes_modifiees)
+        utilisateurs_df = resumer_depuis_etat(etat, user_map)
+        nb_remplacements = int(etat['nb_anticipes'].sum())
+        mettre_a_jour_resultats(ajouts_df, correctifs_df, users_corriges, utilisateurs_df)
+        # L'analyse multi-seuils demanderait de retrier toutes les attributions : elle n'est pas
+        # recalculée en mode incrémental
+        triees = None
+    else:
+        # Un seul tri, partagé par la détection et l'analyse multi-seuils
+        triees = trier_attributions(df)
+        print("Détection des remplacements anticipés...")
+        remplacements_df, utilisateurs_df = detecter_remplacements_anticipes(triees, user_map, SEUIL_ANNEES,
+                                                                             deja_trie=True)
+        etat = construire_etat(triees, remplacements_df)
+        nb_remplacements = len(remplacements_df)
+        sauvegarder_resultats(remplacements_df, utilisateurs_df)
+    sauvegarder_etat(etat)
+
+    if nb_remplacements == 0:
+        print("Aucun remplacement anticipé détecté !")
+    else:
+        print(f"{nb_remplacements} remplacements anticipés trouvés.")
+        print(f"{len(utilisateurs_df)} utilisateurs concernés.")
+
+    if triees is None:
+        print("[INFO] Mode incrémental : analyse multi-seuils non recalculée, 'analyse_remplacements.csv' "
+              "reste celle du dernier run complet (relancer sans --incremental pour l'actualiser).")
+    else:
+        print("Analyse multi-seuils et fenêtres glissantes...")
+        sauvegarder_analyse(analyser_remplacements(triees, seuils_annees, fenetres, deja_trie=True))
+
+    # Afficher un résumé
+    if not utilisateurs_df.empty:
+        print("Top 5 des utilisateurs avec le plus de remplacements anticipés :")
+        print(utilisateurs_df.head().to_string(index=False))
+
+if __name__ == "__main__":
+    main('--incremental' in sys.argv, *lire_options_analyse(sys.argv))
\ No newline at end of file
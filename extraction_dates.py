@@ -0,0 +1,160 @@
+import re
+from datetime import datetime
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+# Extraction de dates depuis du texte libre (date_creation, comment, contact).
+# Les formats sont essayés dans l'ordre : le premier format présent dans le texte
+# décide du résultat (même s'il décrit une date invalide, comme avant).
+# Jetons : JJ (jour), MM (mois), AAAA (année) ; le reste est un séparateur littéral.
+FORMATS_BASE = ['JJ/MM/AAAA', 'AAAA-MM-JJ']
+# Variantes rencontrées dans les notes saisies à la main, essayées après les formats de base
+FORMATS_SUPPLEMENTAIRES = ['JJ-MM-AAAA', 'JJ.MM.AAAA']
+
+# Nombre de chaînes distinctes gardées en cache (les notes sont très répétitives)
+TAILLE_CACHE = 65536
+
+_JOURS_PAR_MOIS = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
+_JETONS = re.compile(r'JJ|MM|AAAA')
+
+def compiler_format(fmt):
+    """
+    Compile un format ('JJ/MM/AAAA', ...) en (regex, positions) où positions donne
+    les indices (début, fin) du jour, du mois et de l'année dans le texte capturé.
+    """
+    regex, positions, offset = '', {}, 0
+    for morceau in re.split(r'(JJ|MM|AAAA)', fmt):
+        if not morceau:
+            continue
+        if _JETONS.fullmatch(morceau):
+            regex += r'\d{%d}' % len(morceau)
+            positions[morceau] = (offset, offset + len(morceau))
+        else:
+            regex += re.escape(morceau)
+        offset += len(morceau)
+    if set(positions) != {'JJ', 'MM', 'AAAA'}:
+        raise ValueError(f"Format de date invalide : {fmt}")
+    return re.compile(f'({regex})'), (positions['JJ'], positions['MM'], positions['AAAA'])
+
+def _date_valide(annee, mois, jour):
+    """Mêmes règles que datetime.strptime pour un jour/mois/année numériques."""
+    if annee < 1 or not 1 <= mois <= 12 or jour < 1:
+        return False
+    if mois == 2 and annee % 4 == 0 and (annee % 100 != 0 or annee % 400 == 0):
+        return jour <= 29
+    return jour <= _JOURS_PAR_MOIS[mois - 1]
+
+def _dates_valides(annee, mois, jour):
+    """Version vectorisée de _date_valide sur des tableaux numpy d'entiers."""
+    bissextile = (annee % 4 == 0) & ((annee % 100 != 0) | (annee % 400 == 0))
+    jours_max = np.array(_JOURS_PAR_MOIS)[np.clip(mois, 1, 12) - 1] + ((mois == 2) & bissextile)
+    return (annee >= 1) & (mois >= 1) & (mois <= 12) & (jour >= 1) & (jour <= jours_max)
+
+def _extraire(text):
+    for pattern, ((j0, j1), (m0, m1), (a0, a1)) in _formats:
+        match = pattern.search(text)
+        if match is None:
+            continue
+        date = match.group(1)
+        jour, mois, annee = int(date[j0:j1]), int(date[m0:m1]), int(date[a0:a1])
+        if not _date_valide(annee, mois, jour):
+            return None
+        if annee < 1000:
+            # strftime ne complète pas ces années de la même façon selon la plateforme
+            return datetime(annee, mois, jour).strftime('%Y-%m-%d')
+        return f"{annee:04d}-{mois:02d}-{jour:02d}"
+    return None
+
+def configurer(formats_supplementaires=None, taille_cache=None):
+    """(Re)compile les formats et recrée le cache LRU ; appelé à l'import avec les valeurs par défaut."""
+    global _formats, _extraire_cache, FORMATS_SUPPLEMENTAIRES, TAILLE_CACHE
+    if formats_supplementaires is not None:
+        FORMATS_SUPPLEMENTAIRES = list(formats_supplementaires)
+    if taille_cache is not None:
+        TAILLE_CACHE = taille_cache
+    _formats = [compiler_format(fmt) for fmt in FORMATS_BASE + FORMATS_SUPPLEMENTAIRES]
+    _extraire_cache = lru_cache(maxsize=TAILLE_CACHE)(_extraire)
+
+_formats = []
+_extraire_cache = None
+configurer()
+
+def extract_date_from_string(text):
+    """
+    Extrait la première date d'une chaîne en utilisant des motifs courants.
+    Motifs : JJ/MM/AAAA, AAAA-MM-JJ (ou avec heure), puis FORMATS_SUPPLEMENTAIRES.
+    Retourne la date au format AAAA-MM-JJ ou None si non trouvée.
+    """
+    if not isinstance(text, str):
+        return None
+    return _extraire_cache(text)
+
+def _extraire_colonne(textes):
+    """
+    Extraction en colonne sur un tableau pyarrow de chaînes (chiffres ASCII uniquement) :
+    un extract_regex par format, dans l'ordre, sur les textes qu'aucun format précédent
+    n'a reconnus. Retourne un tableau numpy de dates AAAA-MM-JJ ou None, aligné sur textes.
+    """
+    import pyarrow as pa
+    import pyarrow.compute as pc
+
+    resultats = np.full(len(textes), None, dtype=object)
+    restants = np.arange(len(textes))
+    for pattern, ((j0, j1), (m0, m1), (a0, a1)) in _formats:
+        if len(restants) == 0:
+            break
+        extraits = pc.extract_regex(textes.take(restants), '(?P<date>' + pattern.pattern[1:])
+        # Le premier format présent décide, même si la date est invalide
+        trouves = extraits.is_valid().to_numpy(zero_copy_only=False)
+        positions, restants = restants[trouves], restants[~trouves]
+        dates = pc.struct_field(extraits.filter(trouves), 'date')
+        # Chiffres ASCII de largeur fixe : les morceaux extraits sont déjà complétés par des zéros
+        jour, mois, annee = (pc.utf8_slice_codeunits(dates, debut, fin)
+                             for debut, fin in ((j0, j1), (m0, m1), (a0, a1)))
+        jours, mois_, annees = (pc.cast(morceau, pa.int64()).to_numpy() for morceau in (jour, mois, annee))
+        valides = _dates_valides(annees, mois_, jours)
+        textes_dates = pc.binary_join_element_wise(annee, mois, jour, '-').filter(valides).to_numpy(zero_copy_only=False)
+        for i in np.flatnonzero(annees[valides] < 1000):
+            # strftime ne complète pas ces années de la même façon selon la plateforme
+            textes_dates[i] = datetime(*(int(t[valides][i]) for t in (annees, mois_, jours))).strftime('%Y-%m-%d')
+        resultats[positions[valides]] = textes_dates
+    return resultats
+
+def extract_dates_from_series(series):
+    """
+    Version par lot de extract_date_from_string sur toute une colonne : les valeurs
+    distinctes sont analysées une fois, en colonne avec pyarrow (voir _extraire_colonne).
+    Retourne une Series de dates AAAA-MM-JJ (NA si aucune date valide), alignée sur
+    l'index de la colonne d'entrée.
+    """
+    codes, uniques = pd.factorize(series)
+    uniques = np.asarray(uniques, dtype=object)
+    # Seules les chaînes portent une date (comme extract_date_from_string)
+    if isinstance(series.dtype, pd.StringDtype):
+        positions = np.arange(len(uniques))
+    else:
+        positions = np.flatnonzero([isinstance(valeur, str) for valeur in uniques])
+    # Le code -1 (valeur manquante) pointe sur le None ajouté en dernière position
+    resultats = np.full(len(uniques) + 1, None, dtype=object)
+    try:
+        import pyarrow as pa
+        import pyarrow.compute as pc
+    except ImportError:
+        # Sans pyarrow : extraction valeur par valeur (même résultat)
+        pa = None
+    if pa is not None and len(positions):
+        textes = pa.array(uniques[positions], type=pa.string())
+        # Le \d de pyarrow (RE2) ne reconnaît que 0-9 : les textes contenant d'autres
+        # chiffres Unicode passent par extract_date_from_string (moteur re de Python)
+        autres_chiffres = pc.match_substring_regex(textes, r'[^\P{Nd}0-9]').to_numpy(zero_copy_only=False)
+        resultats[positions[~autres_chiffres]] = _extraire_colonne(textes.filter(pa.array(~autres_chiffres)))
+        positions = positions[autres_chiffres]
+    resultats[positions] = [extract_date_from_string(valeur) for valeur in uniques[positions]]
+    result = pd.Series(resultats[codes], index=series.index, dtype=object)
+    return result.where(result.notna(), pd.NA)
+
+def statistiques_cache():
+    """Statistiques du cache LRU (hits, misses, taille)."""
+    return _extraire_cache.cache_info()
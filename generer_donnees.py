@@ -0,0 +1,140 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+
+# Générateur de tables synthétiques (telephones, utilisateurs, modeles_telephones)
+# reproduisant les défauts des exports réels : date_mod manquant, dates cachées
+# dans comment/contact (JJ/MM/AAAA ou AAAA-MM-JJ), doublons, utilisateurs orphelins.
+
+# Proportions des défauts injectés
+profil_defauts = {
+    'date_mod_manquant': 0.30,      # date_mod vide
+    'date_creation_texte': 0.40,    # date_creation exploitable parmi les date_mod manquants
+    'date_dans_comment': 0.50,      # comment contenant une date
+    'date_dans_contact': 0.30,      # contact contenant une date
+    'doublons': 0.02,               # lignes dupliquées à l'identique
+    'users_orphelins': 0.05,        # users_id absents de utilisateurs.csv
+    'non_attribues': 0.10,          # users_id == 0
+}
+
+COMMENT_TEMPLATES = [
+    "Attribué le {date}",
+    "Remis à l'utilisateur le {date} - RAS",
+    "Changement de téléphone {date}",
+    "Retour SAV, réattribué {date}",
+    "Écran remplacé",
+    "",
+]
+CONTACT_TEMPLATES = ["Poste {num}", "Contact RH {date}", "{num}", ""]
+MODELES = ['Samsung Galaxy A14', 'Samsung Galaxy A54', 'iPhone 12', 'iPhone 13', 'Xiaomi Redmi Note 12',
+           'Nokia G21', 'Oppo A78', 'Huawei P30']
+DEBUT = np.datetime64('2015-01-01')
+NB_JOURS = 11 * 365
+
+def _dates(rng, n):
+    return DEBUT + rng.integers(0, NB_JOURS, n).astype('timedelta64[D]')
+
+def _formater(dates, rng):
+    """Formate les dates au hasard en JJ/MM/AAAA ou AAAA-MM-JJ (comme dans les notes saisies)."""
+    iso = pd.Series(np.datetime_as_string(dates, unit='D'))
+    jjmmaaaa = iso.str[8:10] + '/' + iso.str[5:7] + '/' + iso.str[0:4]
+    return iso.where(rng.random(len(iso)) < 0.5, jjmmaaaa)
+
+def _templates(rng, templates, dates, numeros, proportion_date):
+    """Remplit des notes à partir de modèles ; seule une part proportion_date contient une date."""
+    avec_date = [t for t in templates if '{date}' in t]
+    sans_date = [t for t in templates if '{date}' not in t]
+    n = len(dates)
+    choix = np.where(rng.random(n) < proportion_date,
+                     rng.choice(avec_date, n), rng.choice(sans_date, n))
+    texte = pd.Series(choix, dtype=object)
+    dates_txt = _formater(dates, rng)
+    for template in set(choix):
+        mask = texte == template
+        if '{date}' in template:
+            avant, apres = template.split('{date}')
+            texte[mask] = avant + dates_txt[mask] + apres
+        elif '{num}' in template:
+            avant, apres = template.split('{num}')
+            texte[mask] = avant + numeros[mask.to_numpy()] + apres
+    return texte
+
+def generer_telephones(n, nb_utilisateurs, nb_modeles, rng, premier_id=1):
+    """Génère un bloc de n téléphones (ids à partir de premier_id)."""
+    ids = np.arange(premier_id, premier_id + n)
+    dates = _dates(rng, n)
+    date_mod = pd.Series(np.datetime_as_string(dates, unit='s')).str.replace('T', ' ')
+
+    manquant = rng.random(n) < profil_defauts['date_mod_manquant']
+    date_mod[manquant] = ''
+    date_creation = date_mod.copy()
+    creation_texte = manquant & (rng.random(n) < profil_defauts['date_creation_texte'])
+    date_creation[manquant] = ''
+    date_creation[creation_texte] = _formater(dates[creation_texte], rng).to_numpy()
+
+    numeros = pd.Series(rng.integers(100, 9999, n)).astype(str).radd('05 22 00 ').to_numpy()
+    comment = _templates(rng, COMMENT_TEMPLATES, dates, numeros, profil_defauts['date_dans_comment'])
+    contact = _templates(rng, CONTACT_TEMPLATES, dates, numeros, profil_defauts['date_dans_contact'])
+
+    users_id = rng.integers(1, nb_utilisateurs + 1, n)
+    orphelins = rng.random(n) < profil_defauts['users_orphelins']
+    users_id[orphelins] = nb_utilisateurs + rng.integers(1, max(nb_utilisateurs // 10, 2), orphelins.sum())
+    users_id[rng.random(n) < profil_defauts['non_attribues']] = 0
+
+    df = pd.DataFrame({
+        'id': ids,
+        'name': 'TEL-' + pd.Series(ids).astype(str),
+        'serial': pd.Series(rng.integers(10**14, 10**15, n)).astype(str),
+        'date_mod': date_mod,
+        'date_creation': date_creation,
+        'contact': contact,
+        'comment': comment,
+        'users_id': users_id,
+        'states_id': rng.choice([1, 2, 2, 2, 3], n),
+        'phonemodels_id': rng.integers(1, nb_modeles + 1, n),
+    })
+    # Doublons exacts, comme après un double import
+    doublons = df.sample(frac=profil_defauts['doublons'], random_state=int(rng.integers(1 << 31)))
+    return pd.concat([df, doublons]).sort_index(kind='stable')
+
+def generer(output_dir, nb_telephones, nb_utilisateurs=None, nb_modeles=len(MODELES), seed=42, chunksize=1_000_000):
+    """
+    Écrit output_dir/telephones.csv, utilisateurs.csv et modeles_telephones.csv.
+    Les téléphones sont générés et écrits par blocs (jusqu'à des dizaines de millions de lignes).
+    """
+    rng = np.random.default_rng(seed)
+    if nb_utilisateurs is None:
+        nb_utilisateurs = max(nb_telephones // 3, 1)
+    os.makedirs(output_dir, exist_ok=True)
+
+    pd.DataFrame({
+        'utilisateur_id': np.arange(1, nb_utilisateurs + 1),
+        'nom_utilisateur': 'Utilisateur ' + pd.Series(np.arange(1, nb_utilisateurs + 1)).astype(str),
+    }).to_csv(f"{output_dir}/utilisateurs.csv", index=False, encoding='utf-8')
+
+    modeles = pd.DataFrame({
+        'modele_id': np.arange(1, nb_modeles + 1),
+        'nom_modele': [MODELES[i % len(MODELES)] for i in range(nb_modeles)],
+        'date_modification': pd.Series(np.datetime_as_string(_dates(rng, nb_modeles), unit='s')).str.replace('T', ' '),
+    })
+    modeles.loc[rng.random(nb_modeles) < 0.2, 'date_modification'] = ''
+    modeles.to_csv(f"{output_dir}/modeles_telephones.csv", index=False, encoding='utf-8')
+
+    with open(f"{output_dir}/telephones.csv", 'w', encoding='utf-8', newline='') as f:
+        for debut in range(0, nb_telephones, chunksize):
+            n = min(chunksize, nb_telephones - debut)
+            bloc = generer_telephones(n, nb_utilisateurs, nb_modeles, rng, premier_id=debut + 1)
+            bloc.to_csv(f, index=False, header=(debut == 0))
+    print(f"[OK] Données synthétiques générées dans {output_dir}/ ({nb_telephones} téléphones, "
+          f"{nb_utilisateurs} utilisateurs, {nb_modeles} modèles)")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Génère des exports synthétiques pour les tests de performance.")
+    parser.add_argument('--lignes', type=int, default=10000, help="Nombre de téléphones (10k à 50M)")
+    parser.add_argument('--utilisateurs', type=int, default=None, help="Nombre d'utilisateurs (défaut : lignes / 3)")
+    parser.add_argument('--modeles', type=int, default=len(MODELES), help="Nombre de modèles")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--sortie', default="exports", help="Dossier de sortie")
+    args = parser.parse_args()
+    generer(args.sortie, args.lignes, args.utilisateurs, args.modeles, args.seed)
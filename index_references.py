@@ -0,0 +1,150 @@
+import json
+import os
+import numpy as np
+import pandas as pd
+
+import sorties
+
+# Index de référence partagé par les étapes : utilisateurs (id → nom) et
+# modèles (id → date_modification), construit une fois par export et stocké
+# sous forme de tableaux NumPy triés sur des clés entières, chargés en memory-mapping.
+
+INDEX_DIR = "index"
+SOURCES = {
+    'utilisateurs': ('utilisateurs.csv', 'utilisateur_id', 'nom_utilisateur'),
+    'modeles': ('modeles_telephones.csv', 'modele_id', 'date_modification'),
+}
+
+def _signature(path):
+    stat = os.stat(sorties.resoudre(path))
+    return {'taille': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def construire_index(exports_dir="exports"):
+    """Construit (ou reconstruit) l'index à partir des CSV exportés présents dans exports_dir."""
+    index_dir = os.path.join(exports_dir, INDEX_DIR)
+    os.makedirs(index_dir, exist_ok=True)
+    signatures = {}
+    for nom, (fichier, cle, valeur) in SOURCES.items():
+        path = os.path.join(exports_dir, fichier)
+        if not sorties.existe(path):
+            continue
+        signatures[nom] = _signature(path)
+        try:
+            df = pd.read_csv(sorties.resoudre(path), usecols=[cle, valeur], dtype={valeur: str}, encoding='utf-8')
+        except ValueError:
+            print(f"[ERREUR] Colonnes '{cle}' ou '{valeur}' manquantes dans {fichier}")
+            for suffixe in ('id', 'valeur'):
+                if os.path.exists(os.path.join(index_dir, f"{nom}_{suffixe}.npy")):
+                    os.remove(os.path.join(index_dir, f"{nom}_{suffixe}.npy"))
+            continue
+        df[cle] = pd.to_numeric(df[cle], errors='coerce')
+        # Dernière occurrence retenue pour un id dupliqué, comme un dict construit ligne à ligne
+        df = df.dropna(subset=[cle]).drop_duplicates(subset=cle, keep='last').sort_values(cle)
+        np.save(os.path.join(index_dir, f"{nom}_id.npy"), df[cle].astype('int64').to_numpy())
+        np.save(os.path.join(index_dir, f"{nom}_valeur.npy"), df[valeur].fillna('').astype(str).to_numpy(dtype=str))
+    with open(os.path.join(index_dir, "signature.json"), 'w', encoding='utf-8') as f:
+        json.dump(signatures, f, indent=2)
+    print(f"[INDEX] Index de référence construit : {index_dir}/")
+
+def index_a_jour(exports_dir="exports"):
+    """Vrai si l'index existe et correspond aux CSV actuels (taille et date de modification)."""
+    try:
+        with open(os.path.join(exports_dir, INDEX_DIR, "signature.json"), 'r', encoding='utf-8') as f:
+            signatures = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return False
+    for nom, (fichier, _, _) in SOURCES.items():
+        path = os.path.join(exports_dir, fichier)
+        if sorties.existe(path) != (nom in signatures):
+            return False
+        if nom in signatures and signatures[nom] != _signature(path):
+            return False
+    return True
+
+# Clé texte retenue comme entier : écriture décimale sans signe ni zéro de tête (espaces tolérés),
+# soit exactement les chaînes qu'égalait la comparaison de chaînes d'origine ('5' mais pas '5.0')
+MOTIF_ENTIER = r'\s*(?:0|[1-9]\d{0,17})\s*'
+
+def numeriser(cles):
+    """
+    Clés en nombres : NaN pour les valeurs vides et pour les textes qui ne sont pas des
+    entiers stricts ('1e3', '+7', '07' ou '5.0' ne correspondent à aucun id).
+    """
+    cles = pd.Series(cles)
+    if pd.api.types.is_numeric_dtype(cles):
+        return cles
+    texte = cles.astype(str)
+    entiers = texte.str.fullmatch(MOTIF_ENTIER).fillna(False).to_numpy(dtype=bool)
+    # Conversion vectorisée des seules clés valides (les autres passent par '0' puis NaN)
+    nombres = texte.where(entiers, '0').astype('int64')
+    return nombres if entiers.all() else nombres.where(entiers)
+
+class Table:
+    """Table de correspondance id (entier) → valeur, sur des tableaux triés en memory-mapping."""
+
+    def __init__(self, ids, valeurs):
+        self.ids = ids
+        self.valeurs = valeurs
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _positions(self, cles):
+        # Clés non numériques, manquantes ou non entières : jamais trouvées
+        cles = numeriser(cles)
+        entiere = (cles.notna() & (cles % 1 == 0)).to_numpy()
+        cles = cles.where(entiere, -1).astype('int64').to_numpy()
+        positions = np.searchsorted(self.ids, cles).clip(max=max(len(self.ids) - 1, 0))
+        trouve = (self.ids[positions] == cles) & entiere if len(self.ids) else np.zeros(len(cles), dtype=bool)
+        return positions, trouve
+
+    def contient(self, cles):
+        """Masque booléen : quelles clés (entières) sont présentes dans la table."""
+        return self._positions(cles)[1]
+
+    def __contains__(self, cle):
+        return bool(self.contient([cle])[0])
+
+    def valeurs_pour(self, cles, defaut=None):
+        """Valeurs associées aux clés entières (defaut pour les clés absentes, '' pour une valeur vide)."""
+        positions, trouve = self._positions(cles)
+        resultat = np.full(len(positions), defaut, dtype=object)
+        if len(self.ids):
+            resultat[trouve] = self.valeurs[positions[trouve]]
+        return resultat
+
+    def get(self, cle, defaut=None):
+        """Accès unitaire, compatible avec l'usage d'un dict."""
+        return self.valeurs_pour([cle], defaut)[0]
+
+    def to_dict(self):
+        return dict(zip(self.ids.tolist(), self.valeurs.tolist()))
+
+def cles_modifiees(avant, apres):
+    """
+    Clés ajoutées, retirées ou dont la valeur a changé entre deux Tables (None : table absente),
+    sous forme de tableau trié d'entiers.
+    """
+    series = [pd.Series(np.asarray(table.valeurs), index=np.asarray(table.ids)) if table is not None
+              else pd.Series(dtype=str) for table in (avant, apres)]
+    cles = series[0].index.union(series[1].index)
+    valeurs_avant, valeurs_apres = (serie.reindex(cles) for serie in series)
+    identiques = (valeurs_avant == valeurs_apres) | (valeurs_avant.isna() & valeurs_apres.isna())
+    return cles[~identiques.to_numpy()].to_numpy(dtype='int64')
+
+def _charger_table(index_dir, nom):
+    ids_path = os.path.join(index_dir, f"{nom}_id.npy")
+    if not os.path.exists(ids_path):
+        return None
+    return Table(np.load(ids_path, mmap_mode='r'),
+                 np.load(os.path.join(index_dir, f"{nom}_valeur.npy"), mmap_mode='r'))
+
+def charger_index(exports_dir="exports"):
+    """
+    Charge l'index (reconstruit au préalable s'il manque ou n'est plus à jour).
+    Retourne {'utilisateurs': Table | None, 'modeles': Table | None}.
+    """
+    if not index_a_jour(exports_dir):
+        construire_index(exports_dir)
+    index_dir = os.path.join(exports_dir, INDEX_DIR)
+    return {nom: _charger_table(index_dir, nom) for nom in SOURCES}
@@ -1,107 +1,327 @@
-import subprocess
-import sys
-import os
-
-def run_script(script_name):
-    """Exécute un script Python et vérifie s'il s'est terminé avec succès.
-    Utilise l'encodage cp1252 pour éviter les erreurs sur Windows (caractères accentués).
-    """
-    print(f"Exécution de {script_name}...")
-    try:
-        result = subprocess.run(
-            [sys.executable, script_name],
-            capture_output=True,
-            text=True,
-            encoding='cp1252',
-            errors='replace'
-        )
-    except Exception as e:
-        print(f"Erreur critique lors de l'exécution de {script_name} : {e}")
-        sys.exit(1)
-
-    if result.returncode == 0:
-        print(f"{script_name} exécuté avec succès.")
-        output = result.stdout.strip()
-        if output:
-            print("Sortie :")
-            print(output)
-    else:
-        print(f"Erreur lors de l'exécution de {script_name} :")
-        print(result.stderr)
-        sys.exit(1)
-
-def check_file_exists(filepath):
-    """Vérifie si un fichier existe, sinon quitte avec erreur."""
-    if not os.path.exists(filepath):
-        print(f"Fichier attendu introuvable : {filepath}")
-        sys.exit(1)
-    else:
-        print(f"Fichier trouvé : {filepath}")
-
-def main():
-    print("[INFO] Lancement du workflow complet :")
-    print("   Transformer -> Cleaner -> Filter -> Détecter Remplacements Anticipés")
-    print("   (Projet Power BI - Gestion des téléphones - Résidences Dar Saada)")
-
-    # Étape 1 : Transformer (Export MySQL -> CSV)
-    print("ÉTAPE 1 : Export des données depuis MySQL")
-    run_script("transformer.py")
-    check_file_exists("exports/telephones.csv")
-    check_file_exists("exports/utilisateurs.csv")
-    check_file_exists("exports/modeles_telephones.csv")
-
-    # Étape 2 : Cleaner (Nettoyage + Filtrage)
-    print("ÉTAPE 2 : Nettoyage et filtrage des données")
-    run_script("cleaner.py")
-    check_file_exists("cleaned_telephones.csv")
-    check_file_exists("isolated_telephones.csv")
-    check_file_exists("cleaned_telephones_filtered.csv")
-
-    # Étape 3 : Détection des remplacements anticipés
-    print("ÉTAPE 3 : Détection des remplacements anticipés (< 2 ans)")
-    run_script("detecter_remplacements_anticipes.py")
-    check_file_exists("remplacements_anticipes.csv")
-    check_file_exists("utilisateurs_multi_remplacements.csv")
-
-    # Résumé final
-    print("WORKFLOW TERMINÉ AVEC SUCCÈS !")
-
-    # Compter les lignes pour afficher un résumé quantitatif
-    def count_lines(filename):
-        try:
-            with open(filename, 'r', encoding='utf-8') as f:
-                return sum(1 for line in f) - 1  # -1 pour l'en-tête
-        except:
-            return 0
-
-    total_remplacements = count_lines("remplacements_anticipes.csv")
-    total_utilisateurs = count_lines("utilisateurs_multi_remplacements.csv")
-
-    print("RÉSUMÉ DES RÉSULTATS :")
-    print(f"   - Remplacements anticipés détectés : {total_remplacements}")
-    print(f"   - Utilisateurs concernés : {total_utilisateurs}")
-
-    print("Fichiers générés :")
-
-    print("Phase 1 - Export brut :")
-    print("   - exports/telephones.csv")
-    print("   - exports/utilisateurs.csv")
-    print("   - exports/modeles_telephones.csv")
-
-    print("Phase 2 - Nettoyage & Filtrage :")
-    print("   - cleaned_telephones.csv (tous les téléphones nettoyés)")
-    print("   - isolated_telephones.csv (users_id=0 & states_id=2)")
-    print("   - cleaned_telephones_filtered.csv (seulement utilisateurs valides)")
-
-    print("Phase 3 - Analyse métier (conforme Page 3 du rapport) :")
-    print("   - remplacements_anticipes.csv - Détail des attributions < 2 ans")
-    print("   - utilisateurs_multi_remplacements.csv - Top utilisateurs avec plusieurs remplacements")
-
-    print("Prochaine étape :")
-    print("   Importer ces fichiers dans Power BI pour recréer le rapport décrit dans le stage :")
-    print("   - Page 1 : Stock & Attribution")
-    print("   - Page 2 : Top utilisateurs & modèles")
-    print("   - Page 3 : Remplacements anticipés & multi-attributions")
-
-if __name__ == "__main__":
+import json
+import sys
+import os
+import time
+
+import metriques
+import sorties
+
+# cleaner, transformer et le détecteur (pandas, SQLAlchemy) sont importés dans les étapes :
+# importer main (ex. pipeline.py validate pour lire le DAG) reste instantané.
+
+PIPELINE_STATE_FILE = ".pipeline_state.json"
+
+def check_file_exists(filepath):
+    """Vérifie une sortie via le manifeste (présente, complète, non modifiée), sinon quitte avec erreur."""
+    raison = sorties.valider(filepath)
+    if raison is not None:
+        print(f"Fichier attendu invalide : {filepath} ({raison})")
+        sys.exit(1)
+    else:
+        print(f"Fichier trouvé : {filepath} ({sorties.lignes(filepath)} lignes)")
+
+# Étapes du workflow (exécutées dans le même processus)
+# Chaque étape lit/écrit le contexte partagé `ctx` : les DataFrames produits passent
+# en mémoire à l'étape suivante, les fichiers de sortie restent les livrables Power BI.
+
+def etape_export(ctx):
+    import transformer
+    transformer.export_mysql_to_csv(incremental=ctx.get('incremental', False))
+
+def etape_qualite(ctx):
+    import qualite
+    _, bloquant = qualite.controler_exports()
+    if bloquant:
+        print("[ERREUR] Contrôle qualité bloquant en échec (voir controle_qualite.csv).")
+        sys.exit(1)
+
+def etape_nettoyage(ctx):
+    import cleaner
+    cleaned_df, isolated_df = cleaner.clean_dataset("exports/telephones.csv", "cleaned_telephones.csv",
+                                                    "isolated_telephones.csv")
+    if cleaned_df is None:
+        print("[ERREUR] Échec du nettoyage.")
+        sys.exit(1)
+    ctx['cleaned_df'] = cleaned_df
+
+def etape_filtrage(ctx):
+    import cleaner
+    user_ids = cleaner.load_users("exports/utilisateurs.csv")
+    if user_ids is None:
+        print("[ERREUR] Impossible de charger les utilisateur_id.")
+        sys.exit(1)
+    if 'cleaned_df' not in ctx:
+        # Nettoyage sauté : le fichier nettoyé sur disque est à jour (filtrage en streaming)
+        cleaner.filter_telephones("cleaned_telephones.csv", "cleaned_telephones_filtered.csv", user_ids,
+                                  "rejected_telephones.csv")
+        return
+    filtered_df, rejected_df = cleaner.separer_dataframe(ctx['cleaned_df'], user_ids)
+    cleaner.ecrire_filtrage(filtered_df, rejected_df, "cleaned_telephones_filtered.csv", "rejected_telephones.csv")
+    ctx['filtered_df'] = filtered_df
+
+def etape_detection(ctx):
+    import pandas as pd
+
+    import detecter_remplacements_anticipes as detecteur
+    if ctx.get('incremental'):
+        # Mise à jour depuis l'état du dernier run pour les seuls utilisateurs modifiés
+        # (exports/utilisateurs_modifies.csv) ; calcul complet si l'état ou ce fichier manque
+        detecteur.main(True, *detecteur.lire_options_analyse(sys.argv))
+        return
+    user_map = detecteur.load_users("exports/utilisateurs.csv")
+    if user_map is None:
+        sys.exit(1)
+    if 'filtered_df' in ctx:
+        df = ctx['filtered_df'].copy()
+        df['date_mod'] = pd.to_datetime(df['date_mod'], errors='coerce')
+    else:
+        df = detecteur.load_data("cleaned_telephones_filtered.csv")
+        if df is None:
+            sys.exit(1)
+    # Un seul tri pour la détection (seuil de 2 ans) et l'analyse multi-seuils
+    triees = detecteur.trier_attributions(df)
+    remplacements_df, utilisateurs_df = detecteur.detecter_remplacements_anticipes(
+        triees, user_map, detecteur.SEUIL_ANNEES, deja_trie=True)
+    analyse_df = detecteur.analyser_remplacements(triees, *detecteur.lire_options_analyse(sys.argv), deja_trie=True)
+    detecteur.sauvegarder_resultats(remplacements_df, utilisateurs_df)
+    detecteur.sauvegarder_analyse(analyse_df)
+    # État par utilisateur, point de départ des détections incrémentales suivantes
+    detecteur.sauvegarder_etat(detecteur.construire_etat(triees, remplacements_df))
+    ctx['remplacements_df'] = remplacements_df
+    ctx['utilisateurs_df'] = utilisateurs_df
+
+# DAG des étapes : entrées/sorties déclarées. Une étape est sautée si le contenu
+# de ses entrées et ses options (voir options_effectives) n'ont pas changé depuis le
+# dernier run et que ses sorties sont valides (empreintes et validité lues dans le
+# manifeste des sorties, voir sorties.py).
+ETAPES = [
+    {
+        'nom': 'export',
+        'titre': "ÉTAPE 1 : Export des données depuis MySQL",
+        'fonction': etape_export,
+        'entrees': [],  # Base MySQL : toujours exécutée
+        'options': ['incremental'],
+        'sorties': ["exports/telephones.csv", "exports/utilisateurs.csv", "exports/modeles_telephones.csv"],
+    },
+    {
+        'nom': 'qualite',
+        'titre': "ÉTAPE 2 : Contrôle qualité des exports",
+        'fonction': etape_qualite,
+        'entrees': ["exports/telephones.csv", "exports/utilisateurs.csv", "exports/modeles_telephones.csv"],
+        'options': ['compression', 'etats'],
+        'sorties': ["controle_qualite.csv", "quarantaine_utilisateurs.csv", "quarantaine_modeles_telephones.csv",
+                    "quarantaine_telephones.csv"],
+    },
+    {
+        'nom': 'nettoyage',
+        'resultat': 'cleaned_df',
+        'titre': "ÉTAPE 3 : Nettoyage des données",
+        'fonction': etape_nettoyage,
+        'entrees': ["exports/telephones.csv", "exports/modeles_telephones.csv"],
+        'options': ['format', 'compression', 'doublons'],
+        'sorties': ["cleaned_telephones.csv", "isolated_telephones.csv"],
+    },
+    {
+        'nom': 'filtrage',
+        'resultat': 'filtered_df',
+        'titre': "ÉTAPE 4 : Filtrage par utilisateurs valides",
+        'fonction': etape_filtrage,
+        'entrees': ["cleaned_telephones.csv", "exports/utilisateurs.csv"],
+        'options': ['format', 'compression'],
+        'sorties': ["cleaned_telephones_filtered.csv", "rejected_telephones.csv"],
+    },
+    {
+        'nom': 'detection',
+        'resultat': 'remplacements_df',
+        'titre': "ÉTAPE 5 : Détection des remplacements anticipés (< 2 ans)",
+        'fonction': etape_detection,
+        'entrees': ["cleaned_telephones_filtered.csv", "exports/utilisateurs.csv"],
+        'options': ['format', 'compression', 'seuils', 'fenetres', 'incremental'],
+        'sorties': ["remplacements_anticipes.csv", "utilisateurs_multi_remplacements.csv", "analyse_remplacements.csv"],
+    },
+]
+
+def etape_parallele(ctx):
+    import detecter_remplacements_anticipes as detecteur
+    import parallele  # pyarrow n'est requis qu'en mode parallèle
+    seuils_annees, fenetres = detecteur.lire_options_analyse(sys.argv)
+    if ctx.get('incremental'):
+        print("[INFO] Mode parallèle : la détection est recalculée en entier (seul l'export est incrémental).")
+    cleaned_df, filtered_df, remplacements_df, utilisateurs_df = parallele.executer_en_parallele(
+        nb_processus=ctx.get('nb_processus'), seuils_analyse=seuils_annees, fenetres_analyse=fenetres)
+    ctx.update(cleaned_df=cleaned_df, filtered_df=filtered_df,
+               remplacements_df=remplacements_df, utilisateurs_df=utilisateurs_df)
+
+# Variante multi-processus : nettoyage, filtrage et détection en une étape partitionnée par users_id
+ETAPES_PARALLELES = [
+    ETAPES[0],
+    ETAPES[1],
+    {
+        'nom': 'traitement_parallele',
+        'resultat': 'remplacements_df',
+        'titre': "ÉTAPE 3 : Nettoyage, filtrage et détection en parallèle",
+        'fonction': etape_parallele,
+        'entrees': ["exports/telephones.csv", "exports/modeles_telephones.csv", "exports/utilisateurs.csv"],
+        'options': ['format', 'compression', 'doublons', 'seuils', 'fenetres'],
+        'sorties': ETAPES[2]['sorties'] + ETAPES[3]['sorties'] + ETAPES[4]['sorties'],
+    },
+]
+
+def load_pipeline_state():
+    try:
+        with open(PIPELINE_STATE_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def save_pipeline_state(state):
+    with open(PIPELINE_STATE_FILE, 'w', encoding='utf-8') as f:
+        json.dump(state, f, indent=2)
+
+def options_effectives():
+    """
+    Valeurs effectives des options de ligne de commande et de la configuration dont dépendent
+    les sorties (format intermédiaire, compression, règles de doublons, états attendus, seuils
+    et fenêtres de l'analyse, mode incrémental), sous leur forme JSON pour être comparées à l'état enregistré.
+    """
+    import dedoublonnage
+    import detecter_remplacements_anticipes as detecteur
+    import stockage
+    seuils_annees, fenetres = detecteur.lire_options_analyse(sys.argv)
+    return json.loads(json.dumps({
+        'format': stockage.format_intermediaire(),
+        'compression': sorties.compression_configuree(),
+        'doublons': [regle['nom'] for regle in dedoublonnage.regles_actives()],
+        'etats': os.environ.get('PIPELINE_ETATS') or None,
+        'seuils': seuils_annees,
+        'fenetres': fenetres,
+        'incremental': '--incremental' in sys.argv,
+    }))
+
+def run_pipeline(etapes=ETAPES, force=False, nb_processus=None, incremental=False):
+    """
+    Exécute les étapes dans l'ordre du DAG, dans le processus courant
+    (sauf l'étape parallèle, qui répartit son travail sur nb_processus processus).
+    En mode incrémental, l'export ne relit que les lignes modifiées depuis le dernier
+    export et la détection ne recalcule que les utilisateurs concernés.
+    Retourne le contexte (DataFrames produits) et les durées par étape.
+    """
+    state = load_pipeline_state()
+    options = options_effectives()
+    ctx = {'nb_processus': nb_processus, 'incremental': incremental}
+    durees = {}
+    for etape in etapes:
+        print(etape['titre'])
+        entrees = {path: sorties.empreinte(path) for path in etape['entrees'] if sorties.existe(path)}
+        empreinte = {'entrees': entrees, 'options': {nom: options[nom] for nom in etape.get('options', [])}}
+        precedente = state.get(etape['nom']) or {}
+        inchangee = (bool(etape['entrees']) and len(entrees) == len(etape['entrees'])
+                     and precedente == empreinte
+                     and all(sorties.valider(path) is None for path in etape['sorties']))
+        if inchangee and not force:
+            print(f"[SKIP] {etape['nom']} : entrées et options inchangées depuis le dernier run.")
+            durees[etape['nom']] = None
+            continue
+        modifiees = [nom for nom, valeur in empreinte['options'].items()
+                     if 'options' in precedente and precedente['options'].get(nom) != valeur]
+        if modifiees:
+            print(f"[INFO] {etape['nom']} : options modifiées depuis le dernier run ({', '.join(modifiees)}).")
+
+        start = time.perf_counter()
+        with metriques.mesurer(etape['nom']) as mesure:
+            etape['fonction'](ctx)
+            if etape.get('resultat') in ctx:
+                mesure['lignes_sortie'] = len(ctx[etape['resultat']])
+        durees[etape['nom']] = time.perf_counter() - start
+        for path in etape['sorties']:
+            check_file_exists(path)
+        state[etape['nom']] = empreinte
+        save_pipeline_state(state)
+        print(f"[TEMPS] {etape['nom']} : {durees[etape['nom']]:.2f} s")
+    return ctx, durees
+
+def main():
+    print("[INFO] Lancement du workflow complet :")
+    print("   Transformer -> Qualité -> Cleaner -> Filter -> Détecter Remplacements Anticipés")
+    print("   (Projet Power BI - Gestion des téléphones - Résidences Dar Saada)")
+    print(f"   Format intermédiaire : {os.environ.get('PIPELINE_FORMAT', 'csv')} (variable PIPELINE_FORMAT)")
+    print(f"   Compression des sorties : {sorties.compression_configuree() or 'aucune'} (variable PIPELINE_COMPRESSION)")
+    print(f"   États attendus (states_id) : {os.environ.get('PIPELINE_ETATS') or 'non contrôlés'} (variable PIPELINE_ETATS)")
+    print(f"   Mode : {'incrémental' if '--incremental' in sys.argv else 'complet'} (option --incremental)")
+
+    # Instrumentation optionnelle : --tracemalloc (pic d'allocations par étape), --profile (dump cProfile)
+    if '--tracemalloc' in sys.argv:
+        metriques.activer_tracemalloc()
+    profiler = None
+    if '--profile' in sys.argv:
+        import cProfile
+        profiler = cProfile.Profile()
+
+    start = time.perf_counter()
+    if profiler is not None:
+        profiler.enable()
+    nb_processus = None
+    if '--processus' in sys.argv:
+        nb_processus = int(sys.argv[sys.argv.index('--processus') + 1])
+    etapes = ETAPES if nb_processus is None else ETAPES_PARALLELES
+    ctx, durees = run_pipeline(etapes, force='--force' in sys.argv, nb_processus=nb_processus,
+                               incremental='--incremental' in sys.argv)
+    if profiler is not None:
+        profiler.disable()
+        profiler.dump_stats("pipeline.prof")
+        print("[METRIQUES] Profil cProfile écrit : pipeline.prof")
+        import pstats
+        pstats.Stats(profiler).sort_stats('cumulative').print_stats(15)
+    metriques.ecrire_rapport("run_report.json",
+                             duree_totale_s=round(time.perf_counter() - start, 4),
+                             etapes_sautees=[nom for nom, duree in durees.items() if duree is None])
+
+    # Résumé final
+    print("WORKFLOW TERMINÉ AVEC SUCCÈS !")
+
+    # Compter les lignes pour afficher un résumé quantitatif (lu dans le manifeste des sorties)
+    if 'remplacements_df' in ctx:
+        total_remplacements = len(ctx['remplacements_df'])
+        total_utilisateurs = len(ctx['utilisateurs_df'])
+    else:
+        total_remplacements = sorties.lignes("remplacements_anticipes.csv") or 0
+        total_utilisateurs = sorties.lignes("utilisateurs_multi_remplacements.csv") or 0
+
+    print("RÉSUMÉ DES RÉSULTATS :")
+    print(f"   - Remplacements anticipés détectés : {total_remplacements}")
+    print(f"   - Utilisateurs concernés : {total_utilisateurs}")
+
+    print("DURÉE PAR ÉTAPE :")
+    for nom, duree in durees.items():
+        print(f"   - {nom} : " + ("sautée (entrées inchangées)" if duree is None else f"{duree:.2f} s"))
+
+    print("Fichiers générés :")
+
+    print("Phase 1 - Export brut :")
+    print("   - exports/telephones.csv")
+    print("   - exports/utilisateurs.csv")
+    print("   - exports/modeles_telephones.csv")
+    print("   - controle_qualite.csv (résultat de chaque règle qualité sur les exports)")
+    print("   - quarantaine_*.csv (lignes exportées en violation d'une règle, avec les règles enfreintes)")
+
+    print("Phase 2 - Nettoyage & Filtrage :")
+    print("   - cleaned_telephones.csv (tous les téléphones nettoyés)")
+    print("   - isolated_telephones.csv (users_id=0 & states_id=2)")
+    print("   - cleaned_telephones_filtered.csv (seulement utilisateurs valides)")
+    print("   - rejected_telephones.csv (téléphones écartés, avec le motif du rejet)")
+
+    print("Phase 3 - Analyse métier (conforme Page 3 du rapport) :")
+    print("   - remplacements_anticipes.csv - Détail des attributions < 2 ans")
+    print("   - utilisateurs_multi_remplacements.csv - Top utilisateurs avec plusieurs remplacements")
+    print("   - analyse_remplacements.csv - Seuils 1/2/3 ans et fenêtres glissantes (format long)")
+    print("   - .manifeste.json - Lignes, taille, SHA-256 et schéma de chaque fichier produit")
+
+    print("Prochaine étape :")
+    print("   Importer ces fichiers dans Power BI pour recréer le rapport décrit dans le stage :")
+    print("   - Page 1 : Stock & Attribution")
+    print("   - Page 2 : Top utilisateurs & modèles")
+    print("   - Page 3 : Remplacements anticipés & multi-attributions")
+    print("   Ou interroger les agrégats de ces pages via le service local : python service_requetes.py")
+
+if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,192 @@
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+
+try:
+    import resource
+except ImportError:  # Windows : pas de RSS max disponible sans dépendance externe
+    resource = None
+
+try:
+    import psutil
+except ImportError:  # RSS lue dans /proc (Linux) ; ailleurs, pic par étape indisponible sans psutil
+    psutil = None
+
+# Mesures collectées pendant le run (une entrée par étape ou sous-étape)
+_mesures = []
+# Pile des étapes en cours : propre à chaque thread et à chaque tâche asyncio
+_pile = contextvars.ContextVar('pile_mesures', default=())
+_verrou = threading.Lock()
+
+# Pic RSS propre à chaque étape : un thread relève la RSS du processus et celle de ses
+# processus enfants (workers du mode parallèle) toutes les INTERVALLE_RSS_S secondes,
+# tant qu'au moins une étape est en cours
+INTERVALLE_RSS_S = 0.05
+_actives = []
+_echantillonneur = {'pid': None}
+_PAGE = os.sysconf('SC_PAGE_SIZE') if hasattr(os, 'sysconf') else 4096
+
+def rss_mo(pid=None):
+    """Mémoire résidente actuelle du processus pid (défaut : courant), en Mo (None si indisponible)."""
+    pid = pid or os.getpid()
+    if psutil is not None:
+        try:
+            return psutil.Process(pid).memory_info().rss / (1024 * 1024)
+        except psutil.Error:
+            return None
+    try:
+        with open(f"/proc/{pid}/statm", 'r') as f:
+            return int(f.read().split()[1]) * _PAGE / (1024 * 1024)
+    except (OSError, ValueError, IndexError):
+        return None
+
+def _enfants():
+    """pid des processus enfants (et petits-enfants) du processus courant."""
+    if psutil is not None:
+        try:
+            return [enfant.pid for enfant in psutil.Process().children(recursive=True)]
+        except psutil.Error:
+            return []
+    # Enfants directs de chaque thread dans /proc/<pid>/task/<tid>/children (Linux 3.5+) :
+    # pas de parcours de tout /proc à chaque relevé
+    enfants, a_visiter = [], [os.getpid()]
+    while a_visiter:
+        pid = a_visiter.pop()
+        try:
+            taches = os.listdir(f"/proc/{pid}/task")
+        except OSError:
+            continue
+        for tache in taches:
+            try:
+                with open(f"/proc/{pid}/task/{tache}/children", 'r') as f:
+                    directs = [int(enfant) for enfant in f.read().split()]
+            except (OSError, ValueError):
+                continue
+            enfants.extend(directs)
+            a_visiter.extend(directs)
+    return enfants
+
+def rss_pic_enfants_mo():
+    """Pic de RSS du plus gros processus enfant terminé (RUSAGE_CHILDREN), en Mo (None si indisponible)."""
+    if resource is None:
+        return None
+    pic = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    # ru_maxrss est en octets sous macOS, en Ko ailleurs
+    return pic / (1024 * 1024 if sys.platform == 'darwin' else 1024)
+
+def _relever(mesures):
+    """Met à jour les pics RSS (processus, enfants cumulés) des mesures en cours."""
+    soi = rss_mo()
+    enfants = [rss_mo(pid) for pid in _enfants()]
+    enfants = sum(rss for rss in enfants if rss is not None) if enfants else None
+    with _verrou:
+        for mesure in mesures:
+            if soi is not None:
+                mesure['_rss'] = max(mesure.get('_rss') or 0, soi)
+            if enfants is not None:
+                mesure['_rss_enfants'] = max(mesure.get('_rss_enfants') or 0, enfants)
+
+def _echantillonner():
+    while True:
+        time.sleep(INTERVALLE_RSS_S)
+        with _verrou:
+            mesures = list(_actives)
+        if mesures:
+            _relever(mesures)
+
+def _demarrer_echantillonneur():
+    # Un thread par processus (un processus enfant créé par fork n'hérite pas du thread)
+    if _echantillonneur['pid'] != os.getpid():
+        _echantillonneur['pid'] = os.getpid()
+        _actives.clear()
+        threading.Thread(target=_echantillonner, name='metriques-rss', daemon=True).start()
+
+def activer_tracemalloc():
+    """Active le suivi des allocations Python : chaque mesure enregistre alors son pic."""
+    if not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+@contextmanager
+def mesurer(etape, lignes_entree=None):
+    """
+    Mesure une étape (ou sous-étape si imbriquée) : durée, lignes en entrée/sortie, pic RSS
+    du processus pendant l'étape, pic RSS cumulé de ses processus enfants (workers) pendant
+    l'étape et, si tracemalloc est actif, pic d'allocations Python.
+    L'appelant renseigne mesure['lignes_sortie'] dans le bloc.
+    """
+    pile = _pile.get()
+    parent = pile[-1] if pile else None
+    mesure = {
+        'etape': etape if parent is None else f"{parent['etape']}/{etape}",
+        'lignes_entree': None if lignes_entree is None else int(lignes_entree),
+        'lignes_sortie': None,
+        'duree_s': None,
+        'rss_pic_mo': None,
+        'rss_pic_enfants_mo': None,
+        'python_pic_mo': None,
+        'debut': datetime.now().isoformat(timespec='seconds'),
+    }
+    suivi = tracemalloc.is_tracing()
+    if suivi:
+        # Conserver le pic du parent avant de repartir de zéro pour la sous-étape
+        if parent is not None:
+            parent['_pic'] = max(parent.get('_pic', 0), tracemalloc.get_traced_memory()[1])
+        tracemalloc.reset_peak()
+    jeton = _pile.set(pile + (mesure,))
+    _demarrer_echantillonneur()
+    enfants_avant = rss_pic_enfants_mo()
+    _relever([mesure])
+    with _verrou:
+        _actives.append(mesure)
+    start = time.perf_counter()
+    try:
+        yield mesure
+    finally:
+        mesure['duree_s'] = round(time.perf_counter() - start, 4)
+        with _verrou:
+            _actives[:] = [active for active in _actives if active is not mesure]
+        _relever([mesure])
+        rss, rss_enfants = mesure.pop('_rss', None), mesure.pop('_rss_enfants', None)
+        # Workers terminés entre deux relevés : leur pic est connu via RUSAGE_CHILDREN
+        enfants_apres = rss_pic_enfants_mo()
+        if enfants_apres is not None and enfants_avant is not None and enfants_apres > enfants_avant:
+            rss_enfants = max(rss_enfants or 0, enfants_apres)
+        mesure['rss_pic_mo'] = None if rss is None else round(rss, 1)
+        mesure['rss_pic_enfants_mo'] = None if rss_enfants is None else round(rss_enfants, 1)
+        if mesure['lignes_sortie'] is not None:
+            mesure['lignes_sortie'] = int(mesure['lignes_sortie'])
+        if suivi:
+            pic = max(mesure.pop('_pic', 0), tracemalloc.get_traced_memory()[1])
+            mesure['python_pic_mo'] = round(pic / (1024 * 1024), 1)
+            if parent is not None:
+                parent['_pic'] = max(parent.get('_pic', 0), pic)
+        _pile.reset(jeton)
+        with _verrou:
+            _mesures.append(mesure)
+
+def mesurer_si(actif, etape, lignes_entree=None):
+    """Comme mesurer, mais sans rien enregistrer si actif est faux (ex. traitement bloc par bloc)."""
+    return mesurer(etape, lignes_entree) if actif else nullcontext({})
+
+def mesures():
+    """Retourne une copie des mesures collectées, dans l'ordre de fin d'exécution."""
+    with _verrou:
+        return list(_mesures)
+
+def reinitialiser():
+    with _verrou:
+        _mesures.clear()
+
+def ecrire_rapport(path='run_report.json', **infos):
+    """Écrit le rapport JSON du run (mesures + informations libres, ex. durée totale)."""
+    rapport = {'date': datetime.now().isoformat(timespec='seconds'), **infos, 'etapes': mesures()}
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(rapport, f, indent=2, ensure_ascii=False)
+    print(f"[METRIQUES] Rapport du run écrit : {path}")
+    return rapport
@@ -0,0 +1,189 @@
+import argparse
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import pandas as pd
+import pyarrow as pa
+
+import cleaner
+import dedoublonnage
+import detecter_remplacements_anticipes as detecteur
+import index_references
+import metriques
+import sorties
+import stockage
+
+# Exécution multi-processus du nettoyage, du filtrage et de la détection.
+# La table telephones est partitionnée par hash de users_id : les doublons selon une règle
+# dont la clé contient users_id et l'historique d'un utilisateur tombent donc toujours dans
+# la même partition (les autres règles de doublons sont appliquées avant le partitionnement).
+# Les partitions et les résultats transitent par des fichiers Arrow IPC lus en
+# memory-mapping (dans /dev/shm quand il existe), sans sérialisation pickle des DataFrames.
+
+POSITION = '_position'  # Ordre d'origine des lignes, pour une fusion déterministe
+
+def _dossier_partage():
+    return '/dev/shm' if os.path.isdir('/dev/shm') else None
+
+def _ecrire_arrow(df, path):
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    with pa.OSFile(path, 'wb') as sink, pa.ipc.new_file(sink, table.schema) as writer:
+        writer.write_table(table)
+
+def _lire_arrow(path):
+    with pa.memory_map(path, 'r') as source:
+        return pa.ipc.open_file(source).read_all().to_pandas()
+
+def partitionner(df, nb_partitions):
+    """Numéro de partition de chaque ligne (hash de users_id, stable d'un run à l'autre)."""
+    hashes = pd.util.hash_pandas_object(df['users_id'].astype('string'), index=False)
+    return (hashes % nb_partitions).to_numpy()
+
+def traiter_partition(partition_path, utilisateurs_path, modeles_path, seuil_annees, seuils_analyse, fenetres_analyse,
+                      regles_doublons):
+    """
+    Traite une partition dans un processus fils : doublons (regles_doublons), date_mod, isolement,
+    filtrage, détection, analyse multi-seuils et état par utilisateur. Écrit ses résultats
+    en Arrow à côté de la partition. Retourne (chemins des lignes nettoyées, des remplacements,
+    de l'analyse et de l'état, compteurs).
+    """
+    df = _lire_arrow(partition_path)
+    colonnes = [c for c in df.columns if c != POSITION]
+
+    df, doublons = dedoublonnage.dedoublonner(df, regles_doublons, ignorees=[POSITION], verbose=False)
+    df = df.copy()
+    counts = cleaner.fill_date_mod(df, cleaner.load_modeles_dates(modeles_path), verbose=False)
+    counts = {source: int(n) for source, n in counts.items()}
+    counts['doublons'] = doublons
+
+    # Mêmes règles que clean_dataset et filter_telephones / filter_dataframe
+    df['_isole'] = ((df['users_id'] == 0) & (df['states_id'] == 2)).fillna(False)
+    user_ids = cleaner.load_users(utilisateurs_path)
+    df['_filtre'] = user_ids.contient(df['users_id'])
+
+    filtered_df = df.loc[df['_filtre'], colonnes].copy()
+    filtered_df['date_mod'] = pd.to_datetime(filtered_df['date_mod'], errors='coerce')
+    triees = detecteur.trier_attributions(filtered_df)
+    remplacements_df, _ = detecteur.detecter_remplacements_anticipes(
+        triees, detecteur.load_users(utilisateurs_path), seuil_annees, deja_trie=True)
+    analyse_df = detecteur.analyser_remplacements(triees, seuils_analyse, fenetres_analyse, deja_trie=True)
+    etat = detecteur.construire_etat(triees, remplacements_df)
+
+    cleaned_path = partition_path + '.cleaned.arrow'
+    remplacements_path = partition_path + '.remplacements.arrow'
+    analyse_path = partition_path + '.analyse.arrow'
+    etat_path = partition_path + '.etat.arrow'
+    _ecrire_arrow(df, cleaned_path)
+    _ecrire_arrow(remplacements_df, remplacements_path)
+    _ecrire_arrow(analyse_df, analyse_path)
+    _ecrire_arrow(etat, etat_path)
+    return cleaned_path, remplacements_path, analyse_path, etat_path, counts
+
+def executer_en_parallele(file_path="exports/telephones.csv", utilisateurs_path="exports/utilisateurs.csv",
+                          modeles_path="exports/modeles_telephones.csv",
+                          output_cleaned_path="cleaned_telephones.csv",
+                          output_isolated_path="isolated_telephones.csv",
+                          output_filtered_path="cleaned_telephones_filtered.csv",
+                          output_rejected_path="rejected_telephones.csv",
+                          nb_processus=None, seuil_annees=detecteur.SEUIL_ANNEES,
+                          seuils_analyse=None, fenetres_analyse=None):
+    """
+    Équivalent parallèle de clean_dataset + filter_telephones + detecter_remplacements_anticipes
+    + analyser_remplacements.
+    Les fichiers produits sont identiques à ceux du chemin séquentiel.
+    Retourne (cleaned_df, filtered_df, remplacements_df, utilisateurs_df).
+    """
+    nb_processus = nb_processus or os.cpu_count() or 1
+    # Index de référence construit ici, une seule fois, avant que les processus ne le lisent
+    index_references.charger_index(os.path.dirname(utilisateurs_path) or '.')
+    with metriques.mesurer("chargement") as mesure:
+        df = stockage.lire_table(file_path, 'csv', table='telephones')
+        mesure['lignes_sortie'] = len(df)
+    # Règles dont la clé ne contient pas users_id : appliquées ici, sur la table entière
+    regles = dedoublonnage.regles_actives()
+    regles_partitions = regles if dedoublonnage.partitionnable(regles, 'users_id') else []
+    with metriques.mesurer("doublons", lignes_entree=len(df)) as mesure:
+        df, comptes_doublons = dedoublonnage.dedoublonner(df, [r for r in regles if r not in regles_partitions])
+        mesure['lignes_sortie'] = len(df)
+    df = df.copy()
+    df[POSITION] = range(len(df))
+    partitions = partitionner(df, nb_processus)
+
+    with tempfile.TemporaryDirectory(dir=_dossier_partage()) as dossier:
+        with metriques.mesurer("partitionnement", lignes_entree=len(df)):
+            chemins = []
+            for numero in range(nb_processus):
+                path = os.path.join(dossier, f"partition_{numero}.arrow")
+                _ecrire_arrow(df[partitions == numero], path)
+                chemins.append(path)
+        del df
+
+        with metriques.mesurer("traitement_partitions"):
+            with ProcessPoolExecutor(max_workers=nb_processus) as executor:
+                resultats = list(executor.map(traiter_partition, chemins,
+                                              [utilisateurs_path] * nb_processus,
+                                              [modeles_path] * nb_processus,
+                                              [seuil_annees] * nb_processus,
+                                              [seuils_analyse] * nb_processus,
+                                              [fenetres_analyse] * nb_processus,
+                                              [regles_partitions] * nb_processus))
+
+        # Fusion déterministe : ordre d'origine des lignes, puis ordre des utilisateurs
+        with metriques.mesurer("fusion") as mesure:
+            cleaned_df = pd.concat([_lire_arrow(c) for c, _, _, _, _ in resultats]).sort_values(POSITION, kind='stable')
+            remplacements_df = (pd.concat([_lire_arrow(r) for _, r, _, _, _ in resultats], ignore_index=True)
+                                .sort_values('users_id', kind='stable')
+                                .reset_index(drop=True))
+            analyse_df = detecteur.fusionner_analyses([_lire_arrow(a) for _, _, a, _, _ in resultats],
+                                                      seuils_analyse, fenetres_analyse)
+            etat = pd.concat([_lire_arrow(e) for _, _, _, e, _ in resultats], ignore_index=True)
+            mesure['lignes_sortie'] = len(cleaned_df)
+
+    counts = {}
+    for *_, partition_counts in resultats:
+        for nom, n in partition_counts.pop('doublons').items():
+            comptes_doublons[nom] = comptes_doublons.get(nom, 0) + n
+        for source, n in partition_counts.items():
+            counts[source] = counts.get(source, 0) + n
+    dedoublonnage.afficher_comptes({r['nom']: comptes_doublons.get(r['nom'], 0) for r in regles
+                                    if r['nom'] in comptes_doublons})
+    for source, n in counts.items():
+        print(f"  {n} lignes remplies via '{source}'.")
+
+    isole = cleaned_df.pop('_isole').astype(bool).to_numpy()
+    filtre = cleaned_df.pop('_filtre').astype(bool).to_numpy()
+    cleaned_df = cleaned_df.drop(columns=POSITION).reset_index(drop=True)
+    isolated_df = cleaned_df[isole]
+    filtered_df = cleaned_df[filtre]
+    # Motifs calculés ici, sur les seules lignes écartées par les processus
+    rejected_df = cleaned_df[~filtre].copy()
+    rejected_df['motif_rejet'] = cleaner.motifs_rejet(rejected_df['users_id'], cleaner.load_users(utilisateurs_path))
+    utilisateurs_df = detecteur.resumer_par_utilisateur(remplacements_df)
+    print(f"[ISOLE] Isolé {len(isolated_df)} lignes avec users_id == 0 et states_id == 2.")
+
+    sorties.ecrire_csv(cleaned_df, output_cleaned_path)
+    sorties.ecrire_csv(isolated_df, output_isolated_path)
+    cleaner.ecrire_filtrage(filtered_df, rejected_df, output_filtered_path, output_rejected_path)
+    detecteur.sauvegarder_resultats(remplacements_df, utilisateurs_df)
+    detecteur.sauvegarder_analyse(analyse_df)
+    detecteur.sauvegarder_etat(etat, seuil_annees=seuil_annees)
+    print(f"[OK] Traitement parallèle terminé ({nb_processus} processus) : "
+          f"{len(filtered_df)} lignes filtrées, {len(remplacements_df)} remplacements anticipés.")
+    return cleaned_df, filtered_df, remplacements_df, utilisateurs_df
+
+def main():
+    parser = argparse.ArgumentParser(description="Nettoyage, filtrage et détection en parallèle (partitions users_id).")
+    parser.add_argument('--processus', type=int, default=None, help="Nombre de processus (défaut : nombre de coeurs)")
+    parser.add_argument('--seuils', help="Seuils d'analyse en années (ex. 1,2,3)")
+    parser.add_argument('--fenetres', help="Fenêtres glissantes mois:minimum (ex. 24:3,12:2)")
+    args = parser.parse_args()
+    seuils_analyse, fenetres_analyse = detecteur.lire_options_analyse(sys.argv)
+    start = time.perf_counter()
+    executer_en_parallele(nb_processus=args.processus, seuils_analyse=seuils_analyse, fenetres_analyse=fenetres_analyse)
+    print(f"[TEMPS] traitement parallèle : {time.perf_counter() - start:.2f} s")
+
+if __name__ == "__main__":
+    main()
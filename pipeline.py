@@ -0,0 +1,112 @@
+import argparse
+import sys
+
+# Point d'entrée unique des étapes du pipeline : python pipeline.py <commande> [options].
+# Les bibliothèques lourdes (pandas, SQLAlchemy) ne sont importées que dans les sous-commandes
+# qui en ont besoin : --help et validate démarrent avec la seule bibliothèque standard.
+# Le workflow complet (DAG, étapes sautées, rapport) reste lancé par main.py.
+
+def commande_export(args):
+    import transformer
+    engine = transformer.get_db(args.base) if args.base else None
+    result = transformer.export_mysql_to_csv(engine, incremental=args.incremental, asynchrone=args.asynchrone)
+    if engine is not None:
+        engine.dispose()
+    print(f"Résultat final : {result}")
+    return 0
+
+def commande_quality(args):
+    import qualite
+    _, bloquant = qualite.controler_exports(echantillon=args.echantillon)
+    return 1 if bloquant else 0
+
+def commande_clean(args):
+    import cleaner
+    if args.streaming or args.externe:
+        # Nettoyage et filtrage en une seule lecture de la table
+        cleaner.main(streaming=True, externe=args.externe)
+        return 0
+    cleaned_df, _ = cleaner.clean_dataset("exports/telephones.csv", "cleaned_telephones.csv",
+                                          "isolated_telephones.csv")
+    return 0 if cleaned_df is not None else 1
+
+def commande_filter(args):
+    import cleaner
+    user_ids = cleaner.load_users("exports/utilisateurs.csv")
+    if user_ids is None:
+        print("[ERREUR] Impossible de charger les utilisateur_id.")
+        return 1
+    cleaner.filter_telephones("cleaned_telephones.csv", "cleaned_telephones_filtered.csv", user_ids,
+                              "rejected_telephones.csv")
+    return 0
+
+def commande_detect(args):
+    import detecter_remplacements_anticipes as detecteur
+    options = []
+    if args.seuils:
+        options += ['--seuils', args.seuils]
+    if args.fenetres:
+        options += ['--fenetres', args.fenetres]
+    detecteur.main(args.incremental, *detecteur.lire_options_analyse(options))
+    return 0
+
+def commande_validate(args):
+    """Vérifie les sorties déclarées des étapes contre le manifeste, sans charger pandas."""
+    import main
+    import sorties
+    chemins = []
+    for etape in main.ETAPES:
+        if args.etape is None or etape['nom'] in args.etape:
+            chemins += [path for path in etape['sorties'] if path not in chemins]
+    invalides = 0
+    for path in chemins:
+        raison = sorties.valider(path, verifier_contenu=args.contenu)
+        if raison is None:
+            print(f"[OK] {path} ({sorties.lignes(path)} lignes)")
+        else:
+            print(f"[ERREUR] {path} : {raison}")
+            invalides += 1
+    print(f"[INFO] {len(chemins) - invalides}/{len(chemins)} sorties valides.")
+    return 1 if invalides else 0
+
+def creer_parser():
+    parser = argparse.ArgumentParser(description="Étapes du pipeline téléphones (export, contrôle qualité, "
+                                                 "nettoyage, filtrage, détection) et validation des sorties.")
+    commandes = parser.add_subparsers(dest='commande', required=True, metavar='commande')
+
+    export = commandes.add_parser('export', help="Exporter les tables MySQL en CSV")
+    export.add_argument('--incremental', action='store_true', help="Seulement les lignes modifiées depuis le dernier export")
+    export.add_argument('--async', dest='asynchrone', action='store_true', help="Tables orchestrées par asyncio")
+    export.add_argument('--base', help="Autre base que MySQL (ex. sqlite:///locale.db)")
+    export.set_defaults(fonction=commande_export)
+
+    quality = commandes.add_parser('quality', help="Contrôler la qualité des exports (rapport et quarantaine)")
+    quality.add_argument('--echantillon', type=int, help="Contrôler un échantillon d'environ N lignes par table")
+    quality.set_defaults(fonction=commande_quality)
+
+    clean = commandes.add_parser('clean', help="Nettoyer exports/telephones.csv")
+    clean.add_argument('--streaming', action='store_true', help="Nettoyage et filtrage bloc par bloc")
+    clean.add_argument('--externe', action='store_true', help="Streaming avec dédoublonnage sur disque")
+    clean.set_defaults(fonction=commande_clean)
+
+    filtre = commandes.add_parser('filter', help="Filtrer cleaned_telephones.csv par utilisateurs valides")
+    filtre.set_defaults(fonction=commande_filter)
+
+    detect = commandes.add_parser('detect', help="Détecter les remplacements anticipés")
+    detect.add_argument('--incremental', action='store_true', help="Seulement les utilisateurs modifiés")
+    detect.add_argument('--seuils', help="Seuils de l'analyse en années, ex. 1,2,3")
+    detect.add_argument('--fenetres', help="Fenêtres glissantes mois:minimum, ex. 24:3,12:2")
+    detect.set_defaults(fonction=commande_detect)
+
+    validate = commandes.add_parser('validate', help="Vérifier les sorties contre le manifeste (sans pandas)")
+    validate.add_argument('--etape', nargs='+', help="Limiter aux sorties de ces étapes")
+    validate.add_argument('--contenu', action='store_true', help="Recalculer le SHA-256 de chaque fichier")
+    validate.set_defaults(fonction=commande_validate)
+    return parser
+
+def main(argv=None):
+    args = creer_parser().parse_args(argv)
+    return args.fonction(args)
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,326 @@
+import contextlib
+import io
+import os
+import random
+import sys
+
+import numpy as np
+import pandas as pd
+
+import index_references
+import metriques
+import sorties
+
+# Contrôles qualité des exports, exécutés juste après l'export (étape 'qualite' de main.py).
+# Chaque table est lue une seule fois, bloc par bloc ; toutes ses règles sont évaluées sur le
+# bloc par des opérations vectorisées sur les colonnes. Types de règles :
+#   'vides'     : taux de valeurs vides de la colonne (contrôle de table, sans quarantaine)
+#   'plage'     : valeur numérique dans [min, max] (bornes optionnelles)
+#   'date'      : date lisible au format `format`, entre min et aujourd'hui + marge_jours
+#   'reference' : valeur présente dans l'index de référence `reference` (voir index_references),
+#                 sauf les valeurs `ignorer` (ex. users_id = 0 : téléphone non attribué)
+#   'valeurs'   : valeur parmi `autorisees`, ou parmi les valeurs de la variable d'environnement
+#                 `variable` (séparées par des virgules) ; règle ignorée si aucune n'est configurée
+# Hors 'vides', les cellules vides ne sont pas contrôlées et chaque ligne en violation est copiée
+# dans quarantaine_<table>.csv avec les noms des règles enfreintes.
+#   max_taux : taux de violations toléré ; au-delà, la règle est en échec
+#   bloquant : une règle en échec arrête le pipeline (sinon simple alerte)
+#   retirer  : les lignes en violation sont aussi retirées de l'export
+REGLES_QUALITE = [
+    {'nom': 'utilisateur_id_vide', 'table': 'utilisateurs', 'type': 'vides', 'colonne': 'utilisateur_id',
+     'max_taux': 0.0, 'bloquant': True},
+    {'nom': 'utilisateur_id_invalide', 'table': 'utilisateurs', 'type': 'plage', 'colonne': 'utilisateur_id',
+     'min': 1, 'max_taux': 0.0, 'bloquant': False, 'retirer': False},
+    {'nom': 'nom_utilisateur_vide', 'table': 'utilisateurs', 'type': 'vides', 'colonne': 'nom_utilisateur',
+     'max_taux': 0.05, 'bloquant': False},
+    {'nom': 'modele_id_invalide', 'table': 'modeles_telephones', 'type': 'plage', 'colonne': 'modele_id',
+     'min': 1, 'max_taux': 0.0, 'bloquant': False, 'retirer': False},
+    {'nom': 'date_modification_invalide', 'table': 'modeles_telephones', 'type': 'date',
+     'colonne': 'date_modification', 'max_taux': 0.0, 'bloquant': False, 'retirer': False},
+    {'nom': 'id_vide', 'table': 'telephones', 'type': 'vides', 'colonne': 'id', 'max_taux': 0.0, 'bloquant': True},
+    {'nom': 'id_invalide', 'table': 'telephones', 'type': 'plage', 'colonne': 'id', 'min': 1,
+     'max_taux': 0.0, 'bloquant': False, 'retirer': False},
+    {'nom': 'users_id_invalide', 'table': 'telephones', 'type': 'plage', 'colonne': 'users_id', 'min': 0,
+     'max_taux': 0.0, 'bloquant': False, 'retirer': False},
+    {'nom': 'utilisateur_inconnu', 'table': 'telephones', 'type': 'reference', 'colonne': 'users_id',
+     'reference': 'utilisateurs', 'ignorer': [0], 'max_taux': 0.05, 'bloquant': False, 'retirer': False},
+    {'nom': 'modele_inconnu', 'table': 'telephones', 'type': 'reference', 'colonne': 'phonemodels_id',
+     'reference': 'modeles', 'ignorer': [0], 'max_taux': 0.05, 'bloquant': False, 'retirer': False},
+    {'nom': 'states_id_inattendu', 'table': 'telephones', 'type': 'valeurs', 'colonne': 'states_id',
+     'variable': 'PIPELINE_ETATS', 'max_taux': 0.0, 'bloquant': False, 'retirer': False},
+    # Dates illisibles : pd.to_datetime(errors='coerce') les changerait en NaT et la détection les ignorerait
+    {'nom': 'date_mod_invalide', 'table': 'telephones', 'type': 'date', 'colonne': 'date_mod',
+     'max_taux': 0.01, 'bloquant': False, 'retirer': False},
+    {'nom': 'date_mod_vide', 'table': 'telephones', 'type': 'vides', 'colonne': 'date_mod',
+     'max_taux': 0.5, 'bloquant': False},
+]
+
+# Ordre de contrôle : les tables de référence d'abord (l'index est reconstruit si elles changent)
+TABLES = ['utilisateurs', 'modeles_telephones', 'telephones']
+
+# Dates plausibles (format des exports MySQL/GLPI)
+FORMAT_DATE = '%Y-%m-%d %H:%M:%S'
+DATE_MIN = '2000-01-01'
+MARGE_JOURS = 1
+
+# Tables plus grandes que SEUIL_ECHANTILLON lignes : contrôle sur un échantillon d'environ
+# ECHANTILLON lignes, par blocs entiers (un bloc sur k, à partir d'un bloc tiré au hasard, les autres
+# ne sont pas découpés en colonnes) ; taux estimés, quarantaine limitée à l'échantillon, rien n'est retiré
+SEUIL_ECHANTILLON = 5_000_000
+ECHANTILLON = 1_000_000
+CHUNKSIZE = 100_000
+
+COLONNE_MOTIFS = 'motifs_qualite'
+
+def _hors_regle(valeurs, regle, index, maintenant):
+    """Masque (ndarray) des cellules renseignées de valeurs qui enfreignent la règle de ligne."""
+    renseignees = valeurs.notna().to_numpy()
+    if regle['type'] == 'date':
+        dates = pd.to_datetime(valeurs, format=regle.get('format', FORMAT_DATE), errors='coerce')
+        limite = maintenant + pd.Timedelta(days=regle.get('marge_jours', MARGE_JOURS))
+        hors = (dates.isna() | (dates < pd.Timestamp(regle.get('min', DATE_MIN))) | (dates > limite)).to_numpy()
+        return renseignees & hors
+    nombres = index_references.numeriser(valeurs)
+    if regle['type'] == 'plage':
+        hors = nombres.isna() | (nombres % 1 != 0)
+        if regle.get('min') is not None:
+            hors |= nombres < regle['min']
+        if regle.get('max') is not None:
+            hors |= nombres > regle['max']
+    elif regle['type'] == 'valeurs':
+        hors = ~nombres.isin(regle['autorisees'])
+    else:
+        hors = ~(index[regle['reference']].contient(nombres) | nombres.isin(regle.get('ignorer', [])).to_numpy())
+    return renseignees & np.asarray(hors, dtype=bool)
+
+def _fin_enregistrement(texte):
+    """
+    Position qui suit le dernier saut de ligne de texte situé hors d'un champ entre guillemets
+    (un commentaire exporté peut contenir des sauts de ligne), None s'il n'y en a pas.
+    texte doit commencer au début d'un enregistrement.
+    """
+    fin = texte.rfind('\n')
+    while fin >= 0:
+        if texte.count('"', 0, fin) % 2 == 0:
+            return fin + 1
+        fin = texte.rfind('\n', 0, fin)
+    return None
+
+def _segments(source, lignes):
+    """
+    Découpe le texte CSV restant de source en segments d'environ `lignes` lignes, coupés entre
+    deux enregistrements : lecture par grands blocs de texte, sans découpage en colonnes.
+    """
+    tampon = source.read(1 << 20)
+    # Taille des segments estimée sur le premier mégaoctet
+    taille = max(lignes * len(tampon) // max(tampon.count('\n'), 1), 1)
+    fin_fichier = False
+    while tampon:
+        if not fin_fichier and len(tampon) < 2 * taille:
+            bloc = source.read(2 * taille)
+            fin_fichier = not bloc
+            tampon += bloc
+            continue
+        # Dernière fin d'enregistrement du segment (ou plus loin, pour un enregistrement plus long)
+        fin = _fin_enregistrement(tampon[:taille]) or _fin_enregistrement(tampon)
+        if fin is None:
+            if fin_fichier:
+                fin = len(tampon)
+            else:
+                bloc = source.read(2 * taille)
+                fin_fichier = not bloc
+                tampon += bloc
+                continue
+        yield tampon[:fin]
+        tampon = tampon[fin:]
+
+def _blocs(source, chunksize, pas=1, premier=0):
+    """
+    Blocs de lignes lus en texte brut. Avec pas > 1, seul un segment sur pas (à partir du
+    segment premier) est découpé en colonnes ; les autres sont sautés.
+    """
+    lecture = {'dtype': str, 'keep_default_na': False, 'na_values': ['']}
+    if pas == 1:
+        yield from pd.read_csv(source, chunksize=chunksize, **lecture)
+        return
+    entete = source.readline()
+    for i, segment in enumerate(_segments(source, chunksize)):
+        if (i - premier) % pas == 0:
+            yield pd.read_csv(io.StringIO(entete + segment), **lecture)
+
+def nombre_lignes(path):
+    """Lignes de données de path : lues dans le manifeste, sinon comptées (fins de ligne, approximatif)."""
+    lignes = sorties.lignes(path)
+    if lignes is not None:
+        return lignes
+    with sorties.ouvrir(path) as f:
+        return max(sum(bloc.count('\n') for bloc in iter(lambda: f.read(1 << 20), '')) - 1, 0)
+
+def valeurs_autorisees(regle):
+    """Valeurs autorisées d'une règle 'valeurs' (déclarées ou lues dans sa variable), None si non configurées."""
+    if regle.get('autorisees') is not None:
+        return regle['autorisees']
+    valeurs = os.environ.get(regle.get('variable', ''), '')
+    return [int(v) for v in valeurs.split(',') if v.strip()] or None
+
+def _applicables(regles, colonnes, index, table):
+    """
+    Règles évaluables sur la table (colonne présente, index de référence disponible,
+    valeurs autorisées configurées). Les règles 'valeurs' retenues portent leurs valeurs.
+    """
+    retenues, ignorees = [], []
+    for regle in regles:
+        if regle['type'] == 'valeurs' and valeurs_autorisees(regle) is None:
+            print(f"[INFO] Règle '{regle['nom']}' ignorée : valeurs autorisées non configurées "
+                  f"(variable {regle.get('variable')}, ex. 1,2,3).")
+            ignorees.append(regle)
+        elif regle['colonne'] not in colonnes:
+            print(f"[ALERTE] Règle '{regle['nom']}' ignorée : colonne {regle['colonne']} absente de {table}.")
+            ignorees.append(regle)
+        elif regle['type'] == 'reference' and index.get(regle['reference']) is None:
+            print(f"[ALERTE] Règle '{regle['nom']}' ignorée : index '{regle['reference']}' indisponible.")
+            ignorees.append(regle)
+        elif regle['type'] == 'valeurs':
+            retenues.append({**regle, 'autorisees': valeurs_autorisees(regle)})
+        else:
+            retenues.append(regle)
+    return retenues, ignorees
+
+def controler_table(path, table, regles, index=None, quarantaine_path=None, echantillon=None,
+                    seed=42, chunksize=None):
+    """
+    Évalue les règles de table sur le CSV exporté path, en une lecture par blocs (valeurs lues
+    en texte brut, recopiées telles quelles). Les lignes en violation d'une règle de ligne sont
+    écrites dans quarantaine_path ; celles des règles `retirer` sont retirées de l'export.
+    Avec echantillon (nombre de lignes), seul un bloc sur k est contrôlé (k = lignes / echantillon,
+    premier bloc tiré avec seed) : les autres blocs sont sautés sans être découpés en colonnes.
+    Retourne la liste des résultats par règle (une ligne du rapport controle_qualite.csv).
+    """
+    chunksize = chunksize or CHUNKSIZE
+    index = index or {}
+    total = nombre_lignes(path) if echantillon else None
+    pas = max(round(total / echantillon), 1) if total else 1
+    if pas > 1:
+        # Au moins une dizaine de blocs dans l'échantillon
+        chunksize = min(chunksize, max(echantillon // 10, 1))
+    maintenant = pd.Timestamp.now()
+
+    retirer = [regle['nom'] for regle in regles if regle.get('retirer')]
+    if retirer and pas > 1:
+        print(f"[ALERTE] {table} contrôlée sur échantillon : les lignes ne sont pas retirées ({', '.join(retirer)}).")
+        retirer = []
+    valeurs_export = sorties.entree(path)
+    compression = valeurs_export['compression'] if valeurs_export is not None else 'config'
+
+    # Échantillon systématique de blocs entiers : un bloc sur pas, à partir d'un bloc tiré au hasard
+    premier = random.Random(seed).randrange(pas)
+    controlees = retires = ecrits = 0
+    comptes = {regle['nom']: 0 for regle in regles}
+    retenues, ignorees = None, []
+    with sorties.ouvrir(path) as source, metriques.mesurer(table) as mesure, \
+            sorties.FichierSortie(quarantaine_path or f"quarantaine_{table}.csv") as quarantaine, \
+            contextlib.ExitStack() as pile:
+        # Export réécrit sans les lignes retirées (remplacé atomiquement à la fin de la lecture)
+        export = pile.enter_context(sorties.FichierSortie(path, compression)) if retirer else None
+        if export is not None and valeurs_export is not None:
+            export.colonnes = valeurs_export['colonnes']
+        for bloc in _blocs(source, chunksize, pas, premier):
+            if retenues is None:
+                retenues, ignorees = _applicables(regles, bloc.columns, index, table)
+            controlees += len(bloc)
+
+            masques = {}
+            for regle in retenues:
+                if regle['type'] == 'vides':
+                    comptes[regle['nom']] += int(bloc[regle['colonne']].isna().sum())
+                else:
+                    masques[regle['nom']] = _hors_regle(bloc[regle['colonne']], regle, index, maintenant)
+                    comptes[regle['nom']] += int(masques[regle['nom']].sum())
+            masques = pd.DataFrame(masques, index=bloc.index, dtype=bool)
+
+            en_violation = masques.any(axis=1).to_numpy()
+            isolees = bloc[en_violation].copy()
+            # Noms des règles enfreintes, séparés par '; ' (produit booléens × noms de règles)
+            isolees[COLONNE_MOTIFS] = (masques[en_violation].dot(masques.columns + '; ').str[:-2]
+                                       if len(isolees) else '')
+            isolees.to_csv(quarantaine.fichier, index=False, header=(ecrits == 0))
+            quarantaine.lignes += len(isolees)
+            quarantaine.decrire(isolees)
+
+            if export is not None:
+                garde = ~masques[[nom for nom in retirer if nom in masques]].any(axis=1).to_numpy()
+                bloc[garde].to_csv(export.fichier, index=False, header=(ecrits == 0))
+                export.lignes += int(garde.sum())
+                retires += int((~garde).sum())
+            ecrits += 1
+        mesure['lignes_entree'] = controlees
+        mesure['lignes_sortie'] = quarantaine.lignes
+    if retires:
+        print(f"[SUPPRESSION] {retires} lignes retirées de {path} (mises en quarantaine).")
+
+    resultats = []
+    for regle in regles:
+        violations = comptes[regle['nom']]
+        taux = violations / controlees if controlees else 0.0
+        if regle in ignorees:
+            statut = 'ignoree'
+        elif taux <= regle.get('max_taux', 0.0):
+            statut = 'ok'
+        else:
+            statut = 'bloquant' if regle.get('bloquant') else 'alerte'
+        resultats.append({
+            'table': table, 'regle': regle['nom'], 'type': regle['type'], 'colonne': regle['colonne'],
+            'lignes_controlees': controlees, 'violations': violations, 'taux': round(taux, 6),
+            'max_taux': regle.get('max_taux', 0.0), 'echantillon': pas > 1, 'statut': statut,
+        })
+    return resultats
+
+def controler_exports(exports_dir="exports", regles=None, rapport_path="controle_qualite.csv",
+                      dossier_quarantaine=".", echantillon=None):
+    """
+    Contrôle chaque table exportée (ordre TABLES) et écrit le rapport rapport_path ainsi qu'un
+    fichier quarantaine_<table>.csv par table (vide si aucune ligne en violation).
+    echantillon : taille d'échantillon forcée (par défaut, ECHANTILLON au-delà de SEUIL_ECHANTILLON lignes).
+    Retourne (rapport DataFrame, vrai si une règle bloquante est en échec).
+    """
+    regles = REGLES_QUALITE if regles is None else regles
+    resultats = []
+    for table in TABLES:
+        path = os.path.join(exports_dir, f"{table}.csv")
+        regles_table = [regle for regle in regles if regle['table'] == table]
+        if not regles_table:
+            continue
+        if not sorties.existe(path):
+            print(f"[ALERTE] {path} introuvable : contrôles de {table} ignorés.")
+            continue
+        index = None
+        if any(regle['type'] == 'reference' for regle in regles_table):
+            index = index_references.charger_index(exports_dir)
+        taille = echantillon
+        if taille is None and nombre_lignes(path) > SEUIL_ECHANTILLON:
+            taille = ECHANTILLON
+        resultats += controler_table(path, table, regles_table, index,
+                                     os.path.join(dossier_quarantaine, f"quarantaine_{table}.csv"), taille)
+
+    rapport = pd.DataFrame(resultats, columns=['table', 'regle', 'type', 'colonne', 'lignes_controlees',
+                                               'violations', 'taux', 'max_taux', 'echantillon', 'statut'])
+    sorties.ecrire_csv(rapport, rapport_path)
+    afficher_rapport(rapport, rapport_path)
+    return rapport, bool((rapport['statut'] == 'bloquant').any())
+
+def afficher_rapport(rapport, rapport_path="controle_qualite.csv"):
+    for r in rapport[rapport['statut'].isin(['alerte', 'bloquant'])].itertuples(index=False):
+        etiquette = "[ERREUR]" if r.statut == 'bloquant' else "[ALERTE]"
+        print(f"{etiquette} {r.table}.{r.colonne} : règle '{r.regle}' en échec ({r.violations} lignes, "
+              f"{r.taux:.2%} > {r.max_taux:.2%})" + (" sur échantillon" if r.echantillon else ""))
+    respectees = (rapport['statut'] == 'ok').sum()
+    print(f"[OK] Contrôle qualité : {respectees}/{len(rapport)} règles respectées (rapport : {rapport_path}).")
+
+def main(echantillon=None):
+    _, bloquant = controler_exports(echantillon=echantillon)
+    if bloquant:
+        print("[ERREUR] Contrôle qualité bloquant en échec.")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main(int(sys.argv[sys.argv.index('--echantillon') + 1]) if '--echantillon' in sys.argv else None)
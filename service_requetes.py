@@ -0,0 +1,359 @@
+import argparse
+import asyncio
+import hashlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from urllib.parse import parse_qsl, urlsplit
+
+import pandas as pd
+
+import sorties
+
+# Service local de requêtes sur les sorties du pipeline, pour les pages du rapport Power BI.
+# Les CSV sont chargés une fois dans une base SQLite en mémoire (tables agrégées et indexées),
+# puis servis en JSON par un petit serveur HTTP asyncio : filtres, pagination, ETag.
+# La base et le cache sont reconstruits dès qu'un nouveau run du pipeline a modifié les fichiers.
+
+HOTE = "127.0.0.1"
+PORT = 8765
+
+# Fichiers publiés par le pipeline (les absents sont simplement ignorés)
+SOURCES = {
+    'telephones': "cleaned_telephones.csv",
+    'isoles': "isolated_telephones.csv",
+    'filtres': "cleaned_telephones_filtered.csv",
+    'remplacements': "remplacements_anticipes.csv",
+    'utilisateurs_remplacements': "utilisateurs_multi_remplacements.csv",
+    'analyse': "analyse_remplacements.csv",
+    'utilisateurs': "exports/utilisateurs.csv",
+    'modeles': "exports/modeles_telephones.csv",
+}
+
+LIMITE_DEFAUT = 100
+LIMITE_MAX = 1000
+TAILLE_CACHE = 256  # Réponses gardées en cache (par chemin + paramètres)
+
+def signature(dossier):
+    """Taille et date de modification de chaque source : change à chaque run publié."""
+    signatures = {}
+    for nom, fichier in SOURCES.items():
+        path = os.path.join(dossier, fichier)
+        if sorties.existe(path):
+            stat = os.stat(sorties.resoudre(path))
+            signatures[nom] = (stat.st_size, stat.st_mtime_ns)
+    return signatures
+
+def _lire(dossier, nom, colonnes=None):
+    path = os.path.join(dossier, SOURCES[nom])
+    if not sorties.existe(path):
+        return None
+    if colonnes is None:
+        return pd.read_csv(sorties.resoudre(path), encoding='utf-8')
+    # Seules les colonnes utiles sont découpées ; une colonne absente est ajoutée vide
+    df = pd.read_csv(sorties.resoudre(path), usecols=lambda col: col in colonnes, encoding='utf-8')
+    return df.reindex(columns=colonnes)
+
+def charger_base(dossier="."):
+    """
+    Charge les sorties du pipeline dans une base SQLite en mémoire :
+    agrégats pour les pages 1 et 2, tables détaillées indexées pour la page 3.
+    """
+    start = time.perf_counter()
+    base = sqlite3.connect(":memory:", check_same_thread=False)
+
+    telephones = _lire(dossier, 'telephones', ['id', 'users_id', 'states_id', 'phonemodels_id'])
+    if telephones is not None:
+        isoles = _lire(dossier, 'isoles', ['id'])
+        telephones['attribue'] = ((telephones['users_id'] > 0) & (telephones['states_id'] == 2)).astype(int)
+        telephones['isole'] = telephones['id'].isin(isoles['id'] if isoles is not None else []).astype(int)
+        (telephones.groupby(['states_id', 'phonemodels_id', 'attribue', 'isole'], dropna=False)
+         .size().reset_index(name='nb').to_sql('stock', base, index=False))
+
+    filtres = _lire(dossier, 'filtres', ['users_id', 'phonemodels_id'])
+    if filtres is not None:
+        (filtres.groupby(['users_id', 'phonemodels_id'], dropna=False)
+         .size().reset_index(name='nb').to_sql('parc_utilisateurs', base, index=False))
+
+    for nom, colonnes in (('utilisateurs', ['utilisateur_id', 'nom_utilisateur']),
+                          ('modeles', ['modele_id', 'nom_modele']),
+                          ('remplacements', None), ('utilisateurs_remplacements', None), ('analyse', None)):
+        df = _lire(dossier, nom, colonnes)
+        if df is not None:
+            df.to_sql(nom, base, index=False)
+
+    index = {
+        'stock': ['states_id', 'phonemodels_id'],
+        'parc_utilisateurs': ['users_id', 'phonemodels_id'],
+        'utilisateurs': ['utilisateur_id'],
+        'modeles': ['modele_id'],
+        'remplacements': ['users_id', 'date_actuelle'],
+        'analyse': ['indicateur', 'parametre', 'dimension'],
+    }
+    tables = {ligne[0] for ligne in base.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    for table, colonnes in index.items():
+        if table in tables:
+            for colonne in colonnes:
+                base.execute(f"CREATE INDEX idx_{table}_{colonne} ON {table} ({colonne})")
+    print(f"[SERVICE] Base chargée en {time.perf_counter() - start:.2f} s ({', '.join(sorted(tables))})")
+    return base, tables
+
+class RequeteInvalide(Exception):
+    """Paramètre de requête invalide (réponse 400)."""
+
+def _entier(params, nom, defaut=None, maximum=None):
+    valeur = params.get(nom)
+    if valeur is None or valeur == '':
+        return defaut
+    try:
+        valeur = int(valeur)
+    except ValueError:
+        raise RequeteInvalide(f"Paramètre '{nom}' : entier attendu")
+    if valeur < 0:
+        raise RequeteInvalide(f"Paramètre '{nom}' : valeur positive attendue")
+    return min(valeur, maximum) if maximum is not None else valeur
+
+def _filtres(params, colonnes):
+    """Clause WHERE et paramètres pour les filtres d'égalité entiers autorisés {param: colonne}."""
+    conditions, valeurs = [], []
+    for param, colonne in colonnes.items():
+        valeur = _entier(params, param)
+        if valeur is not None:
+            conditions.append(f"{colonne} = ?")
+            valeurs.append(valeur)
+    return (" WHERE " + " AND ".join(conditions)) if conditions else "", valeurs
+
+def _lignes(base, requete, valeurs=()):
+    curseur = base.execute(requete, valeurs)
+    colonnes = [description[0] for description in curseur.description]
+    return [dict(zip(colonnes, ligne)) for ligne in curseur.fetchall()]
+
+def _page(base, requete, valeurs, params):
+    """Exécute requete avec pagination (limit/offset) ; retourne {total, limit, offset, donnees}."""
+    limite = _entier(params, 'limit', LIMITE_DEFAUT, LIMITE_MAX)
+    decalage = _entier(params, 'offset', 0)
+    total = base.execute(f"SELECT COUNT(*) FROM ({requete})", valeurs).fetchone()[0]
+    donnees = _lignes(base, f"{requete} LIMIT ? OFFSET ?", list(valeurs) + [limite, decalage])
+    return {'total': total, 'limit': limite, 'offset': decalage, 'donnees': donnees}
+
+# Page 1 : Stock & Attribution
+
+def page_stock(base, params):
+    where, valeurs = _filtres(params, {'states_id': 'states_id', 'modele': 'phonemodels_id'})
+    totaux = _lignes(base, f"""SELECT COALESCE(SUM(nb), 0) AS nb_telephones,
+                                      COALESCE(SUM(nb * attribue), 0) AS nb_attribues,
+                                      COALESCE(SUM(nb * isole), 0) AS nb_isoles
+                               FROM stock{where}""", valeurs)[0]
+    par_etat = _lignes(base, f"""SELECT states_id, SUM(nb) AS nb, SUM(nb * attribue) AS nb_attribues
+                                 FROM stock{where} GROUP BY states_id ORDER BY states_id""", valeurs)
+    par_modele = _page(base, f"""SELECT phonemodels_id, SUM(nb) AS nb, SUM(nb * attribue) AS nb_attribues
+                                 FROM stock{where} GROUP BY phonemodels_id ORDER BY nb DESC, phonemodels_id""",
+                       valeurs, params)
+    return {**totaux, 'par_etat': par_etat, 'par_modele': par_modele}
+
+# Page 2 : Top utilisateurs & modèles
+
+def page_top_utilisateurs(base, params, tables):
+    where, valeurs = _filtres(params, {'modele': 'p.phonemodels_id', 'users_id': 'p.users_id'})
+    nom = "u.nom_utilisateur" if 'utilisateurs' in tables else "NULL"
+    jointure = " LEFT JOIN utilisateurs u ON u.utilisateur_id = p.users_id" if 'utilisateurs' in tables else ""
+    return _page(base, f"""SELECT p.users_id, {nom} AS nom_utilisateur, SUM(p.nb) AS nb_telephones
+                           FROM parc_utilisateurs p{jointure}{where}
+                           GROUP BY p.users_id ORDER BY nb_telephones DESC, p.users_id""", valeurs, params)
+
+def page_top_modeles(base, params, tables):
+    where, valeurs = _filtres(params, {'states_id': 's.states_id', 'modele': 's.phonemodels_id'})
+    nom = "m.nom_modele" if 'modeles' in tables else "NULL"
+    jointure = " LEFT JOIN modeles m ON m.modele_id = s.phonemodels_id" if 'modeles' in tables else ""
+    return _page(base, f"""SELECT s.phonemodels_id, {nom} AS nom_modele, SUM(s.nb) AS nb_telephones,
+                                  SUM(s.nb * s.attribue) AS nb_attribues
+                           FROM stock s{jointure}{where}
+                           GROUP BY s.phonemodels_id ORDER BY nb_telephones DESC, s.phonemodels_id""",
+                 valeurs, params)
+
+# Page 3 : Remplacements anticipés & multi-attributions
+
+def page_remplacements(base, params):
+    where, valeurs = _filtres(params, {'users_id': 'users_id'})
+    for param, operateur in (('depuis', '>='), ('jusqu_a', '<=')):
+        if params.get(param):
+            try:
+                date = pd.Timestamp(params[param]).strftime('%Y-%m-%d')
+            except ValueError:
+                raise RequeteInvalide(f"Paramètre '{param}' : date AAAA-MM-JJ attendue")
+            where += (" AND " if where else " WHERE ") + f"date_actuelle {operateur} ?"
+            valeurs.append(date)
+    return _page(base, f"SELECT * FROM remplacements{where} ORDER BY users_id, date_actuelle",
+                 valeurs, params)
+
+def page_utilisateurs_remplacements(base, params):
+    return _page(base, """SELECT * FROM utilisateurs_remplacements
+                          ORDER BY nb_remplacements_anticipes DESC, users_id""", [], params)
+
+def page_analyse(base, params):
+    conditions, valeurs = [], []
+    for param in ('indicateur', 'parametre', 'dimension', 'periode'):
+        if params.get(param):
+            conditions.append(f"{param} = ?")
+            valeurs.append(params[param])
+    where = (" WHERE " + " AND ".join(conditions)) if conditions else ""
+    return _page(base, f"SELECT * FROM analyse{where}", valeurs, params)
+
+# Routes : chemin → (tables requises, fonction(base, params, tables))
+ROUTES = {
+    '/stock': (['stock'], lambda base, params, tables: page_stock(base, params)),
+    '/top/utilisateurs': (['parc_utilisateurs'], page_top_utilisateurs),
+    '/top/modeles': (['stock'], page_top_modeles),
+    '/remplacements': (['remplacements'], lambda base, params, tables: page_remplacements(base, params)),
+    '/remplacements/utilisateurs': (['utilisateurs_remplacements'],
+                                    lambda base, params, tables: page_utilisateurs_remplacements(base, params)),
+    '/remplacements/analyse': (['analyse'], lambda base, params, tables: page_analyse(base, params)),
+}
+
+class ServiceRequetes:
+    """Base en mémoire + cache des réponses, invalidés quand la signature des sources change."""
+
+    def __init__(self, dossier="."):
+        self.dossier = dossier
+        self.signature = None
+        self.version = None
+        self.base = None
+        self.tables = set()
+        self.cache = OrderedDict()
+        self.rechargement = None
+
+    def actualiser(self):
+        """Recharge la base si un nouveau run a été publié depuis le dernier chargement."""
+        courante = signature(self.dossier)
+        if courante == self.signature:
+            return
+        try:
+            base, tables = charger_base(self.dossier)
+        except Exception as e:
+            # Run en cours d'écriture ou fichier illisible : on garde la base précédente
+            print(f"[ERREUR] Rechargement impossible, base précédente conservée : {e}")
+            return
+        self._installer(base, tables, courante)
+
+    async def actualiser_async(self):
+        """
+        Comme actualiser, depuis la boucle asyncio : la base est rechargée dans un thread
+        (une seule recharge à la fois) et les requêtes continuent d'être servies par la base
+        précédente en attendant. Seul le premier chargement est attendu.
+        """
+        courante = signature(self.dossier)
+        if courante == self.signature:
+            return
+        if self.rechargement is None:
+            self.rechargement = asyncio.ensure_future(self._recharger(courante))
+        if self.base is None:
+            await asyncio.shield(self.rechargement)
+
+    async def _recharger(self, courante):
+        try:
+            base, tables = await asyncio.to_thread(charger_base, self.dossier)
+        except Exception as e:
+            print(f"[ERREUR] Rechargement impossible, base précédente conservée : {e}")
+            return
+        finally:
+            self.rechargement = None
+        self._installer(base, tables, courante)
+
+    def _installer(self, base, tables, courante):
+        """Remplace la base servie (appelé entre deux requêtes) et vide le cache des réponses."""
+        if self.base is not None:
+            self.base.close()
+        self.base, self.tables = base, tables
+        self.signature = courante
+        self.version = hashlib.sha256(json.dumps(courante, sort_keys=True).encode()).hexdigest()[:16]
+        self.cache.clear()
+
+    def repondre(self, chemin, params, etag_client=None):
+        """
+        Retourne (statut, corps JSON en octets ou None, etag), sur la base courante
+        (l'appelant la rafraîchit au préalable via actualiser ou actualiser_async).
+        """
+        if chemin == '/sante':
+            corps = {'version': self.version, 'tables': sorted(self.tables), 'routes': sorted(ROUTES)}
+            return 200, json.dumps(corps, ensure_ascii=False).encode('utf-8'), None
+        if chemin not in ROUTES:
+            return 404, json.dumps({'erreur': f"Route inconnue : {chemin}"}, ensure_ascii=False).encode('utf-8'), None
+
+        cle = (chemin, tuple(sorted(params.items())))
+        etag = '"' + hashlib.sha256(repr((self.version, cle)).encode()).hexdigest()[:32] + '"'
+        if etag_client == etag:
+            return 304, None, etag
+        if cle in self.cache:
+            self.cache.move_to_end(cle)
+            return 200, self.cache[cle], etag
+
+        tables_requises, fonction = ROUTES[chemin]
+        if not set(tables_requises) <= self.tables:
+            corps = {'erreur': f"Sorties du pipeline absentes pour {chemin} (lancer main.py)"}
+            return 503, json.dumps(corps, ensure_ascii=False).encode('utf-8'), None
+        try:
+            resultat = fonction(self.base, params, self.tables)
+        except RequeteInvalide as e:
+            return 400, json.dumps({'erreur': str(e)}, ensure_ascii=False).encode('utf-8'), None
+        corps = json.dumps({'version': self.version, **resultat}, ensure_ascii=False, default=str).encode('utf-8')
+        self.cache[cle] = corps
+        if len(self.cache) > TAILLE_CACHE:
+            self.cache.popitem(last=False)
+        return 200, corps, etag
+
+STATUTS = {200: 'OK', 304: 'Not Modified', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 503: 'Service Unavailable'}
+
+async def traiter_connexion(service, reader, writer):
+    """Une requête HTTP/1.1 GET par connexion (Connection: close)."""
+    try:
+        ligne = (await reader.readline()).decode('latin-1').split()
+        entetes = {}
+        while True:
+            entete = await reader.readline()
+            if entete in (b'\r\n', b'\n', b''):
+                break
+            nom, _, valeur = entete.decode('latin-1').partition(':')
+            entetes[nom.strip().lower()] = valeur.strip()
+        if len(ligne) < 2:
+            return
+        if ligne[0] != 'GET':
+            statut, corps, etag = 405, json.dumps({'erreur': "Seule la méthode GET est acceptée"}).encode(), None
+        else:
+            url = urlsplit(ligne[1])
+            params = dict(parse_qsl(url.query))
+            await service.actualiser_async()
+            statut, corps, etag = service.repondre(url.path.rstrip('/') or '/', params, entetes.get('if-none-match'))
+        reponse = [f"HTTP/1.1 {statut} {STATUTS[statut]}", "Connection: close", "Cache-Control: no-cache"]
+        if etag:
+            reponse.append(f"ETag: {etag}")
+        if corps is not None:
+            reponse += ["Content-Type: application/json; charset=utf-8", f"Content-Length: {len(corps)}"]
+        writer.write(("\r\n".join(reponse) + "\r\n\r\n").encode('latin-1') + (corps or b''))
+        await writer.drain()
+    finally:
+        writer.close()
+
+async def servir(dossier=".", hote=HOTE, port=PORT):
+    service = ServiceRequetes(dossier)
+    await service.actualiser_async()
+    serveur = await asyncio.start_server(lambda r, w: traiter_connexion(service, r, w), hote, port)
+    print(f"[SERVICE] En écoute sur http://{hote}:{port}/ (routes : {', '.join(sorted(ROUTES))}, /sante)")
+    async with serveur:
+        await serveur.serve_forever()
+
+def main():
+    parser = argparse.ArgumentParser(description="Service local de requêtes sur les sorties du pipeline.")
+    parser.add_argument('--dossier', default=".", help="Dossier du pipeline (contenant les CSV produits)")
+    parser.add_argument('--hote', default=HOTE)
+    parser.add_argument('--port', type=int, default=PORT)
+    args = parser.parse_args()
+    try:
+        asyncio.run(servir(args.dossier, args.hote, args.port))
+    except KeyboardInterrupt:
+        print("[SERVICE] Arrêt.")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,346 @@
+import gzip
+import hashlib
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+from datetime import datetime
+
+# Écriture des fichiers de sortie : fichier temporaire dans le même dossier puis renommage
+# atomique (un run interrompu ne laisse jamais de fichier à moitié écrit), compression
+# optionnelle et manifeste par dossier (.manifeste.json) : lignes, octets, SHA-256 et schéma
+# de chaque fichier. Les étapes suivantes valident et comptent les sorties via le manifeste,
+# sans relire les fichiers.
+# Compression choisie via la variable d'environnement PIPELINE_COMPRESSION : 'gzip' ou 'zstd'
+# (zstd nécessite le paquet zstandard). Par défaut, aucune : les CSV restent lisibles par Power BI.
+
+MANIFESTE = ".manifeste.json"
+COMPRESSIONS = {'gzip': '.gz', 'zstd': '.zst'}
+
+_verrou = threading.Lock()
+# Droits d'un fichier créé normalement (mkstemp crée en 0600)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+def compression_configuree():
+    """Retourne la compression configurée (None si aucune, gzip si zstandard est absent)."""
+    compression = os.environ.get('PIPELINE_COMPRESSION', '').lower() or None
+    if compression is not None and compression not in COMPRESSIONS:
+        print(f"[ALERTE] Compression inconnue '{compression}' — fichiers non compressés.")
+        return None
+    if compression == 'zstd':
+        try:
+            import zstandard  # noqa: F401
+        except ImportError:
+            print("[ALERTE] zstandard n'est pas installé — utilisation de gzip.")
+            return 'gzip'
+    return compression
+
+def hash_file(path):
+    """Empreinte SHA-256 du contenu d'un fichier (lu par blocs)."""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def _chainer(segments):
+    """Empreinte d'un fichier écrit en plusieurs segments : SHA-256 des SHA-256 de ses segments."""
+    return hashlib.sha256('\n'.join(sha256 for _, sha256 in segments).encode()).hexdigest()
+
+def _hacher(reel, valeurs=None):
+    """
+    SHA-256 du contenu de reel tel qu'enregistré dans le manifeste : celui du fichier entier,
+    ou pour une sortie complétée par ajouter_csv, la chaîne des SHA-256 de ses segments.
+    """
+    segments = (valeurs or {}).get('segments')
+    if not segments:
+        return hash_file(reel)
+    calcules = []
+    with open(reel, 'rb') as f:
+        for octets, _ in segments:
+            digest = hashlib.sha256()
+            while octets > 0:
+                block = f.read(min(octets, 1 << 20))
+                if not block:
+                    break
+                digest.update(block)
+                octets -= len(block)
+            calcules.append((None, digest.hexdigest()))
+    return _chainer(calcules)
+
+def _chemin_manifeste(path):
+    return os.path.join(os.path.dirname(path) or '.', MANIFESTE)
+
+def charger_manifeste(dossier="."):
+    try:
+        with open(os.path.join(dossier, MANIFESTE), 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+def entree(path):
+    """Entrée du manifeste pour path (chemin logique, sans suffixe de compression), ou None."""
+    return charger_manifeste(os.path.dirname(path) or '.').get(os.path.basename(path))
+
+def _enregistrer(path, valeurs):
+    with _verrou:
+        dossier = os.path.dirname(path) or '.'
+        manifeste = charger_manifeste(dossier)
+        if valeurs is None:
+            manifeste.pop(os.path.basename(path), None)
+        else:
+            manifeste[os.path.basename(path)] = valeurs
+        fd, tmp = tempfile.mkstemp(dir=dossier, prefix=f"{MANIFESTE}.", suffix='.tmp')
+        os.chmod(tmp, 0o666 & ~_UMASK)
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(manifeste, f, indent=2)
+        os.replace(tmp, _chemin_manifeste(path))
+
+def resoudre(path):
+    """Fichier réellement présent pour le chemin logique path (éventuellement compressé)."""
+    valeurs = entree(path)
+    if valeurs is not None:
+        reel = os.path.join(os.path.dirname(path), valeurs['fichier'])
+        if os.path.exists(reel):
+            return reel
+    for suffixe in [''] + list(COMPRESSIONS.values()):
+        if os.path.exists(path + suffixe):
+            return path + suffixe
+    return path
+
+def existe(path):
+    return os.path.exists(resoudre(path))
+
+def ouvrir(path, newline=''):
+    """Ouvre en lecture texte le fichier de sortie path, décompressé à la volée si besoin."""
+    reel = resoudre(path)
+    if reel.endswith(COMPRESSIONS['gzip']):
+        return gzip.open(reel, 'rt', encoding='utf-8', newline=newline)
+    if reel.endswith(COMPRESSIONS['zstd']):
+        import zstandard
+        return io.TextIOWrapper(zstandard.ZstdDecompressor().stream_reader(open(reel, 'rb'), closefd=True,
+                                                                        read_across_frames=True),
+                                encoding='utf-8', newline=newline)
+    return open(reel, 'r', encoding='utf-8', newline=newline)
+
+def empreinte(path):
+    """
+    SHA-256 du fichier path : lu dans le manifeste si le fichier n'a pas changé depuis
+    son écriture (taille et date identiques), calculé sinon.
+    """
+    reel = resoudre(path)
+    valeurs = entree(path)
+    stat = os.stat(reel)
+    if (valeurs is not None and os.path.basename(reel) == valeurs['fichier']
+            and (stat.st_size, stat.st_mtime_ns) == (valeurs['octets'], valeurs['mtime_ns'])):
+        return valeurs['sha256']
+    return _hacher(reel, valeurs if valeurs is not None and os.path.basename(reel) == valeurs['fichier'] else None)
+
+def lignes(path):
+    """Nombre de lignes de données de path d'après le manifeste (None si inconnu)."""
+    valeurs = entree(path)
+    return None if valeurs is None else valeurs['lignes']
+
+def valider(path, verifier_contenu=False):
+    """
+    Vérifie une sortie contre son entrée du manifeste : présence, taille et, si le fichier
+    a été modifié depuis (ou avec verifier_contenu), SHA-256. Retourne None si la sortie
+    est valide, sinon la raison.
+    """
+    valeurs = entree(path)
+    if valeurs is None:
+        return "absent du manifeste" if os.path.exists(path) else "introuvable"
+    reel = os.path.join(os.path.dirname(path), valeurs['fichier'])
+    if not os.path.exists(reel):
+        return "introuvable"
+    stat = os.stat(reel)
+    if stat.st_size != valeurs['octets']:
+        return f"taille {stat.st_size} octets au lieu de {valeurs['octets']}"
+    if (verifier_contenu or stat.st_mtime_ns != valeurs['mtime_ns']) and _hacher(reel, valeurs) != valeurs['sha256']:
+        return "contenu modifié (SHA-256 différent)"
+    return None
+
+class _Empreinte(io.RawIOBase):
+    """Flux binaire qui calcule le SHA-256 et la taille de ce qui est écrit."""
+
+    def __init__(self, f):
+        self.f = f
+        self.sha256 = hashlib.sha256()
+        self.octets = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self.f.write(b)
+        self.sha256.update(b)
+        self.octets += len(b)
+        return len(b)
+
+def _flux_texte(empreinte, compression):
+    """Flux texte utf-8 (fins de ligne non traduites), compressé si besoin, écrit dans empreinte."""
+    if compression == 'gzip':
+        flux = gzip.GzipFile(filename='', mode='wb', fileobj=empreinte, mtime=0)
+    elif compression == 'zstd':
+        import zstandard
+        flux = zstandard.ZstdCompressor().stream_writer(empreinte, closefd=False)
+    else:
+        flux = io.BufferedWriter(empreinte, buffer_size=1 << 20)
+    return io.TextIOWrapper(flux, encoding='utf-8', newline='')
+
+class FichierSortie:
+    """
+    Contexte d'écriture d'une sortie : `fichier` est un flux texte (utf-8, sans traduction
+    des fins de ligne) à passer à to_csv ou csv.writer. L'appelant renseigne `lignes`
+    (lignes de données) et le schéma via decrire(df) ou `colonnes`. À la sortie du bloc, le
+    fichier temporaire remplace atomiquement la cible et le manifeste est mis à jour ; en cas
+    d'exception, la cible précédente reste intacte.
+    Avec ajout=True, le contenu existant est recopié puis complété (compression incluse).
+    """
+
+    def __init__(self, path, compression='config', ajout=False):
+        self.path = path
+        self.compression = compression_configuree() if compression == 'config' else compression
+        self.cible = path + COMPRESSIONS.get(self.compression, '')
+        self.ajout = ajout
+        self.lignes = 0
+        self.colonnes = None
+
+    def decrire(self, df):
+        """Schéma de la sortie (colonne → dtype) à partir d'un DataFrame ou d'un bloc."""
+        if self.colonnes is None:
+            self.colonnes = {col: str(dtype) for col, dtype in df.dtypes.items()}
+
+    def __enter__(self):
+        dossier = os.path.dirname(self.path) or '.'
+        os.makedirs(dossier, exist_ok=True)
+        fd, self.tmp = tempfile.mkstemp(dir=dossier, prefix=f".{os.path.basename(self.cible)}.", suffix='.tmp')
+        os.chmod(self.tmp, 0o666 & ~_UMASK)
+        self.brut = os.fdopen(fd, 'wb')
+        self.empreinte = _Empreinte(self.brut)
+        precedent = self._recopier() if self.ajout else None
+        self.fichier = _flux_texte(self.empreinte, self.compression)
+        if precedent:
+            self.fichier.write(precedent)
+            self.lignes = _compter_lignes_texte(precedent)
+        return self
+
+    def _recopier(self):
+        """Recopie la sortie existante dans le fichier temporaire (retourne son texte si elle doit être recompressée)."""
+        precedent = resoudre(self.path)
+        if not os.path.exists(precedent):
+            return None
+        if precedent != self.cible:
+            # Compression changée depuis l'écriture : recopie décompressée puis recompressée
+            with ouvrir(self.path) as f:
+                return f.read()
+        with open(precedent, 'rb') as f:
+            # Les membres gzip et les trames zstd se concatènent : recopie des octets telle quelle
+            shutil.copyfileobj(f, self.empreinte, 1 << 20)
+        # Sortie modifiée depuis son écriture : le nombre de lignes du manifeste n'est plus fiable
+        valeurs = entree(self.path) if valider(self.path) is None else None
+        self.lignes = valeurs['lignes'] if valeurs is not None else _compter_lignes(self.path)
+        if valeurs is not None:
+            self.colonnes = valeurs['colonnes']
+        return None
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.fichier.close()
+            self.brut.flush()
+            if exc_type is None:
+                os.fsync(self.brut.fileno())
+        finally:
+            self.brut.close()
+        if exc_type is not None:
+            os.remove(self.tmp)
+            return False
+        os.replace(self.tmp, self.cible)
+        # Variantes d'un run précédent avec une autre compression : une seule version présente
+        for suffixe in [''] + list(COMPRESSIONS.values()):
+            if self.path + suffixe != self.cible and os.path.exists(self.path + suffixe):
+                os.remove(self.path + suffixe)
+        stat = os.stat(self.cible)
+        _enregistrer(self.path, {
+            'fichier': os.path.basename(self.cible),
+            'compression': self.compression,
+            'lignes': int(self.lignes),
+            'octets': self.empreinte.octets,
+            'sha256': self.empreinte.sha256.hexdigest(),
+            'colonnes': self.colonnes,
+            'mtime_ns': stat.st_mtime_ns,
+            'ecrit_le': datetime.now().isoformat(timespec='seconds'),
+        })
+        return False
+
+def _compter_lignes_texte(contenu):
+    import pandas as pd
+    return len(pd.read_csv(io.StringIO(contenu), dtype=str)) if contenu.strip() else 0
+
+def _compter_lignes(path):
+    import pandas as pd
+    with ouvrir(path) as f:
+        return sum(len(bloc) for bloc in pd.read_csv(f, dtype=str, chunksize=1 << 16))
+
+def ecrire_csv(df, path, compression='config', **options):
+    """Écrit df en CSV via FichierSortie (options transmises à to_csv). Retourne l'entrée du manifeste."""
+    with FichierSortie(path, compression) as sortie:
+        df.to_csv(sortie.fichier, index=False, **options)
+        sortie.lignes = len(df)
+        sortie.decrire(df)
+    return entree(path)
+
+def ajouter_csv(df, path, compression='config', **options):
+    """
+    Ajoute les lignes de df (sans en-tête) à la fin de la sortie path, sur place : seuls les
+    octets ajoutés sont écrits et hachés (nouveau membre gzip ou trame zstd si compressée), le
+    manifeste garde le SHA-256 de chaque segment. En cas d'erreur, le fichier est ramené à sa
+    taille précédente. Si la sortie est absente, invalide ou d'une autre compression, elle est
+    réécrite via FichierSortie (ajout=True). Retourne l'entrée du manifeste.
+    """
+    compression = compression_configuree() if compression == 'config' else compression
+    cible = path + COMPRESSIONS.get(compression, '')
+    valeurs = entree(path)
+    if valeurs is None or valeurs['fichier'] != os.path.basename(cible) or valider(path) is not None:
+        existait = existe(path)
+        with FichierSortie(path, compression, ajout=True) as sortie:
+            df.to_csv(sortie.fichier, header=not existait, index=False, **options)
+            sortie.lignes += len(df)
+            sortie.decrire(df)
+        return entree(path)
+
+    debut = valeurs['octets']
+    try:
+        with open(cible, 'ab') as brut:
+            empreinte = _Empreinte(brut)
+            with _flux_texte(empreinte, compression) as fichier:
+                df.to_csv(fichier, header=False, index=False, **options)
+            brut.flush()
+            os.fsync(brut.fileno())
+    except BaseException:
+        os.truncate(cible, debut)
+        raise
+    segments = (valeurs.get('segments') or [[debut, valeurs['sha256']]]) + [[empreinte.octets,
+                                                                            empreinte.sha256.hexdigest()]]
+    _enregistrer(path, {
+        **valeurs,
+        'lignes': valeurs['lignes'] + len(df),
+        'octets': debut + empreinte.octets,
+        'sha256': _chainer(segments),
+        'segments': segments,
+        'colonnes': valeurs['colonnes'] or {col: str(dtype) for col, dtype in df.dtypes.items()},
+        'mtime_ns': os.stat(cible).st_mtime_ns,
+        'ecrit_le': datetime.now().isoformat(timespec='seconds'),
+    })
+    return entree(path)
+
+def supprimer(path):
+    """Supprime une sortie (toutes variantes de compression) et son entrée du manifeste."""
+    for suffixe in [''] + list(COMPRESSIONS.values()):
+        if os.path.exists(path + suffixe):
+            os.remove(path + suffixe)
+    if entree(path) is not None:
+        _enregistrer(path, None)
@@ -0,0 +1,230 @@
+import os
+import time
+import numpy as np
+import pandas as pd
+
+import sorties
+
+# Format des fichiers intermédiaires entre les étapes : 'csv', 'parquet' ou 'arrow'.
+# Les CSV destinés à Power BI sont toujours produits, quel que soit ce format.
+# Choisi via la variable d'environnement PIPELINE_FORMAT (transmise aux scripts lancés par main.py).
+FORMATS = {'csv': '.csv', 'parquet': '.parquet', 'arrow': '.arrow'}
+
+# Colonnes d'identifiants, typées en entiers nullables (Int64)
+ID_COLUMNS = ['id', 'users_id', 'states_id', 'phonemodels_id', 'utilisateur_id', 'modele_id']
+
+# Schéma déclaré des tables exportées, appliqué au chargement (voir lire_table) :
+#   'id'        : identifiant entier, réduit au plus petit type entier (nullable si valeurs manquantes)
+#   'categorie' : valeurs très répétitives (états, noms de modèles), stockées en category
+#   'texte'     : chaînes adossées à pyarrow (au lieu d'objets Python)
+# Les colonnes absentes du schéma gardent le type déduit par pandas.
+SCHEMAS = {
+    'telephones': {
+        'id': 'id', 'name': 'texte', 'serial': 'texte', 'date_mod': 'texte', 'date_creation': 'texte',
+        'contact': 'texte', 'comment': 'texte', 'users_id': 'id', 'states_id': 'categorie',
+        'phonemodels_id': 'id',
+    },
+    'utilisateurs': {'utilisateur_id': 'id', 'nom_utilisateur': 'texte'},
+    'modeles_telephones': {'modele_id': 'id', 'nom_modele': 'categorie', 'date_modification': 'texte'},
+}
+
+# Colonnes lues par chaque étape (les autres ne sont jamais chargées)
+COLONNES_ETAPES = {
+    'detection': ['users_id', 'states_id', 'date_mod', 'name', 'phonemodels_id'],
+}
+
+def format_intermediaire():
+    """Retourne le format intermédiaire configuré (csv si pyarrow est absent)."""
+    fmt = os.environ.get('PIPELINE_FORMAT', 'csv').lower()
+    if fmt not in FORMATS:
+        print(f"[ALERTE] Format intermédiaire inconnu '{fmt}' — utilisation de csv.")
+        return 'csv'
+    if fmt != 'csv':
+        try:
+            import pyarrow  # noqa: F401
+        except ImportError:
+            print("[ALERTE] pyarrow n'est pas installé — utilisation de csv.")
+            return 'csv'
+    return fmt
+
+def chemin_intermediaire(path, fmt):
+    """Remplace l'extension de path par celle du format."""
+    return os.path.splitext(path)[0] + FORMATS[fmt]
+
+def typer_colonnes(df, date_columns=()):
+    """
+    Applique le schéma des fichiers intermédiaires : identifiants en Int64,
+    date_columns en datetime64, tout le reste en texte. Le schéma ne dépend
+    donc ni du bloc lu ni de la façon dont la table a été exportée.
+    """
+    df = df.copy()
+    for col in df.columns:
+        if col in ID_COLUMNS:
+            df[col] = pd.to_numeric(df[col], errors='coerce').astype('Int64')
+        elif col in date_columns:
+            df[col] = pd.to_datetime(df[col], errors='coerce')
+        else:
+            df[col] = df[col].astype('string')
+    return df
+
+def _type_texte():
+    """Chaînes pyarrow si disponible, sinon chaînes pandas."""
+    try:
+        import pyarrow  # noqa: F401
+        return pd.StringDtype('pyarrow')
+    except ImportError:
+        return pd.StringDtype()
+
+def _reduire_entiers(serie):
+    """Plus petit type entier capable de contenir la colonne (nullable s'il manque des valeurs)."""
+    if not pd.api.types.is_numeric_dtype(serie) or pd.api.types.is_bool_dtype(serie):
+        return serie  # Texte parasite dans la colonne : laissée telle quelle
+    valeurs = serie.dropna()
+    if not (valeurs % 1 == 0).all():
+        return serie
+    valeurs = valeurs.astype('int64')
+    type_reduit = pd.to_numeric(valeurs, downcast='integer').dtype if len(valeurs) else np.dtype('int8')
+    if serie.isna().any() or isinstance(serie.dtype, pd.api.extensions.ExtensionDtype):
+        return serie.astype(type_reduit.name.capitalize())  # int16 → Int16 (nullable)
+    return serie.astype(type_reduit)
+
+def compacter(df, table):
+    """Applique SCHEMAS[table] à df (en place) : entiers réduits, catégories, chaînes pyarrow."""
+    for col, genre in SCHEMAS.get(table, {}).items():
+        if col not in df.columns:
+            continue
+        if genre == 'id':
+            df[col] = _reduire_entiers(df[col])
+        elif genre == 'categorie':
+            # Codes numériques (states_id) réduits en entiers avant la catégorie : sinon un vide
+            # les fait passer en float et ils seraient écrits « 2.0 » au lieu de « 2 »
+            df[col] = _reduire_entiers(df[col]).astype('category')
+        else:
+            df[col] = df[col].astype(_type_texte())
+    return df
+
+def lire_csv_compact(path, table, colonnes=None):
+    """
+    Lit un CSV exporté avec le schéma déclaré : seulement `colonnes` (si fourni, celles
+    qui existent), chaînes typées dès la lecture, puis identifiants réduits et catégories.
+    """
+    schema = SCHEMAS.get(table, {})
+    path = sorties.resoudre(path)
+    if colonnes is not None:
+        entete = pd.read_csv(path, nrows=0, encoding='utf-8').columns
+        colonnes = [c for c in colonnes if c in entete]
+    # Chaînes typées dès la lecture ; entiers et catégories sont réduits après inférence
+    dtype = {col: _type_texte() for col, genre in schema.items() if genre == 'texte'}
+    return compacter(pd.read_csv(path, usecols=colonnes, dtype=dtype, encoding='utf-8'), table)
+
+def empreinte_mo(df):
+    """Mémoire occupée par df (chaînes comprises), en Mo."""
+    return round(df.memory_usage(deep=True).sum() / 2**20, 2)
+
+def rapport_memoire(path, table, colonnes=None):
+    """
+    Compare l'empreinte mémoire d'un CSV chargé par inférence (read_csv sans schéma,
+    toutes colonnes) et avec le schéma compact. Affiche et retourne {avant_mo, apres_mo}.
+    """
+    avant = empreinte_mo(pd.read_csv(sorties.resoudre(path), encoding='utf-8'))
+    apres = empreinte_mo(lire_csv_compact(path, table, colonnes))
+    print(f"[MEMOIRE] {path} : {avant} Mo (inférence) → {apres} Mo (schéma {table}"
+          + (f", {len(colonnes)} colonnes" if colonnes else "") + ")")
+    return {'avant_mo': avant, 'apres_mo': apres}
+
+class EcrivainBlocs:
+    """
+    Écrit un fichier Parquet ou Arrow IPC bloc par bloc (schéma fixé par le premier bloc),
+    dans un fichier temporaire qui ne remplace path qu'à la fermeture (abandonner() le supprime).
+    """
+
+    def __init__(self, path, fmt, date_columns=()):
+        self.path = path
+        self.tmp = f"{path}.{os.getpid()}.{id(self)}.tmp"
+        self.fmt = fmt
+        self.date_columns = date_columns
+        self.schema = None
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow as pa
+        table = pa.Table.from_pandas(typer_colonnes(df, self.date_columns), schema=self.schema, preserve_index=False)
+        if self.writer is None:
+            self.schema = table.schema
+            if self.fmt == 'parquet':
+                import pyarrow.parquet as pq
+                self.writer = pq.ParquetWriter(self.tmp, self.schema)
+            else:
+                self.writer = pa.ipc.new_file(self.tmp, self.schema)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            os.replace(self.tmp, self.path)
+            self.writer = None
+
+    def abandonner(self):
+        """Ferme et supprime le fichier temporaire : le fichier précédent reste en place."""
+        if self.writer is not None:
+            self.writer.close()
+            os.remove(self.tmp)
+            self.writer = None
+
+def ecrire_table(df, path, fmt, date_columns=()):
+    """
+    Écrit df au format fmt (path est le chemin CSV de référence, l'extension est adaptée).
+    Retourne un rapport {chemin, octets, duree}.
+    """
+    start = time.perf_counter()
+    target = chemin_intermediaire(path, fmt)
+    if fmt == 'csv':
+        sorties.ecrire_csv(df, target)
+        target = sorties.resoudre(target)
+    else:
+        ecrivain = EcrivainBlocs(target, fmt, date_columns)
+        try:
+            ecrivain.write(df)
+        except Exception:
+            ecrivain.abandonner()
+            raise
+        ecrivain.close()
+    return {'chemin': target, 'octets': os.path.getsize(target), 'duree': time.perf_counter() - start}
+
+def lire_table(path, fmt, table=None, colonnes=None):
+    """
+    Lit une table écrite par ecrire_table. Les formats binaires sont lus via memory-mapping
+    et conservent leurs types (pas de ré-inférence ni de re-parsing des dates).
+    Avec table (clé de SCHEMAS), le schéma compact est appliqué ; avec colonnes,
+    seules ces colonnes (parmi celles présentes) sont chargées.
+    """
+    target = chemin_intermediaire(path, fmt)
+    if fmt == 'csv':
+        if table is not None:
+            return lire_csv_compact(target, table, colonnes)
+        return pd.read_csv(sorties.resoudre(target), usecols=colonnes, encoding='utf-8')
+    if fmt == 'parquet':
+        import pyarrow.parquet as pq
+        if colonnes is not None:
+            colonnes = [c for c in colonnes if c in pq.read_schema(target).names]
+        df = pd.read_parquet(target, columns=colonnes, memory_map=True)
+    else:
+        import pyarrow as pa
+        with pa.memory_map(target, 'r') as source:
+            arrow_table = pa.ipc.open_file(source).read_all()
+        if colonnes is not None:
+            arrow_table = arrow_table.select([c for c in colonnes if c in arrow_table.column_names])
+        df = arrow_table.to_pandas()
+    return compacter(df, table) if table is not None else df
+
+def rapport_format(rapport, csv_path, csv_duree=None):
+    """Affiche la taille (et le temps) gagnés par le fichier intermédiaire par rapport au CSV."""
+    csv_path = sorties.resoudre(csv_path)
+    if not os.path.exists(csv_path) or rapport['chemin'] == csv_path:
+        return
+    csv_octets = os.path.getsize(csv_path)
+    message = (f"[FORMAT] {rapport['chemin']} : {rapport['octets']} octets "
+               f"(CSV : {csv_octets} octets, gain {csv_octets - rapport['octets']} octets)")
+    if csv_duree is not None:
+        message += f", écriture {rapport['duree']:.2f} s (CSV : {csv_duree:.2f} s)"
+    print(message)
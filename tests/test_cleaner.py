@@ -0,0 +1,162 @@
+import io
+import re
+from datetime import datetime
+
+import pandas as pd
+import pytest
+
+import cleaner
+import extraction_dates
+
+# Attributions exportées : date_mod manquante sur la première ligne, sur des lignes
+# consécutives, vide ou NaN dans les sources, dates invalides, plusieurs formats dans
+# un même texte, comment et contact tous deux datés, modèle inconnu, sans modèle ou sans date de modification.
+TELEPHONES_CSV = """\
+id,name,date_mod,date_creation,contact,comment,users_id,states_id,phonemodels_id
+1,TEL-1,,,,,5,2,10
+2,TEL-2,,12/03/2019 10:00:00,,,5,2,11
+3,TEL-3,,,,changé le 2020-01-05,6,2,12
+4,TEL-4,,,appel 05/06/2021,,6,2,13
+5,TEL-5,2018-01-01 00:00:00,01/01/2000,,,7,2,10
+6,TEL-6,,31/02/2019,,,7,2,99
+7,TEL-7,,pas de date,,2019-13-45,0,2,12
+8,TEL-8,,,,,8,1,14
+9,TEL-9,,,,,8,1,
+10,TEL-10,,le 01/02/2003 et 2004-05-06,,,9,2,10
+11,TEL-11,,2004-05-06 puis 01/02/2003,,,9,2,10
+12,TEL-12,,31/02/2019 puis 2019-02-03,,le 29/02/2020,9,2,10
+13,TEL-13,2021-07-07 00:00:00,,,,10,2,11
+14,TEL-14,,29/02/2019,le 2019-02-29,contact 28/02/2019,10,2,
+15,TEL-15,,,05/05/2005,remis le 2006-06-06,11,2,12
+"""
+
+MODELES_CSV = """\
+modele_id,nom_modele,date_modification
+10,Modèle 10,2015-05-05 00:00:00
+11,Modèle 11,2016-06-06 00:00:00
+12,Modèle 12,2017-07-07 00:00:00
+13,Modèle 13,
+14,Modèle 14,
+"""
+
+def _ancienne_extraction(text):
+    """extract_date_from_string de la version initiale (regex puis strptime)."""
+    if not isinstance(text, str):
+        return None
+    match1 = re.search(r'(\d{2}/\d{2}/\d{4})(?:\s+\d{2}:\d{2}:\d{2})?', text)
+    match2 = re.search(r'(\d{4}-\d{2}-\d{2})(?:\s+\d{2}:\d{2}:\d{2})?', text)
+    try:
+        if match1:
+            return datetime.strptime(match1.group(1), '%d/%m/%Y').strftime('%Y-%m-%d')
+        if match2:
+            return datetime.strptime(match2.group(1), '%Y-%m-%d').strftime('%Y-%m-%d')
+    except ValueError:
+        return None
+    return None
+
+def _ancien_remplissage(df, modeles_path):
+    """Boucle ligne à ligne de la version initiale de clean_dataset (étapes 1 à 4)."""
+    mask = df['date_mod'].isna() | (df['date_mod'] == '')
+    for source in ['date_creation', 'comment', 'contact']:
+        for idx in df[mask].index:
+            extracted = _ancienne_extraction(df.at[idx, source])
+            if extracted:
+                df.at[idx, 'date_mod'] = extracted + ' 00:00:00'
+        mask = df['date_mod'].isna() | (df['date_mod'] == '')
+    modeles_df = pd.read_csv(modeles_path, encoding='utf-8')
+    modeles_df['modele_id'] = pd.to_numeric(modeles_df['modele_id'], errors='coerce').astype('Int64')
+    modeles_dict = modeles_df.set_index('modele_id')['date_modification'].to_dict()
+    df['phonemodels_id'] = pd.to_numeric(df['phonemodels_id'], errors='coerce').astype('Int64')
+    df.loc[mask, 'date_mod'] = df.loc[mask, 'phonemodels_id'].map(modeles_dict)
+    return df
+
+@pytest.fixture
+def formats_initiaux():
+    """Seuls les formats de la version initiale (JJ/MM/AAAA, AAAA-MM-JJ) sont reconnus."""
+    supplementaires = extraction_dates.FORMATS_SUPPLEMENTAIRES
+    extraction_dates.configurer(formats_supplementaires=[])
+    yield
+    extraction_dates.configurer(formats_supplementaires=supplementaires)
+
+@pytest.fixture
+def exports(tmp_path):
+    dossier = tmp_path / "exports"
+    dossier.mkdir()
+    (dossier / "modeles_telephones.csv").write_text(MODELES_CSV, encoding='utf-8')
+    return dossier
+
+def _octets(df):
+    return df.to_csv(index=False).encode('utf-8')
+
+def test_remplissage_vectorise_identique_a_la_boucle(formats_initiaux, exports):
+    attendu = _ancien_remplissage(pd.read_csv(io.StringIO(TELEPHONES_CSV)), exports / "modeles_telephones.csv")
+
+    df = pd.read_csv(io.StringIO(TELEPHONES_CSV))
+    comptes = cleaner.fill_date_mod(df, cleaner.load_modeles_dates(str(exports / "modeles_telephones.csv")),
+                                    verbose=False)
+
+    assert _octets(df) == _octets(attendu)
+    assert comptes == {'date_creation': 3, 'comment': 4, 'contact': 1, 'modeles_telephones.csv': 2}
+
+def test_remplissage_sans_modeles(formats_initiaux):
+    df = pd.read_csv(io.StringIO(TELEPHONES_CSV))
+    cleaner.fill_date_mod(df, None, verbose=False)
+
+    # Sans dernier recours, seules les lignes sans date exploitable restent vides
+    assert df['date_mod'].isna().tolist() == [True, False, False, False, False, True, True,
+                                              True, True, False, False, False, False, False, False]
+
+def _ancien_nettoyage(telephones_path, modeles_path):
+    """clean_dataset de la version initiale : lecture pandas par défaut, drop_duplicates, boucles."""
+    df = pd.read_csv(telephones_path, encoding='utf-8').drop_duplicates()
+    df = _ancien_remplissage(df, modeles_path)
+    isolated_df = df[(df['users_id'] == 0) & (df['states_id'] == 2)]
+    return _octets(df), _octets(isolated_df)
+
+def test_nettoyage_complet_identique_a_la_boucle(formats_initiaux, exports, tmp_path, monkeypatch):
+    monkeypatch.delenv('PIPELINE_FORMAT', raising=False)
+    monkeypatch.delenv('PIPELINE_COMPRESSION', raising=False)
+    monkeypatch.delenv('PIPELINE_DOUBLONS', raising=False)
+    monkeypatch.chdir(tmp_path)
+    # Doublon exact de la dernière ligne : retiré par les deux versions
+    (exports / "telephones.csv").write_text(TELEPHONES_CSV + TELEPHONES_CSV.splitlines()[-1] + "\n",
+                                            encoding='utf-8')
+    attendu_nettoye, attendu_isole = _ancien_nettoyage(exports / "telephones.csv", exports / "modeles_telephones.csv")
+
+    # Chargement par le schéma compact (stockage.lire_table), remplissage en colonne
+    cleaner.clean_dataset("exports/telephones.csv", "cleaned_telephones.csv", "isolated_telephones.csv")
+
+    assert (tmp_path / "cleaned_telephones.csv").read_bytes() == attendu_nettoye
+    assert (tmp_path / "isolated_telephones.csv").read_bytes() == attendu_isole
+
+UTILISATEURS_CSV = """\
+utilisateur_id,nom_utilisateur
+5,Alice
+6,Bob
+7,Chloé
+9,Inès
+"""
+
+def test_streaming_identique_au_mode_memoire(exports, tmp_path, monkeypatch):
+    monkeypatch.delenv('PIPELINE_FORMAT', raising=False)
+    monkeypatch.delenv('PIPELINE_COMPRESSION', raising=False)
+    monkeypatch.delenv('PIPELINE_DOUBLONS', raising=False)
+    # states_id vide sur deux lignes : la colonne ne doit pas passer en float (« 2.0 ») en mémoire
+    telephones = TELEPHONES_CSV.replace("8,TEL-8,,,,,8,1,14", "8,TEL-8,,,,,8,,14").replace(
+        "13,TEL-13,2021-07-07 00:00:00,,,,10,2,11", "13,TEL-13,2021-07-07 00:00:00,,,,10,,11")
+    sorties_nettoyage = ["cleaned_telephones.csv", "isolated_telephones.csv", "cleaned_telephones_filtered.csv",
+                         "rejected_telephones.csv"]
+    resultats = {}
+    for streaming in (False, True):
+        dossier = tmp_path / ("streaming" if streaming else "memoire")
+        (dossier / "exports").mkdir(parents=True)
+        (dossier / "exports" / "telephones.csv").write_text(telephones, encoding='utf-8')
+        (dossier / "exports" / "utilisateurs.csv").write_text(UTILISATEURS_CSV, encoding='utf-8')
+        (dossier / "exports" / "modeles_telephones.csv").write_text(MODELES_CSV, encoding='utf-8')
+        monkeypatch.chdir(dossier)
+        cleaner.main(streaming=streaming)
+        resultats[streaming] = {nom: (dossier / nom).read_bytes() for nom in sorties_nettoyage}
+
+    assert b'2.0' not in resultats[False]['cleaned_telephones.csv']
+    for nom in sorties_nettoyage:
+        assert resultats[False][nom] == resultats[True][nom], nom
@@ -0,0 +1,107 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import dedoublonnage
+
+REGLES = {regle['nom']: regle for regle in dedoublonnage.REGLES_DOUBLONS}
+
+# Lignes 1 : doublon exact de 0 ; 2 : doublon de 0 aux espaces, à la casse et à la date_mod près ;
+# 4 : même appareil et même utilisateur que 3 ; 6 : même utilisateur que 5 mais serial vide
+TELEPHONES_CSV = """\
+id,name,serial,date_mod,users_id,states_id
+1,TEL-1,SN-001,2020-01-01 00:00:00,5,2
+1,TEL-1,SN-001,2020-01-01 00:00:00,5,2
+1,  tel-1 ,sn-001,2021-06-01 00:00:00,5,2
+2,TEL-2,SN-002,2020-01-01 00:00:00,6,2
+3,TEL-3,sn-002 ,2022-01-01 00:00:00,6,1
+4,TEL-4,,2020-01-01 00:00:00,7,2
+5,TEL-5,,2020-01-01 00:00:00,7,2
+6,TEL-6,SN-002,2020-01-01 00:00:00,8,2
+"""
+
+def _lire(texte=TELEPHONES_CSV):
+    return pd.read_csv(io.StringIO(texte), dtype=str)
+
+@pytest.fixture(autouse=True)
+def sans_selection(monkeypatch):
+    monkeypatch.delenv('PIPELINE_DOUBLONS', raising=False)
+
+@pytest.mark.parametrize('nom, attendus', [
+    ('ligne_identique', [1]),
+    ('ligne_normalisee', [1, 2]),
+    ('serial_utilisateur', [1, 2, 4]),
+])
+def test_regles(nom, attendus):
+    masque = dedoublonnage.doublons(_lire(), REGLES[nom])
+
+    assert np.flatnonzero(masque).tolist() == attendus
+
+def test_regle_sans_ses_colonnes():
+    assert dedoublonnage.doublons(_lire().drop(columns='serial'), REGLES['serial_utilisateur']) is None
+
+def test_selection_par_variable_d_environnement(monkeypatch, capsys):
+    assert [regle['nom'] for regle in dedoublonnage.regles_actives()] == ['ligne_identique']
+
+    monkeypatch.setenv('PIPELINE_DOUBLONS', 'serial_utilisateur, inconnue,ligne_normalisee')
+    assert [regle['nom'] for regle in dedoublonnage.regles_actives()] == ['serial_utilisateur', 'ligne_normalisee']
+    assert "Règle de doublons inconnue 'inconnue'" in capsys.readouterr().out
+
+    # Règles appliquées dans l'ordre, chacune sur les lignes conservées par les précédentes
+    df, comptes = dedoublonnage.dedoublonner(_lire(), verbose=False)
+    assert df['id'].tolist() == ['1', '2', '4', '5', '6']
+    assert comptes == {'serial_utilisateur': 3, 'ligne_normalisee': 0}
+
+def _telephones_volumineux(chemin):
+    """3000 lignes, un tiers de doublons (exacts ou à la casse près), serials parfois vides."""
+    tirage = np.random.default_rng(17)
+    lignes = []
+    for i in range(3000):
+        source = int(tirage.integers(0, i)) if i and tirage.random() < 0.33 else i
+        serial = '' if source % 11 == 0 else f"SN-{source % 700}"
+        nom = f"TEL-{source}" if tirage.random() < 0.5 else f" tel-{source}"
+        lignes.append(f"{source},{nom},{serial},2020-01-01 00:00:00,{source % 50},2")
+    chemin.write_text("id,name,serial,date_mod,users_id,states_id\n" + '\n'.join(lignes) + '\n', encoding='utf-8')
+
+def test_doublons_externes_identiques_au_mode_memoire(tmp_path):
+    chemin = tmp_path / "telephones.csv"
+    _telephones_volumineux(chemin)
+    regles = list(REGLES.values())
+
+    masque, comptes = dedoublonnage.doublons_externes(str(chemin), regles, chunksize=400, dossier=str(tmp_path))
+
+    attendu, comptes_attendus = dedoublonnage.dedoublonner(pd.read_csv(chemin, dtype=str), regles, verbose=False)
+    assert np.flatnonzero(~masque).tolist() == attendu.index.tolist()
+    assert comptes == comptes_attendus
+    assert [f.name for f in tmp_path.iterdir()] == ["telephones.csv"]
+
+def test_doublons_externes_collision_de_hash(tmp_path, monkeypatch):
+    chemin = tmp_path / "telephones.csv"
+    chemin.write_text(TELEPHONES_CSV, encoding='utf-8')
+    # Toutes les clés sur le même hash (et donc dans le même seau) : seule la comparaison exacte départage
+    monkeypatch.setattr(dedoublonnage, 'hacher', lambda cles: np.zeros(len(cles), dtype=np.uint64))
+
+    masque, comptes = dedoublonnage.doublons_externes(str(chemin), [REGLES['ligne_identique']], chunksize=3)
+
+    assert np.flatnonzero(masque).tolist() == [1]
+    assert comptes == {'ligne_identique': 1}
+
+def test_flux_identique_au_mode_memoire(tmp_path):
+    chemin = tmp_path / "telephones.csv"
+    _telephones_volumineux(chemin)
+    regles = list(REGLES.values())
+    dedoublonneur = dedoublonnage.DedoublonneurFlux(regles)
+
+    blocs = [dedoublonneur.filtrer(bloc) for bloc in pd.read_csv(chemin, dtype=str, chunksize=50)]
+
+    attendu, comptes = dedoublonnage.dedoublonner(pd.read_csv(chemin, dtype=str), regles, verbose=False)
+    pd.testing.assert_frame_equal(pd.concat(blocs), attendu)
+    assert dedoublonneur.comptes == comptes
+    for niveaux in dedoublonneur.vus.values():
+        # Tableaux triés, sans hash commun, de tailles au moins divisées par deux d'un niveau au suivant
+        tous = np.concatenate(niveaux)
+        assert len(np.unique(tous)) == len(tous)
+        assert all((vus[1:] > vus[:-1]).all() for vus in niveaux)
+        assert all(len(suivant) * 2 < len(niveau) for niveau, suivant in zip(niveaux, niveaux[1:]))
@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+import detecter_remplacements_anticipes as detecteur
+
+UTILISATEURS_CSV = """\
+utilisateur_id,nom_utilisateur
+1,Alice
+2,Bob
+3,Chloé
+4,David
+9,Inès
+"""
+
+# Attributions (id, users_id, date_mod) : intervalles de moins et de plus de 2 ans, attribution sans date
+ATTRIBUTIONS = [
+    (1, 1, '2018-01-01'), (2, 1, '2019-01-01'), (3, 1, '2022-06-01'),
+    (4, 2, '2017-03-01'), (5, 2, '2020-03-01'), (6, 2, '2021-01-01'),
+    (7, 3, '2019-05-01'), (8, 3, '2019-09-01'), (9, 3, '2020-02-01'),
+    (10, 4, '2016-01-01'), (11, 4, None), (12, 4, '2017-01-01'),
+]
+
+# Scénarios : (attributions ajoutées, ids supprimés, utilisateurs_modifies.csv {users_id: lignes_modifiees})
+SCENARIOS = {
+    'aucun_changement': ([], [], {}),
+    'ajouts': ([(20, 1, '2023-01-01'), (21, 9, '2021-01-01'), (22, 9, '2022-01-01')], [], {1: 0, 9: 0}),
+    'ligne_anterieure': ([(23, 2, '2018-06-01')], [], {2: 0}),
+    'suppression': ([], [8], {3: 1}),
+}
+
+def _ecrire(dossier, attributions, modifies=None):
+    (dossier / "exports").mkdir(exist_ok=True)
+    (dossier / "exports" / "utilisateurs.csv").write_text(UTILISATEURS_CSV, encoding='utf-8')
+    pd.DataFrame({
+        'id': [a[0] for a in attributions],
+        'name': [f"TEL-{a[0]}" for a in attributions],
+        'users_id': [a[1] for a in attributions],
+        'states_id': 2,
+        'phonemodels_id': 10,
+        'date_mod': [f"{a[2]} 00:00:00" if a[2] else None for a in attributions],
+    }).to_csv(dossier / "cleaned_telephones_filtered.csv", index=False)
+    if modifies is not None:
+        pd.DataFrame({'users_id': list(modifies), 'lignes_modifiees': list(modifies.values())},
+                     dtype='int64').to_csv(dossier / "exports" / "utilisateurs_modifies.csv", index=False)
+
+def _remplacements(dossier):
+    df = pd.read_csv(dossier / "remplacements_anticipes.csv", dtype=str, keep_default_na=False)
+    return df.sort_values(list(df.columns)).reset_index(drop=True)
+
+@pytest.mark.parametrize('scenario', list(SCENARIOS))
+def test_incremental_identique_au_calcul_complet(scenario, tmp_path, monkeypatch):
+    monkeypatch.delenv('PIPELINE_FORMAT', raising=False)
+    monkeypatch.delenv('PIPELINE_COMPRESSION', raising=False)
+    ajoutees, supprimees, modifies = SCENARIOS[scenario]
+    apres = [a for a in ATTRIBUTIONS if a[0] not in supprimees] + ajoutees
+
+    incremental, complet = tmp_path / "incremental", tmp_path / "complet"
+    incremental.mkdir()
+    complet.mkdir()
+    monkeypatch.chdir(incremental)
+    _ecrire(incremental, ATTRIBUTIONS)
+    detecteur.main()
+    _ecrire(incremental, apres, modifies)
+    detecteur.main(incremental=True)
+
+    monkeypatch.chdir(complet)
+    _ecrire(complet, apres)
+    detecteur.main()
+
+    pd.testing.assert_frame_equal(_remplacements(incremental), _remplacements(complet))
+    assert ((incremental / "utilisateurs_multi_remplacements.csv").read_bytes()
+            == (complet / "utilisateurs_multi_remplacements.csv").read_bytes())
+    with np.load(incremental / detecteur.ETAT_FILE) as etat, np.load(complet / detecteur.ETAT_FILE) as attendu:
+        for colonne in detecteur.COLONNES_ETAT:
+            np.testing.assert_array_equal(etat[colonne], attendu[colonne])
+
+def test_incremental_sans_utilisateur_modifie_garde_l_etat():
+    df = pd.DataFrame({'users_id': pd.array([1, 1], dtype='Int64'), 'states_id': pd.array([2, 2], dtype='Int64'),
+                       'date_mod': pd.to_datetime(['2018-01-01', '2019-01-01']), 'name': ['A', 'B']})
+    triees = detecteur.trier_attributions(df)
+    remplacements, _ = detecteur.detecter_remplacements_anticipes(triees, {}, deja_trie=True)
+    etat = detecteur.construire_etat(triees, remplacements)
+
+    ajouts, correctifs, corriges, nouvel_etat = detecteur.detecter_remplacements_incremental(df, {}, [], etat)
+
+    assert ajouts.empty and correctifs.empty and corriges == set()
+    assert list(ajouts.columns) == list(remplacements.columns)
+    pd.testing.assert_frame_equal(nouvel_etat, etat)
+
+def test_ordre_numerique_des_utilisateurs():
+    # Un remplacement anticipé pour 2, 9 et 100, deux pour 10 : l'ordre du texte mettrait 10 et 100 avant 2
+    lignes = [(10, '2018-01-01'), (10, '2018-06-01'), (10, '2019-01-01'), (9, '2018-01-01'), (9, '2019-01-01'),
+              (100, '2018-01-01'), (100, '2019-01-01'), (2, '2018-01-01'), (2, '2019-01-01')]
+    df = pd.DataFrame({'users_id': pd.array([u for u, _ in lignes], dtype='Int64'), 'states_id': 2,
+                       'date_mod': pd.to_datetime([d for _, d in lignes]),
+                       'name': [f"TEL-{i}" for i in range(len(lignes))]})
+
+    remplacements, utilisateurs = detecteur.detecter_remplacements_anticipes(df, {})
+
+    assert remplacements['users_id'].tolist() == [2, 9, 10, 10, 100]
+    # Du plus grand nombre de remplacements au plus petit, dans le même ordre depuis l'état
+    assert utilisateurs['users_id'].tolist() == [10, 2, 9, 100]
+    etat = detecteur.construire_etat(detecteur.trier_attributions(df), remplacements)
+    assert detecteur.resumer_depuis_etat(etat, {})['users_id'].tolist() == [10, 2, 9, 100]
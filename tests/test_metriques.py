@@ -0,0 +1,30 @@
+import os
+import signal
+import subprocess
+import sys
+import time
+
+import metriques
+
+def test_enfants_et_petits_enfants():
+    # Processus enfant qui lance lui-même un processus (comme un worker du pool)
+    enfant = subprocess.Popen([sys.executable, '-c',
+                               "import subprocess, sys, time; "
+                               "p = subprocess.Popen([sys.executable, '-c', 'import time; time.sleep(5)']); "
+                               "print(p.pid, flush=True); time.sleep(5)"],
+                              stdout=subprocess.PIPE, text=True)
+    petit_enfant = int(enfant.stdout.readline())
+    try:
+        assert {enfant.pid, petit_enfant} <= set(metriques._enfants())
+    finally:
+        os.kill(petit_enfant, signal.SIGKILL)
+        enfant.kill()
+        enfant.wait()
+        enfant.stdout.close()
+
+def test_pic_rss_des_enfants_pendant_l_etape():
+    with metriques.mesurer("test_enfants") as mesure:
+        subprocess.run([sys.executable, '-c', "import time; x = bytearray(50 * 2**20); time.sleep(0.3)"], check=True)
+        time.sleep(metriques.INTERVALLE_RSS_S)
+
+    assert mesure['rss_pic_enfants_mo'] >= 50
@@ -0,0 +1,59 @@
+import random
+
+import numpy as np
+import pytest
+
+pytest.importorskip('pyarrow')
+
+import cleaner  # noqa: E402
+import detecter_remplacements_anticipes as detecteur  # noqa: E402
+import parallele  # noqa: E402
+
+SORTIES = ["cleaned_telephones.csv", "isolated_telephones.csv", "cleaned_telephones_filtered.csv",
+           "rejected_telephones.csv", "remplacements_anticipes.csv", "utilisateurs_multi_remplacements.csv",
+           "analyse_remplacements.csv"]
+
+def _exports(dossier):
+    """Exports de 600 lignes : doublons, dates à extraire, utilisateurs inconnus ou 0, états et modèles variés."""
+    tirage = random.Random(11)
+    lignes = ["id,name,serial,date_mod,date_creation,contact,comment,users_id,states_id,phonemodels_id"]
+    for i in range(1, 601):
+        date_mod = f"20{tirage.randint(10, 24)}-{tirage.randint(1, 12):02d}-{tirage.randint(1, 28):02d} 00:00:00"
+        date_creation = comment = ''
+        if tirage.random() < 0.3:
+            date_mod, date_creation = '', f"{tirage.randint(1, 28):02d}/{tirage.randint(1, 12):02d}/2019"
+        elif tirage.random() < 0.1:
+            date_mod, comment = '', f"remis le 2020-{tirage.randint(1, 12):02d}-03"
+        users_id = tirage.choice([0, 99] + list(range(1, 41)) * 5)
+        states_id = tirage.choice(['1', '2', '2', '2', ''])
+        lignes.append(f"{i},TEL-{i},S{i % 450},{date_mod},{date_creation},,{comment},{users_id},{states_id},"
+                      f"{tirage.choice(['10', '11', '12', ''])}")
+    # Doublons exacts (même ligne exportée deux fois)
+    lignes += lignes[1:21]
+    (dossier / "exports").mkdir(parents=True)
+    (dossier / "exports" / "telephones.csv").write_text('\n'.join(lignes) + '\n', encoding='utf-8')
+    (dossier / "exports" / "utilisateurs.csv").write_text(
+        "utilisateur_id,nom_utilisateur\n" + ''.join(f"{u},Utilisateur {u}\n" for u in range(1, 41)), encoding='utf-8')
+    (dossier / "exports" / "modeles_telephones.csv").write_text(
+        "modele_id,nom_modele,date_modification\n10,Modèle 10,2015-05-05 00:00:00\n11,Modèle 11,\n",
+        encoding='utf-8')
+
+def test_deux_processus_identiques_au_sequentiel(tmp_path, monkeypatch):
+    for variable in ('PIPELINE_FORMAT', 'PIPELINE_COMPRESSION', 'PIPELINE_DOUBLONS'):
+        monkeypatch.delenv(variable, raising=False)
+    sequentiel, parallele_dir = tmp_path / "sequentiel", tmp_path / "parallele"
+
+    _exports(sequentiel)
+    monkeypatch.chdir(sequentiel)
+    cleaner.main()
+    detecteur.main()
+
+    _exports(parallele_dir)
+    monkeypatch.chdir(parallele_dir)
+    parallele.executer_en_parallele(nb_processus=2)
+
+    for nom in SORTIES:
+        assert (parallele_dir / nom).read_bytes() == (sequentiel / nom).read_bytes(), nom
+    with np.load(parallele_dir / detecteur.ETAT_FILE) as etat, np.load(sequentiel / detecteur.ETAT_FILE) as attendu:
+        for colonne in detecteur.COLONNES_ETAT:
+            np.testing.assert_array_equal(etat[colonne], attendu[colonne])
@@ -0,0 +1,136 @@
+import io
+
+import pandas as pd
+import pytest
+
+import qualite
+
+UTILISATEURS_CSV = """\
+utilisateur_id,nom_utilisateur
+5,Alice
+6,
+7,Chloé
+-1,Erreur
+"""
+
+# Lignes en violation : 3 (utilisateur inconnu), 4 (date illisible), 5 (état inattendu, id négatif),
+# 6 (date future et modèle inconnu) ; la ligne 2 (users_id = 0) est ignorée par la règle de référence
+TELEPHONES_CSV = """\
+id,name,date_mod,users_id,states_id,phonemodels_id,comment
+1,TEL-1,2020-01-01 00:00:00,5,2,10,
+2,TEL-2,,0,2,10,
+3,TEL-3,2021-05-05 00:00:00,99,1,11,
+4,TEL-4,05/05/2021,6,2,11,"note
+sur deux lignes"
+-5,TEL-5,2019-01-01 00:00:00,7,7,10,
+6,TEL-6,2999-01-01 00:00:00,5,2,42,
+"""
+
+MODELES_CSV = """\
+modele_id,nom_modele,date_modification
+10,Modèle 10,2015-05-05 00:00:00
+11,Modèle 11,
+"""
+
+REGLES = [
+    {'nom': 'utilisateur_id_vide', 'table': 'utilisateurs', 'type': 'vides', 'colonne': 'utilisateur_id',
+     'max_taux': 0.0, 'bloquant': True},
+    {'nom': 'nom_vide', 'table': 'utilisateurs', 'type': 'vides', 'colonne': 'nom_utilisateur',
+     'max_taux': 0.1, 'bloquant': False},
+    {'nom': 'utilisateur_id_invalide', 'table': 'utilisateurs', 'type': 'plage', 'colonne': 'utilisateur_id',
+     'min': 1, 'max_taux': 0.0, 'bloquant': True, 'retirer': True},
+    {'nom': 'id_invalide', 'table': 'telephones', 'type': 'plage', 'colonne': 'id', 'min': 1,
+     'max_taux': 0.0, 'bloquant': False},
+    {'nom': 'date_mod_invalide', 'table': 'telephones', 'type': 'date', 'colonne': 'date_mod',
+     'max_taux': 0.5, 'bloquant': False},
+    {'nom': 'utilisateur_inconnu', 'table': 'telephones', 'type': 'reference', 'colonne': 'users_id',
+     'reference': 'utilisateurs', 'ignorer': [0], 'max_taux': 0.0, 'bloquant': False},
+    {'nom': 'modele_inconnu', 'table': 'telephones', 'type': 'reference', 'colonne': 'phonemodels_id',
+     'reference': 'modeles', 'max_taux': 0.0, 'bloquant': False},
+    {'nom': 'etat_inattendu', 'table': 'telephones', 'type': 'valeurs', 'colonne': 'states_id',
+     'variable': 'PIPELINE_ETATS', 'max_taux': 0.0, 'bloquant': False},
+    {'nom': 'colonne_absente', 'table': 'telephones', 'type': 'vides', 'colonne': 'serial', 'max_taux': 0.0},
+]
+
+@pytest.fixture
+def exports(tmp_path, monkeypatch):
+    monkeypatch.delenv('PIPELINE_COMPRESSION', raising=False)
+    monkeypatch.setenv('PIPELINE_ETATS', '1,2')
+    monkeypatch.chdir(tmp_path)
+    dossier = tmp_path / "exports"
+    dossier.mkdir()
+    (dossier / "utilisateurs.csv").write_text(UTILISATEURS_CSV, encoding='utf-8')
+    (dossier / "telephones.csv").write_text(TELEPHONES_CSV, encoding='utf-8')
+    (dossier / "modeles_telephones.csv").write_text(MODELES_CSV, encoding='utf-8')
+    return dossier
+
+def _resultats(rapport):
+    return {r.regle: (r.lignes_controlees, r.violations, r.statut) for r in rapport.itertuples(index=False)}
+
+def test_types_de_regles(exports):
+    rapport, bloquant = qualite.controler_exports(str(exports), REGLES)
+
+    assert _resultats(rapport) == {
+        'utilisateur_id_vide': (4, 0, 'ok'),
+        'nom_vide': (4, 1, 'alerte'),
+        'utilisateur_id_invalide': (4, 1, 'bloquant'),
+        'id_invalide': (6, 1, 'alerte'),
+        'date_mod_invalide': (6, 2, 'ok'),
+        'utilisateur_inconnu': (6, 1, 'alerte'),
+        'modele_inconnu': (6, 1, 'alerte'),
+        'etat_inattendu': (6, 1, 'alerte'),
+        'colonne_absente': (6, 0, 'ignoree'),
+    }
+    assert bloquant
+
+def test_regle_valeurs_ignoree_sans_configuration(exports, monkeypatch):
+    monkeypatch.delenv('PIPELINE_ETATS')
+    rapport, _ = qualite.controler_exports(str(exports), REGLES)
+
+    assert _resultats(rapport)['etat_inattendu'][2] == 'ignoree'
+
+def test_quarantaine_et_lignes_retirees(exports):
+    qualite.controler_exports(str(exports), REGLES)
+
+    quarantaine = pd.read_csv("quarantaine_telephones.csv", dtype=str, keep_default_na=False)
+    assert dict(zip(quarantaine['id'], quarantaine[qualite.COLONNE_MOTIFS])) == {
+        '3': 'utilisateur_inconnu', '4': 'date_mod_invalide', '-5': 'id_invalide; etat_inattendu',
+        '6': 'date_mod_invalide; modele_inconnu'}
+    # Valeurs recopiées telles qu'exportées, saut de ligne du commentaire compris
+    assert quarantaine.loc[quarantaine['id'] == '4', 'comment'].item() == "note\nsur deux lignes"
+    # Règle `retirer` : la ligne quitte l'export et reste en quarantaine
+    assert pd.read_csv(exports / "utilisateurs.csv")['utilisateur_id'].tolist() == [5, 6, 7]
+    assert pd.read_csv("quarantaine_utilisateurs.csv")['utilisateur_id'].tolist() == [-1]
+    assert qualite.sorties.valider(str(exports / "utilisateurs.csv"), verifier_contenu=True) is None
+
+def test_segments_coupes_entre_deux_enregistrements():
+    lignes = [f'{i},"note {i}\nsuite ""citée""",x\r\n' if i % 7 == 0 else f"{i},simple,x\r\n" for i in range(5000)]
+    texte = ''.join(lignes)
+
+    segments = list(qualite._segments(io.StringIO(texte), 100))
+
+    assert len(segments) > 1 and ''.join(segments) == texte
+    ids = []
+    for segment in segments:
+        bloc = pd.read_csv(io.StringIO("id,comment,autre\r\n" + segment), dtype=str)
+        ids += bloc['id'].tolist()
+        assert (bloc['autre'] == 'x').all()
+    assert ids == [str(i) for i in range(5000)]
+
+def test_echantillon_par_blocs(exports):
+    lignes = [TELEPHONES_CSV.splitlines()[0]] + [
+        f"{i},TEL-{i},2020-01-01 00:00:00,{5 if i % 10 else 99},2,10," for i in range(1, 20001)]
+    (exports / "telephones.csv").write_text('\n'.join(lignes) + '\n', encoding='utf-8')
+    regles = [regle for regle in REGLES if regle['table'] == 'telephones']
+
+    complet, _ = qualite.controler_exports(str(exports), regles, rapport_path="complet.csv",
+                                           dossier_quarantaine=".")
+    echantillon, _ = qualite.controler_exports(str(exports), regles, echantillon=2000)
+
+    controlees = echantillon['lignes_controlees'].iloc[0]
+    assert 1000 < controlees < 4000 and echantillon['echantillon'].all() and not complet['echantillon'].any()
+    taux = dict(zip(echantillon['regle'], echantillon['taux']))
+    assert taux['utilisateur_inconnu'] == pytest.approx(0.1, abs=0.01)
+    quarantaine = pd.read_csv("quarantaine_telephones.csv")
+    assert len(quarantaine) == dict(zip(echantillon['regle'], echantillon['violations']))['utilisateur_inconnu']
+    assert (quarantaine['users_id'] == 99).all()
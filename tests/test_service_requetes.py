@@ -0,0 +1,131 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+import service_requetes
+
+TELEPHONES_CSV = """\
+id,name,users_id,states_id,phonemodels_id
+1,TEL-1,5,2,10
+2,TEL-2,0,2,10
+3,TEL-3,6,1,11
+4,TEL-4,6,2,11
+5,TEL-5,7,2,
+6,TEL-6,0,1,10
+"""
+
+ISOLES_CSV = """\
+id,name,users_id,states_id,phonemodels_id
+2,TEL-2,0,2,10
+"""
+
+MODELES_CSV = """\
+modele_id,nom_modele
+10,Modèle 10
+11,Modèle 11
+"""
+
+# Remplacements écrits dans le désordre : la réponse est triée par utilisateur puis date
+REMPLACEMENTS_CSV = """\
+users_id,nom_utilisateur,nom_tele_precedent,date_precedente,nom_tele_actuel,date_actuelle,intervalle_jours,intervalle_annees
+7,Chloé,TEL-8,2019-01-01,TEL-5,2019-06-01,151,0.41
+5,Alice,TEL-1,2018-01-01,TEL-2,2019-01-01,365,1.0
+6,Bob,TEL-3,2020-01-01,TEL-4,2020-03-01,60,0.16
+5,Alice,TEL-2,2019-01-01,TEL-7,2020-06-01,517,1.42
+5,Alice,TEL-7,2020-06-01,TEL-9,2021-01-01,214,0.59
+"""
+
+@pytest.fixture
+def dossier(tmp_path, monkeypatch):
+    monkeypatch.delenv('PIPELINE_FORMAT', raising=False)
+    monkeypatch.delenv('PIPELINE_COMPRESSION', raising=False)
+    (tmp_path / "exports").mkdir()
+    (tmp_path / "cleaned_telephones.csv").write_text(TELEPHONES_CSV, encoding='utf-8')
+    (tmp_path / "isolated_telephones.csv").write_text(ISOLES_CSV, encoding='utf-8')
+    (tmp_path / "exports" / "modeles_telephones.csv").write_text(MODELES_CSV, encoding='utf-8')
+    (tmp_path / "remplacements_anticipes.csv").write_text(REMPLACEMENTS_CSV, encoding='utf-8')
+    return tmp_path
+
+def _json(reponse):
+    statut, corps, _ = reponse
+    assert statut == 200
+    return json.loads(corps)
+
+def test_stock(dossier):
+    service = service_requetes.ServiceRequetes(str(dossier))
+    service.actualiser()
+
+    stock = _json(service.repondre('/stock', {}))
+    assert (stock['nb_telephones'], stock['nb_attribues'], stock['nb_isoles']) == (6, 3, 1)
+    assert stock['par_etat'] == [{'states_id': 1, 'nb': 2, 'nb_attribues': 0},
+                                 {'states_id': 2, 'nb': 4, 'nb_attribues': 3}]
+    assert [(m['phonemodels_id'], m['nb']) for m in stock['par_modele']['donnees']] == [(10, 3), (11, 2), (None, 1)]
+
+    filtre = _json(service.repondre('/stock', {'states_id': '2', 'modele': '10'}))
+    assert (filtre['nb_telephones'], filtre['nb_attribues'], filtre['nb_isoles']) == (2, 1, 1)
+    assert service.repondre('/stock', {'states_id': 'deux'})[0] == 400
+
+def test_remplacements_pagines(dossier):
+    service = service_requetes.ServiceRequetes(str(dossier))
+    service.actualiser()
+
+    pages, decalage = [], 0
+    while True:
+        page = _json(service.repondre('/remplacements', {'limit': '2', 'offset': str(decalage)}))
+        assert (page['total'], page['limit'], page['offset']) == (5, 2, decalage)
+        if not page['donnees']:
+            break
+        pages.append([(r['users_id'], r['date_actuelle']) for r in page['donnees']])
+        decalage += 2
+    assert pages == [[(5, '2019-01-01'), (5, '2020-06-01')], [(5, '2021-01-01'), (6, '2020-03-01')],
+                     [(7, '2019-06-01')]]
+
+    alice = _json(service.repondre('/remplacements', {'users_id': '5', 'depuis': '2020-01-01'}))
+    assert alice['total'] == 2 and [r['nom_tele_actuel'] for r in alice['donnees']] == ['TEL-7', 'TEL-9']
+    assert service.repondre('/remplacements', {'depuis': 'hier'})[0] == 400
+    # Limite plafonnée
+    assert _json(service.repondre('/remplacements', {'limit': '999999'}))['limit'] == service_requetes.LIMITE_MAX
+
+async def _get(port, chemin, etag=None):
+    reader, writer = await asyncio.open_connection(service_requetes.HOTE, port)
+    entetes = f"GET {chemin} HTTP/1.1\r\nHost: localhost\r\n" + (f"If-None-Match: {etag}\r\n" if etag else "")
+    writer.write((entetes + "\r\n").encode('latin-1'))
+    await writer.drain()
+    reponse = await reader.read()
+    writer.close()
+    tete, _, corps = reponse.partition(b"\r\n\r\n")
+    lignes = tete.decode('latin-1').split("\r\n")
+    entetes = dict(ligne.split(': ', 1) for ligne in lignes[1:])
+    return int(lignes[0].split()[1]), entetes.get('ETag'), corps
+
+def test_etag_304_aller_retour(dossier):
+    async def scenario():
+        service = service_requetes.ServiceRequetes(str(dossier))
+        await service.actualiser_async()
+        serveur = await asyncio.start_server(lambda r, w: service_requetes.traiter_connexion(service, r, w),
+                                             service_requetes.HOTE, 0)
+        port = serveur.sockets[0].getsockname()[1]
+        async with serveur:
+            statut, etag, corps = await _get(port, "/remplacements?limit=2")
+            assert statut == 200 and etag and json.loads(corps)['total'] == 5
+
+            # Même requête avec l'ETag reçu : 304 sans corps
+            assert await _get(port, "/remplacements?limit=2", etag) == (304, etag, b"")
+            # Autres paramètres : autre ETag
+            statut, autre, _ = await _get(port, "/remplacements?limit=3", etag)
+            assert statut == 200 and autre != etag
+
+            # Nouveau run publié : l'ancien ETag ne correspond plus
+            chemin = dossier / "remplacements_anticipes.csv"
+            chemin.write_text(REMPLACEMENTS_CSV + "6,Bob,TEL-4,2020-03-01,TEL-10,2021-03-01,365,1.0\n",
+                              encoding='utf-8')
+            os.utime(chemin, ns=(os.stat(chemin).st_atime_ns, os.stat(chemin).st_mtime_ns + 10**9))
+            await _get(port, "/sante")
+            while service.rechargement is not None:
+                await asyncio.sleep(0.01)
+            statut, nouveau, corps = await _get(port, "/remplacements?limit=2", etag)
+            assert statut == 200 and nouveau != etag and json.loads(corps)['total'] == 6
+
+    asyncio.run(scenario())
@@ -0,0 +1,129 @@
+import gzip
+import hashlib
+import os
+
+import pandas as pd
+import pytest
+
+import sorties
+
+@pytest.fixture
+def dossier(tmp_path, monkeypatch):
+    monkeypatch.delenv('PIPELINE_COMPRESSION', raising=False)
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+def _df(debut, fin):
+    return pd.DataFrame({'id': range(debut, fin), 'name': [f"TEL-{i}" for i in range(debut, fin)]})
+
+def _fichiers(dossier):
+    return sorted(f.name for f in dossier.iterdir())
+
+def test_remplacement_atomique_en_cas_d_exception(dossier):
+    sorties.ecrire_csv(_df(0, 5), "sortie.csv")
+    contenu, manifeste = (dossier / "sortie.csv").read_bytes(), (dossier / sorties.MANIFESTE).read_bytes()
+
+    # Run interrompu en pleine écriture : la sortie et son entrée du manifeste restent celles du run précédent
+    with pytest.raises(RuntimeError):
+        with sorties.FichierSortie("sortie.csv") as sortie:
+            _df(0, 50_000).to_csv(sortie.fichier, index=False)
+            sortie.lignes = 50_000
+            raise RuntimeError("interruption")
+
+    assert (dossier / "sortie.csv").read_bytes() == contenu
+    assert (dossier / sorties.MANIFESTE).read_bytes() == manifeste
+    assert _fichiers(dossier) == [sorties.MANIFESTE, "sortie.csv"]
+    assert sorties.valider("sortie.csv", verifier_contenu=True) is None
+
+def test_premiere_ecriture_interrompue(dossier):
+    with pytest.raises(RuntimeError):
+        with sorties.FichierSortie("sortie.csv") as sortie:
+            sortie.fichier.write("id\n1\n")
+            raise RuntimeError("interruption")
+
+    assert _fichiers(dossier) == []
+    assert sorties.valider("sortie.csv") == "introuvable"
+
+def test_valider(dossier):
+    chemin = dossier / "sortie.csv"
+    entree = sorties.ecrire_csv(_df(0, 5), "sortie.csv")
+    assert (entree['lignes'], entree['octets']) == (5, chemin.stat().st_size)
+    assert entree['sha256'] == hashlib.sha256(chemin.read_bytes()).hexdigest()
+    assert sorties.lignes("sortie.csv") == 5 and sorties.valider("sortie.csv") is None
+
+    # Même taille, date remise à l'identique : seule la vérification du contenu détecte la modification
+    stat = chemin.stat()
+    chemin.write_bytes(chemin.read_bytes().replace(b"TEL-3", b"TEL-8"))
+    os.utime(chemin, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert sorties.valider("sortie.csv") is None
+    assert sorties.valider("sortie.csv", verifier_contenu=True) == "contenu modifié (SHA-256 différent)"
+    # Date changée : le SHA-256 est recalculé d'office
+    os.utime(chemin, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10**9))
+    assert sorties.valider("sortie.csv") == "contenu modifié (SHA-256 différent)"
+
+    with open(chemin, 'ab') as f:
+        f.write(b"5,TEL-5\n")
+    assert sorties.valider("sortie.csv") == f"taille {entree['octets'] + 8} octets au lieu de {entree['octets']}"
+    chemin.unlink()
+    assert sorties.valider("sortie.csv") == "introuvable"
+
+    (dossier / "hors_manifeste.csv").write_text("id\n1\n", encoding='utf-8')
+    assert sorties.valider("hors_manifeste.csv") == "absent du manifeste"
+
+@pytest.mark.parametrize('compression', [None, 'gzip'])
+def test_ajouts_chaines(dossier, compression):
+    sorties.ecrire_csv(_df(0, 3), "sortie.csv", compression)
+    sorties.ajouter_csv(_df(3, 5), "sortie.csv", compression)
+    entree = sorties.ajouter_csv(_df(5, 9), "sortie.csv", compression)
+
+    # Une empreinte par segment écrit, chaînées dans le SHA-256 du fichier
+    reel = dossier / entree['fichier']
+    octets = reel.read_bytes()
+    debuts = [0]
+    for taille, _ in entree['segments']:
+        debuts.append(debuts[-1] + taille)
+    assert debuts[-1] == len(octets) == entree['octets']
+    assert [sha256 for _, sha256 in entree['segments']] == [
+        hashlib.sha256(octets[debut:fin]).hexdigest() for debut, fin in zip(debuts, debuts[1:])]
+    assert entree['sha256'] == sorties._chainer(entree['segments']) == sorties.empreinte("sortie.csv")
+    assert entree['lignes'] == 9 and sorties.valider("sortie.csv", verifier_contenu=True) is None
+
+    # Contenu identique à une écriture en une fois (membres gzip concaténés pour une sortie compressée)
+    with sorties.ouvrir("sortie.csv") as f:
+        assert f.read() == _df(0, 9).to_csv(index=False)
+    if compression:
+        assert gzip.decompress(octets) == _df(0, 9).to_csv(index=False).encode('utf-8')
+
+    # Un octet modifié dans un segment suffit à invalider la chaîne
+    reel.write_bytes(octets[:debuts[1] + 2] + bytes([octets[debuts[1] + 2] ^ 1]) + octets[debuts[1] + 3:])
+    assert sorties.valider("sortie.csv", verifier_contenu=True) == "contenu modifié (SHA-256 différent)"
+
+def test_ajout_interrompu_ramene_le_fichier(dossier, monkeypatch):
+    sorties.ecrire_csv(_df(0, 3), "sortie.csv")
+    sorties.ajouter_csv(_df(3, 5), "sortie.csv")
+    contenu, manifeste = (dossier / "sortie.csv").read_bytes(), (dossier / sorties.MANIFESTE).read_bytes()
+
+    def fsync_en_echec(fd):
+        raise OSError("disque plein")
+
+    # Octets déjà ajoutés au fichier quand l'erreur survient
+    with monkeypatch.context() as patch:
+        patch.setattr(sorties.os, 'fsync', fsync_en_echec)
+        with pytest.raises(OSError):
+            sorties.ajouter_csv(_df(5, 9), "sortie.csv")
+
+    assert (dossier / "sortie.csv").read_bytes() == contenu
+    assert (dossier / sorties.MANIFESTE).read_bytes() == manifeste
+    assert sorties.valider("sortie.csv", verifier_contenu=True) is None
+
+def test_ajout_sur_sortie_invalide_reecrit_le_fichier(dossier):
+    sorties.ecrire_csv(_df(0, 3), "sortie.csv")
+    with open(dossier / "sortie.csv", 'ab') as f:
+        f.write(b"3,TEL-3\n")
+
+    # Taille différente du manifeste : pas d'ajout sur place, réécriture complète via FichierSortie
+    entree = sorties.ajouter_csv(_df(4, 6), "sortie.csv")
+
+    assert 'segments' not in entree and entree['lignes'] == 6
+    assert (dossier / "sortie.csv").read_text(encoding='utf-8') == _df(0, 6).to_csv(index=False)
+    assert sorties.valider("sortie.csv", verifier_contenu=True) is None
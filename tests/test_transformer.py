@@ -0,0 +1,169 @@
+import asyncio
+import sqlite3
+
+import pandas as pd
+import pytest
+from sqlalchemy.exc import OperationalError, ProgrammingError
+
+import stockage
+import transformer
+
+@pytest.fixture
+def base(tmp_path, monkeypatch):
+    """Base SQLite de substitution : tables du pipeline, colonne hors projection et table sans projection."""
+    monkeypatch.delenv('PIPELINE_FORMAT', raising=False)
+    monkeypatch.delenv('PIPELINE_COMPRESSION', raising=False)
+    monkeypatch.setitem(transformer.export_config, 'backoff', 0)
+    chemin = tmp_path / "locale.db"
+    with sqlite3.connect(chemin) as conn:
+        conn.executescript("""
+            CREATE TABLE telephones (id INTEGER PRIMARY KEY, name TEXT, photo BLOB, serial TEXT, date_mod TEXT,
+                                     date_creation TEXT, contact TEXT, comment TEXT, users_id INTEGER,
+                                     states_id INTEGER, phonemodels_id INTEGER, manufacturers_id INTEGER);
+            CREATE TABLE utilisateurs (utilisateur_id INTEGER PRIMARY KEY, nom_utilisateur TEXT, mot_de_passe TEXT);
+            CREATE TABLE modeles_telephones (modele_id INTEGER PRIMARY KEY, nom_modele TEXT, date_modification TEXT);
+            CREATE TABLE fabricants (id INTEGER PRIMARY KEY, nom_fabricant TEXT);
+            INSERT INTO telephones VALUES
+                (1, 'TEL-1', x'00ff', 'S1', '2023-01-01 00:00:00', NULL, NULL, 'note', 5, 2, 10, 1),
+                (2, 'TEL-2', x'01', 'S2', NULL, '12/03/2019', 'appel', NULL, 0, 2, NULL, 2),
+                (3, 'TEL-3', NULL, 'S3', '2024-02-03 00:00:00', NULL, NULL, NULL, 6, 1, 11, NULL);
+            INSERT INTO utilisateurs VALUES (5, 'Alice', 'secret'), (6, 'Bob', 'secret');
+            INSERT INTO modeles_telephones VALUES (10, 'Modèle 10', '2015-05-05 00:00:00'), (11, 'Modèle 11', NULL);
+            INSERT INTO fabricants VALUES (1, 'Samsung'), (2, 'Apple');
+        """)
+    engine = transformer.get_db(f"sqlite:///{chemin}")
+    yield engine
+    engine.dispose()
+
+def _lire(dossier, table):
+    return (dossier / f"{table}.csv").read_bytes()
+
+def test_projection_couvre_le_pipeline():
+    for table, schema in stockage.SCHEMAS.items():
+        assert set(schema) <= set(transformer.export_columns[table])
+    for colonnes in stockage.COLONNES_ETAPES.values():
+        assert set(colonnes) <= set(transformer.export_columns['telephones'])
+
+def test_export_asynchrone_identique_aux_threads(base, tmp_path):
+    threads, asynchrone = tmp_path / "threads", tmp_path / "async"
+    transformer.export_mysql_to_csv(base, output_dir=str(threads))
+    transformer.export_mysql_to_csv(base, output_dir=str(asynchrone), asynchrone=True)
+
+    for table in ['telephones', 'utilisateurs', 'modeles_telephones', 'fabricants']:
+        assert _lire(asynchrone, table) == _lire(threads, table)
+
+def test_projection_des_colonnes(base, tmp_path):
+    transformer.export_mysql_to_csv(base, output_dir=str(tmp_path), asynchrone=True)
+
+    # Colonnes déclarées présentes dans la table, dans l'ordre de la table ; colonne absente ignorée
+    telephones = pd.read_csv(tmp_path / "telephones.csv")
+    assert list(telephones.columns) == ['id', 'name', 'serial', 'date_mod', 'date_creation', 'contact',
+                                        'comment', 'users_id', 'states_id', 'phonemodels_id',
+                                        'manufacturers_id']
+    assert list(pd.read_csv(tmp_path / "utilisateurs.csv").columns) == ['utilisateur_id', 'nom_utilisateur']
+    # Table sans projection : exportée en entier
+    assert list(pd.read_csv(tmp_path / "fabricants.csv").columns) == ['id', 'nom_fabricant']
+
+def test_entiers_identiques_dans_tous_les_blocs(base, tmp_path):
+    # Blocs de 2 lignes : phonemodels_id n'est NULL que dans le premier, manufacturers_id que dans le second
+    rapport = transformer.export_table_to_csv(base, 'telephones', str(tmp_path), chunksize=2)
+
+    assert rapport['erreur'] is None
+    lignes = (tmp_path / "telephones.csv").read_text(encoding='utf-8').splitlines()
+    assert [ligne.split(',')[-2:] for ligne in lignes[1:]] == [['10', '1'], ['', '2'], ['11', '']]
+    assert '.0' not in ''.join(lignes)
+
+def test_nouvelle_tentative_apres_erreur_transitoire(base, tmp_path, monkeypatch):
+    ecrire = transformer._write_table
+    appels = []
+
+    def ecrire_instable(engine, table_name, output_dir, chunksize):
+        appels.append(table_name)
+        if table_name == 'telephones' and appels.count(table_name) == 1:
+            raise OperationalError("SELECT", {}, Exception("connexion perdue"))
+        if table_name == 'fabricants':
+            raise ProgrammingError("SELECT", {}, Exception("table verrouillée"))
+        return ecrire(engine, table_name, output_dir, chunksize)
+
+    monkeypatch.setattr(transformer, '_write_table', ecrire_instable)
+    tables = ['telephones', 'fabricants', 'utilisateurs']
+    rapports = asyncio.run(transformer.export_tables_async(base, tables, str(tmp_path), max_workers=2))
+
+    telephones, fabricants, utilisateurs = rapports
+    assert (telephones['tentatives'], telephones['erreur'], telephones['lignes']) == (2, None, 3)
+    assert len(pd.read_csv(tmp_path / "telephones.csv")) == 3
+    # Erreur non transitoire : seule sa table échoue, sans nouvelle tentative
+    assert fabricants['tentatives'] == 1 and fabricants['erreur'] is not None
+    assert utilisateurs['erreur'] is None
+    assert appels.count('telephones') == 2 and appels.count('fabricants') == 1
+
+def _executer(engine, *requetes):
+    with engine.begin() as conn:
+        for requete in requetes:
+            conn.exec_driver_sql(requete)
+
+def _trier(contenu):
+    lignes = contenu.decode('utf-8').splitlines()
+    return [lignes[0]] + sorted(lignes[1:], key=lambda ligne: int(ligne.split(',')[0]))
+
+def test_incremental_ajoute_les_lignes_nouvelles(base, tmp_path):
+    exports = tmp_path / "exports"
+    transformer.export_mysql_to_csv(base, output_dir=str(exports), incremental=True)
+    _executer(base, "INSERT INTO telephones VALUES (4, 'TEL-4', NULL, 'S4', '2025-01-01 00:00:00', "
+                    "NULL, NULL, NULL, 7, 2, 10, 1)")
+    transformer.export_mysql_to_csv(base, output_dir=str(exports), incremental=True)
+
+    complet = tmp_path / "complet"
+    transformer.export_mysql_to_csv(base, output_dir=str(complet))
+    assert _lire(exports, 'telephones') == _lire(complet, 'telephones')
+    # Ajout en place : le manifeste garde l'empreinte de chaque segment écrit
+    assert len(transformer.sorties.entree(str(exports / "telephones.csv"))['segments']) == 2
+    assert transformer.sorties.valider(str(exports / "telephones.csv"), verifier_contenu=True) is None
+    modifies = pd.read_csv(exports / transformer.modified_users_file)
+    assert modifies.to_dict('list') == {'users_id': [7], 'lignes_modifiees': [0]}
+
+def test_incremental_retire_les_lignes_supprimees(base, tmp_path):
+    exports = tmp_path / "exports"
+    transformer.export_mysql_to_csv(base, output_dir=str(exports), incremental=True)
+    _executer(base, "DELETE FROM telephones WHERE id = 2",
+              "UPDATE telephones SET date_mod = '2025-03-03 00:00:00', users_id = 5 WHERE id = 3",
+              "DELETE FROM fabricants WHERE id = 1")
+    transformer.export_mysql_to_csv(base, output_dir=str(exports), incremental=True)
+
+    complet = tmp_path / "complet"
+    transformer.export_mysql_to_csv(base, output_dir=str(complet))
+    assert _trier(_lire(exports, 'telephones')) == _trier(_lire(complet, 'telephones'))
+    assert _lire(exports, 'fabricants') == _lire(complet, 'fabricants')
+    # Ligne supprimée (utilisateur 0) et ligne déplacée (utilisateur 6 → 5) : historiques à recalculer
+    modifies = pd.read_csv(exports / transformer.modified_users_file)
+    assert modifies.to_dict('list') == {'users_id': [0, 5, 6], 'lignes_modifiees': [1, 1, 1]}
+
+def test_incremental_signale_les_utilisateurs_des_tables_de_reference(base, tmp_path):
+    exports = tmp_path / "exports"
+    transformer.export_mysql_to_csv(base, output_dir=str(exports), incremental=True)
+    # Aucun téléphone modifié : utilisateur ajouté, utilisateur renommé, date d'un modèle changée
+    _executer(base, "INSERT INTO utilisateurs VALUES (9, 'Inès', 'secret')",
+              "UPDATE utilisateurs SET nom_utilisateur = 'Robert' WHERE utilisateur_id = 6",
+              "UPDATE modeles_telephones SET date_modification = '2016-01-01 00:00:00' WHERE modele_id = 10")
+    transformer.export_mysql_to_csv(base, output_dir=str(exports), incremental=True)
+
+    modifies = pd.read_csv(exports / transformer.modified_users_file)
+    assert modifies.to_dict('list') == {'users_id': [5, 6, 9], 'lignes_modifiees': [1, 1, 1]}
+
+def test_incremental_sans_changement(base, tmp_path):
+    exports = tmp_path / "exports"
+    transformer.export_mysql_to_csv(base, output_dir=str(exports), incremental=True)
+    transformer.export_mysql_to_csv(base, output_dir=str(exports), incremental=True)
+
+    assert pd.read_csv(exports / transformer.modified_users_file).empty
+
+def test_watermarks_jamais_tronques(tmp_path):
+    transformer.save_watermarks(str(tmp_path), {'telephones': {'date_mod': '2024-01-01 00:00:00', 'id': 3}})
+    avant = (tmp_path / transformer.watermarks_file).read_bytes()
+
+    # Valeur non sérialisable : l'écriture échoue en cours de route
+    with pytest.raises(TypeError):
+        transformer.save_watermarks(str(tmp_path), {'telephones': {'date_mod': object(), 'id': 4}})
+
+    assert (tmp_path / transformer.watermarks_file).read_bytes() == avant
+    assert [f.name for f in tmp_path.iterdir()] == [transformer.watermarks_file]
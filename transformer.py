@@ -1,75 +1,499 @@
-import pandas as pd
-from sqlalchemy import create_engine
-import os
-from urllib.parse import quote_plus
-
-connection = {
-    'host': 'localhost',
-    'port': 3306,
-    'user': 'root',
-    'password': 'Khadija@2005',
-    'database': 'telephones_db'
-}
-
-output = "exports"
-
-def get_db():
-    password = quote_plus(connection['password'])
-    connection_string = f"mysql+mysqlconnector://{connection['user']}:{password}@{connection['host']}:{connection['port']}/{connection['database']}"
-    engine = create_engine(connection_string)
-    return engine
-
-def get_tables(engine):
-    query = "SHOW TABLES"
-    df = pd.read_sql(query, engine)
-    return df.iloc[:, 0].tolist()
-
-def export_table_to_csv(engine, table_name, output_dir):
-    try:
-        df = pd.read_sql(f"SELECT * FROM {table_name}", engine)
-        os.makedirs(output_dir, exist_ok=True)
-        df.to_csv(f"{output_dir}/{table_name}.csv", index=False, encoding='utf-8')
-        print(f"Exporté : {table_name}.csv")
-        return f"{table_name}.csv"
-    except Exception as e:
-        error_msg = f"Erreur lors de l'exportation de {table_name} : {str(e)}"
-        print(error_msg)
-        return error_msg
-
-def export_mysql_to_csv():
-    """Fonction principale pour exporter toutes les tables MySQL en CSV"""
-    try:
-        print("[INFO] Démarrage de l'exportation MySQL vers CSV...")
-        
-        engine = get_db()
-        print("Moteur de connexion créé")
-        
-        tables = get_tables(engine)
-        print("Connexion testée avec succès")
-        print(f"Tables trouvées : {tables}")
-        
-        exported_files = []
-        for table in tables:
-            result = export_table_to_csv(engine, table, output)
-            if result.endswith('.csv'):
-                exported_files.append(result)
-        
-        engine.dispose()
-        
-        summary = f"""
-Exportation terminée avec succès !
-Tables exportées : {len(exported_files)}
-Fichiers créés : {', '.join(exported_files)}
-Dossier de sortie : {output}/
-"""
-        print(summary)
-        return summary
-        
-    except Exception as e:
-        error_msg = f"Erreur générale : {str(e)}"
-        print(error_msg)
-        return error_msg
-
-if __name__ == "__main__":
-    result = export_mysql_to_csv()
-    print(f"Résultat final : {result}")
\ No newline at end of file
+import pandas as pd
+from sqlalchemy import Integer, create_engine, inspect, text
+from sqlalchemy.exc import DBAPIError, InterfaceError, OperationalError, TimeoutError as PoolTimeoutError
+import asyncio
+import contextvars
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote_plus
+import metriques
+import stockage
+import index_references
+import sorties
+
+connection = {
+    'host': 'localhost',
+    'port': 3306,
+    'user': 'root',
+    'password': 'Khadija@2005',
+    'database': 'telephones_db'
+}
+
+# Paramètres de l'exportation parallèle
+export_config = {
+    'max_workers': 4,      # Nombre de tables exportées en parallèle
+    'chunksize': 50000,    # Lignes lues (curseur côté serveur) puis écrites par bloc
+    'date_column': 'date_mod',  # Colonne de date servant de watermark en mode incrémental
+    'key_column': 'id',         # Clé primaire servant de watermark et de clé de fusion
+    'pool_timeout': 30,    # Attente maximale d'une connexion libre du pool (s)
+    'pool_recycle': 1800,  # Connexions renouvelées avant le wait_timeout de MySQL (s)
+    'retries': 3,          # Nouvelles tentatives par table après une erreur transitoire
+    'backoff': 0.5,        # Délai avant la première nouvelle tentative (s), doublé ensuite
+}
+
+# Colonnes exportées par table (projection au lieu de SELECT *) : celles lues par le pipeline
+# (stockage.SCHEMAS) et celles des livrables Power BI (rapport bi du stage.pbix : type, fabricant
+# et localisation des téléphones de cleaned_telephones_filtered.csv). Une colonne à ajouter aux
+# livrables doit être déclarée ici. Les tables absentes de ce dictionnaire (ou associées à None)
+# sont exportées en entier.
+export_columns = {
+    'telephones': ['id', 'name', 'serial', 'date_mod', 'date_creation', 'contact', 'comment', 'users_id',
+                   'states_id', 'phonemodels_id', 'phonetypes_id', 'manufacturers_id', 'locations_id'],
+    'utilisateurs': ['utilisateur_id', 'nom_utilisateur'],
+    'modeles_telephones': ['modele_id', 'nom_modele', 'date_modification'],
+}
+
+# Erreurs pour lesquelles la table est réexportée (connexion perdue, pool saturé, verrou)
+ERREURS_TRANSITOIRES = (OperationalError, InterfaceError, PoolTimeoutError)
+
+output = "exports"
+watermarks_file = ".watermarks.json"
+modified_users_file = "utilisateurs_modifies.csv"
+
+def get_db(connection_string=None):
+    """
+    Crée le moteur SQLAlchemy partagé par tous les threads d'export.
+    Le pool est dimensionné sur max_workers. connection_string permet de
+    cibler une autre base (ex. SQLite locale pour les tests).
+    """
+    if connection_string is None:
+        password = quote_plus(connection['password'])
+        connection_string = f"mysql+mysqlconnector://{connection['user']}:{password}@{connection['host']}:{connection['port']}/{connection['database']}"
+    if connection_string.startswith('sqlite'):
+        return create_engine(connection_string)
+    engine = create_engine(
+        connection_string,
+        pool_size=export_config['max_workers'],
+        max_overflow=0,
+        pool_pre_ping=True,
+        pool_timeout=export_config['pool_timeout'],
+        pool_recycle=export_config['pool_recycle']
+    )
+    return engine
+
+def get_tables(engine):
+    if engine.dialect.name != 'mysql':
+        return inspect(engine).get_table_names()
+    query = "SHOW TABLES"
+    df = pd.read_sql(query, engine)
+    return df.iloc[:, 0].tolist()
+
+def select_columns(engine, table_name):
+    """
+    Liste SQL des colonnes à lire pour table_name : celles de export_columns présentes
+    dans la table, dans l'ordre de la table ('*' si la table n'a pas de projection).
+    """
+    wanted = export_columns.get(table_name)
+    if wanted is None:
+        return '*'
+    columns = [c['name'] for c in inspect(engine).get_columns(table_name)]
+    missing = [c for c in wanted if c not in columns]
+    if missing:
+        print(f"[INFO] Colonnes absentes de {table_name}, non exportées : {missing}")
+    selected = [c for c in columns if c in wanted]
+    if not selected:
+        return '*'
+    quote = engine.dialect.identifier_preparer.quote
+    return ', '.join(quote(c) for c in selected)
+
+def declared_dtypes(engine, table_name):
+    """
+    dtypes des colonnes exportées de table_name déclarées entières dans la base : Int64,
+    appliqué à chaque bloc lu (sans cela, un bloc contenant un NULL passe la colonne en
+    float et l'écrit 5.0 alors que les autres blocs écrivent 5).
+    """
+    wanted = export_columns.get(table_name)
+    return {c['name']: 'Int64' for c in inspect(engine).get_columns(table_name)
+            if isinstance(c['type'], Integer) and (wanted is None or c['name'] in wanted)}
+
+def retry_delay(table_name, error, attempt):
+    """
+    Délai avant une nouvelle tentative après error (backoff exponentiel), ou None si
+    l'erreur n'est pas transitoire ou si les tentatives sont épuisées.
+    """
+    transient = isinstance(error, ERREURS_TRANSITOIRES) or (
+        isinstance(error, DBAPIError) and error.connection_invalidated)
+    if not transient or attempt >= export_config['retries']:
+        return None
+    delay = export_config['backoff'] * 2 ** attempt
+    print(f"[ALERTE] Erreur transitoire sur {table_name} ({type(error).__name__}) — "
+          f"tentative {attempt + 2}/{export_config['retries'] + 1} dans {delay:.1f} s")
+    return delay
+
+def _avec_tentatives(table_name, lecture):
+    """
+    Exécute lecture() en la relançant après une erreur transitoire (export_config['retries']
+    fois, backoff exponentiel, voir retry_delay) ; l'erreur définitive est relancée.
+    Boucle de relance commune aux exports complets (synchrones ou asynchrones) et incrémentaux.
+    """
+    attempt = 0
+    while True:
+        try:
+            return lecture()
+        except Exception as e:
+            delay = retry_delay(table_name, e, attempt)
+            if delay is None:
+                raise
+            time.sleep(delay)
+            attempt += 1
+
+def _write_table(engine, table_name, output_dir, chunksize):
+    """
+    Une tentative d'export de table_name. Le CSV (et sa copie typée) ne remplacent les
+    fichiers précédents qu'une fois la table entièrement lue. Retourne le nombre de lignes.
+    """
+    fmt = stockage.format_intermediaire()
+    ecrivain = None
+    os.makedirs(output_dir, exist_ok=True)
+    if fmt != 'csv':
+        # Copie typée pour les étapes suivantes, écrite au fil des mêmes blocs
+        ecrivain = stockage.EcrivainBlocs(
+            stockage.chemin_intermediaire(f"{output_dir}/{table_name}.csv", fmt), fmt)
+    try:
+        query = f"SELECT {select_columns(engine, table_name)} FROM {table_name}"
+        dtypes = declared_dtypes(engine, table_name)
+        with engine.connect() as conn, sorties.FichierSortie(f"{output_dir}/{table_name}.csv") as sortie:
+            conn = conn.execution_options(stream_results=True)
+            chunks = pd.read_sql(text(query), conn, chunksize=chunksize, dtype=dtypes)
+            for i, chunk in enumerate(chunks):
+                chunk.to_csv(sortie.fichier, index=False, header=(i == 0))
+                if ecrivain is not None:
+                    ecrivain.write(chunk)
+                sortie.lignes += len(chunk)
+                sortie.decrire(chunk)
+    except Exception:
+        if ecrivain is not None:
+            ecrivain.abandonner()
+        raise
+    if ecrivain is not None:
+        ecrivain.close()
+    return sortie.lignes
+
+def _export_report(table_name, start, lignes, attempts, error=None):
+    report = {'table': table_name, 'fichier': f"{table_name}.csv", 'lignes': lignes,
+              'duree': time.perf_counter() - start, 'tentatives': attempts, 'erreur': None}
+    if error is not None:
+        report['erreur'] = f"Erreur lors de l'exportation de {table_name} : {str(error)}"
+        print(report['erreur'])
+    else:
+        print(f"Exporté : {table_name}.csv ({lignes} lignes, {report['duree']:.2f} s)")
+    return report
+
+def export_table_to_csv(engine, table_name, output_dir, chunksize=None):
+    """
+    Exporte une table en CSV en streaming : les lignes sont lues par blocs
+    via un curseur côté serveur (stream_results) et écrites au fur et à mesure.
+    Seules les colonnes de export_columns sont lues. Après une erreur transitoire,
+    la table est réexportée (voir _avec_tentatives).
+    Retourne un rapport {table, fichier, lignes, duree, tentatives, erreur}.
+    """
+    chunksize = chunksize or export_config['chunksize']
+    start = time.perf_counter()
+    tentatives = 0
+
+    def ecrire():
+        nonlocal tentatives
+        tentatives += 1
+        return _write_table(engine, table_name, output_dir, chunksize)
+
+    try:
+        lignes = _avec_tentatives(table_name, ecrire)
+    except Exception as e:
+        return _export_report(table_name, start, 0, tentatives, e)
+    return _export_report(table_name, start, lignes, tentatives)
+
+async def export_table_async(engine, table_name, output_dir, chunksize=None):
+    """
+    Version coroutine de export_table_to_csv, pour export_tables_async. Le pilote MySQL
+    est synchrone : l'export (tentatives et attentes comprises) tourne dans un thread
+    (asyncio.to_thread). La concurrence vient donc des threads, pas d'entrées/sorties
+    asynchrones ; asyncio ne fait que les orchestrer.
+    """
+    return await asyncio.to_thread(export_table_to_csv, engine, table_name, output_dir, chunksize)
+
+async def export_tables_async(engine, tables, output_dir, max_workers, export=None):
+    """
+    Exporte les tables de façon concurrente : chaque export occupe un thread (voir
+    export_table_async) et le sémaphore en limite le nombre à max_workers, la taille du
+    pool de connexions (pool_size de get_db). export(table) est la coroutine d'export
+    d'une table (défaut : export_table_async). Retourne les rapports dans l'ordre de tables.
+    """
+    if export is None:
+        async def export(table):
+            return await export_table_async(engine, table, output_dir)
+    semaphore = asyncio.Semaphore(max_workers)
+
+    async def run(table):
+        async with semaphore:
+            with metriques.mesurer(f"export/{table}") as mesure:
+                report = await export(table)
+                mesure['lignes_sortie'] = report['lignes']
+            return report
+
+    # Chaque table dans un contexte vide : ses mesures ne s'imbriquent pas dans celles des autres
+    tasks = [asyncio.get_running_loop().create_task(run(table), context=contextvars.Context()) for table in tables]
+    return list(await asyncio.gather(*tasks))
+
+# Export incrémental
+
+def load_watermarks(output_dir):
+    """Charge les watermarks {table: {date_mod, id}} du dernier export (vide si absent)."""
+    try:
+        with open(f"{output_dir}/{watermarks_file}", 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def save_watermarks(output_dir, watermarks):
+    """Écrit les watermarks dans un fichier temporaire puis le renomme : jamais de fichier tronqué."""
+    fd, tmp = tempfile.mkstemp(dir=output_dir, prefix=f"{watermarks_file}.", suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(watermarks, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp)
+        raise
+    os.replace(tmp, f"{output_dir}/{watermarks_file}")
+
+def read_watermark(engine, table_name):
+    """
+    Retourne le watermark courant d'une table ({date_mod, id}), ou None si la table
+    n'a pas les colonnes date_column et key_column (elle est alors exportée en entier).
+    """
+    date_col, key_col = export_config['date_column'], export_config['key_column']
+    columns = {c['name'] for c in inspect(engine).get_columns(table_name)}
+    if date_col not in columns or key_col not in columns:
+        return None
+    with engine.connect() as conn:
+        max_date, max_key = conn.execute(
+            text(f"SELECT MAX({date_col}), MAX({key_col}) FROM {table_name}")).one()
+    return {date_col: None if max_date is None else str(max_date),
+            key_col: None if max_key is None else int(max_key)}
+
+def _compter_lignes(engine, table_name):
+    with engine.connect() as conn:
+        return conn.execute(text(f"SELECT COUNT(*) FROM {table_name}")).scalar_one()
+
+def _en_texte(df):
+    """Repasse df par le texte CSV : valeurs formatées comme dans l'export, sans reformater l'existant."""
+    buffer = io.StringIO()
+    df.to_csv(buffer, index=False)
+    buffer.seek(0)
+    return pd.read_csv(buffer, dtype=str, keep_default_na=False)
+
+def export_table_incremental(engine, table_name, output_dir, watermark):
+    """
+    Exporte uniquement les lignes modifiées (date_mod > watermark) ou nouvelles
+    (id > watermark) depuis le dernier export :
+    - s'il n'y a que des lignes nouvelles et que le nombre de lignes de la table est celui de
+      l'export plus ces lignes, elles sont ajoutées en fin de CSV sans le relire (sorties.ajouter_csv) ;
+    - sinon (lignes existantes modifiées, ou nombre de lignes différent : lignes supprimées
+      dans la source), le CSV est relu, les lignes modifiées remplacées par id, les lignes dont
+      l'id n'est plus dans la source retirées, puis le CSV est réécrit.
+    Sans watermark ou sans CSV existant, la table est exportée en entier.
+    Le rapport contient le nouveau watermark, le nombre de lignes supprimées et, pour le CSV mis
+    à jour, les users_id touchés (users_modifies) dont ceux ayant une ligne existante modifiée,
+    déplacée ou supprimée (users_lignes_modifiees).
+    """
+    path = f"{output_dir}/{table_name}.csv"
+    start = time.perf_counter()
+    try:
+        new_watermark = read_watermark(engine, table_name)
+    except Exception as e:
+        new_watermark = None
+        print(f"[ALERTE] Watermark indisponible pour {table_name} : {e}")
+    if new_watermark is None or not watermark or not sorties.existe(path):
+        report = export_table_to_csv(engine, table_name, output_dir)
+        report['watermark'] = new_watermark
+        report['supprimees'] = 0
+        report['users_modifies'] = None
+        report['users_lignes_modifiees'] = None
+        return report
+
+    date_col, key_col = export_config['date_column'], export_config['key_column']
+    report = {'table': table_name, 'fichier': f"{table_name}.csv", 'lignes': 0, 'supprimees': 0, 'duree': 0.0,
+              'erreur': None, 'watermark': new_watermark, 'users_modifies': set(), 'users_lignes_modifiees': set()}
+    try:
+        query = (f"SELECT {select_columns(engine, table_name)} FROM {table_name} "
+                 f"WHERE {date_col} > :date_wm OR {key_col} > :key_wm")
+        params = {'date_wm': watermark.get(date_col) or '', 'key_wm': watermark.get(key_col) or 0}
+        dtypes = declared_dtypes(engine, table_name)
+        delta = _en_texte(_avec_tentatives(table_name, lambda: pd.read_sql(text(query), engine, params=params,
+                                                                             dtype=dtypes)))
+        nb_source = _avec_tentatives(table_name, lambda: _compter_lignes(engine, table_name))
+        report['lignes'] = len(delta)
+        nouvelles = pd.to_numeric(delta[key_col], errors='coerce') > params['key_wm']
+        nb_exportees = sorties.lignes(path)
+        complet = nb_exportees is not None and nb_source == nb_exportees + int(nouvelles.sum())
+        fmt = stockage.format_intermediaire()
+        copie_typee = fmt != 'csv' and os.path.exists(stockage.chemin_intermediaire(path, fmt))
+
+        if complet and nouvelles.all():
+            # Lignes nouvelles uniquement : ajoutées à l'export, qui n'est ni relu ni réécrit
+            if len(delta):
+                if 'users_id' in delta.columns:
+                    report['users_modifies'] = set(delta['users_id'])
+                sorties.ajouter_csv(delta, path)
+                if copie_typee:
+                    stockage.ecrire_table(pd.concat([stockage.lire_table(path, fmt), delta.replace('', None)],
+                                                    ignore_index=True), path, fmt)
+        else:
+            existing = pd.read_csv(sorties.resoudre(path), dtype=str, keep_default_na=False, encoding='utf-8')
+            replaced = existing[key_col].isin(delta[key_col])
+            supprimees = pd.Series(False, index=existing.index)
+            if not complet:
+                # Lignes supprimées dans la source : ids de l'export absents de la table
+                ids_source = _avec_tentatives(table_name, lambda: _en_texte(
+                    pd.read_sql(text(f"SELECT {key_col} FROM {table_name}"), engine))[key_col])
+                supprimees = ~existing[key_col].isin(ids_source) & ~replaced
+            report['supprimees'] = int(supprimees.sum())
+            if 'users_id' in existing.columns:
+                touches = set(existing.loc[replaced | supprimees, 'users_id'])
+                # Lignes déjà exportées puis modifiées ou supprimées : ni simple ajout, ni historique inchangé
+                report['users_modifies'] = set(delta['users_id']) | touches
+                report['users_lignes_modifiees'] = touches | set(
+                    delta.loc[delta[key_col].isin(existing[key_col]), 'users_id'])
+            merged = pd.concat([existing[~replaced & ~supprimees], delta], ignore_index=True)
+            sorties.ecrire_csv(merged, path)
+            if fmt != 'csv':
+                stockage.ecrire_table(merged.replace('', None), path, fmt)
+        report['duree'] = time.perf_counter() - start
+        print(f"Exporté (incrémental) : {table_name}.csv ({report['lignes']} lignes modifiées, "
+              f"{report['supprimees']} supprimées, {report['duree']:.2f} s)")
+    except Exception as e:
+        report['duree'] = time.perf_counter() - start
+        report['erreur'] = f"Erreur lors de l'exportation incrémentale de {table_name} : {str(e)}"
+        report['watermark'] = watermark
+        print(report['erreur'])
+    return report
+
+def users_references_modifiees(output_dir, avant, apres):
+    """
+    users_id dont l'historique dépend d'une ligne des tables de référence modifiée entre deux
+    index (voir index_references.cles_modifiees) : utilisateurs ajoutés, retirés ou renommés
+    (filtrage, noms des sorties) et utilisateurs des téléphones d'un modèle dont la
+    date_modification a changé (dates complétées au nettoyage).
+    """
+    users = {str(u) for u in index_references.cles_modifiees(avant['utilisateurs'], apres['utilisateurs'])}
+    modeles = index_references.cles_modifiees(avant['modeles'], apres['modeles'])
+    path = f"{output_dir}/telephones.csv"
+    if len(modeles) and sorties.existe(path):
+        telephones = pd.read_csv(sorties.resoudre(path), usecols=lambda col: col in ('users_id', 'phonemodels_id'),
+                                 dtype=str, keep_default_na=False, encoding='utf-8')
+        if 'phonemodels_id' in telephones.columns:
+            concernes = index_references.numeriser(telephones['phonemodels_id'].replace('', None)).isin(modeles)
+            users |= set(telephones.loc[concernes.to_numpy(), 'users_id']) - {''}
+    return users
+
+def export_mysql_to_csv(engine=None, output_dir=output, max_workers=None, incremental=False, asynchrone=False):
+    """
+    Fonction principale pour exporter toutes les tables MySQL en CSV (en parallèle).
+    En mode incremental, seules les lignes modifiées depuis le dernier export sont lues,
+    et les users_id touchés sont écrits dans utilisateurs_modifies.csv, y compris ceux
+    qu'une modification des tables de référence concerne (users_references_modifiees).
+    En mode asynchrone, les tables sont orchestrées par une boucle asyncio (export_tables_async),
+    les lectures restant faites dans des threads.
+    """
+    if max_workers is None:
+        max_workers = export_config['max_workers']
+    owns_engine = engine is None
+    try:
+        print("[INFO] Démarrage de l'exportation MySQL vers CSV...")
+        
+        if owns_engine:
+            engine = get_db()
+        print("Moteur de connexion créé")
+        
+        tables = get_tables(engine)
+        print("Connexion testée avec succès")
+        print(f"Tables trouvées : {tables}")
+        
+        start = time.perf_counter()
+        watermarks = load_watermarks(output_dir) if incremental else {}
+        # Valeurs de référence du dernier export, copiées en mémoire : l'index est réécrit en fin d'export
+        references = ({nom: table if table is None else index_references.Table(table.ids.copy(), table.valeurs.copy())
+                       for nom, table in index_references.charger_index(output_dir).items()}
+                      if incremental and os.path.isdir(output_dir) else None)
+
+        def exporter(table):
+            with metriques.mesurer(f"export/{table}") as mesure:
+                if incremental:
+                    report = export_table_incremental(engine, table, output_dir, watermarks.get(table))
+                else:
+                    report = export_table_to_csv(engine, table, output_dir)
+                mesure['lignes_sortie'] = report['lignes']
+            return report
+
+        if asynchrone:
+            export = None
+            if incremental:
+                async def export(table):
+                    return await asyncio.to_thread(export_table_incremental, engine, table, output_dir,
+                                                   watermarks.get(table))
+            reports = asyncio.run(export_tables_async(engine, tables, output_dir, max_workers, export))
+        else:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                reports = list(executor.map(exporter, tables))
+        total = time.perf_counter() - start
+
+        if owns_engine:
+            engine.dispose()
+
+        # Index de référence (utilisateurs, modèles) reconstruit une fois par export
+        with metriques.mesurer("index_references"):
+            index_references.construire_index(output_dir)
+
+        if incremental:
+            save_watermarks(output_dir, {r['table']: r['watermark'] for r in reports if r['watermark']})
+            telephones = next((r for r in reports if r['table'] == 'telephones'), {})
+            modified = telephones.get('users_modifies')
+            modified_path = f"{output_dir}/{modified_users_file}"
+            if modified is None or references is None:
+                # Export complet : tous les utilisateurs sont à recalculer
+                sorties.supprimer(modified_path)
+            else:
+                # Utilisateurs touchés par les tables de référence : historique entièrement recalculé
+                touches = users_references_modifiees(output_dir, references, index_references.charger_index(output_dir))
+                lignes_modifiees = (telephones.get('users_lignes_modifiees') or set()) | touches
+                users = sorted(modified | touches)
+                sorties.ecrire_csv(pd.DataFrame({'users_id': users,
+                                                 'lignes_modifiees': [int(u in lignes_modifiees) for u in users]}),
+                                   modified_path)
+                print(f"[INFO] {len(users)} utilisateurs touchés par l'export incrémental "
+                      f"(dont {len(touches)} par les tables de référence)")
+        
+        exported_files = [r['fichier'] for r in reports if r['erreur'] is None]
+        details = '\n'.join(f"  - {r['table']} : {r['lignes']} lignes en {r['duree']:.2f} s"
+                            + (f" ({r['tentatives']} tentatives)" if r.get('tentatives', 1) > 1 else "")
+                            + (" (ÉCHEC)" if r['erreur'] else "") for r in reports)
+        summary = f"""
+Exportation terminée avec succès !
+Tables exportées : {len(exported_files)}
+Fichiers créés : {', '.join(exported_files)}
+Dossier de sortie : {output_dir}/
+Durée totale : {total:.2f} s ({max_workers} threads{', orchestrés par asyncio' if asynchrone else ''})
+Détail par table :
+{details}
+"""
+        print(summary)
+        return summary
+        
+    except Exception as e:
+        error_msg = f"Erreur générale : {str(e)}"
+        print(error_msg)
+        return error_msg
+
+if __name__ == "__main__":
+    # --base : autre base que MySQL (ex. sqlite:///locale.db comme base de substitution)
+    engine = get_db(sys.argv[sys.argv.index('--base') + 1]) if '--base' in sys.argv else None
+    result = export_mysql_to_csv(engine, incremental='--incremental' in sys.argv, asynchrone='--async' in sys.argv)
+    if engine is not None:
+        engine.dispose()
+    print(f"Résultat final : {result}")